@@ -1,45 +1,105 @@
 import streamlit as st
-import plotly.graph_objects as go
-import plotly.express as px
-import pandas as pd
-import duckdb
-import time
+import os
 import numpy as np
+from scripts.aggregations import app_kpis, correlation_matrix
+from scripts.chart_cache import ChartPayloads, theme_key
+from scripts.cube import Cube
+from scripts.downsampling import (PREVIEW_ROWS, SCATTER_POINT_BUDGET, VIOLIN_ROW_THRESHOLD, StoreRows,
+                                  profiles_from_counts)
+from scripts.filters import filter_key, from_selectboxes
+from scripts.ingest import Ingester
+from scripts.live import auto_refresh
+from scripts.profiling import Profiler
+from scripts.result_cache import ResultCache
+from scripts.shards import Coordinator
+from scripts.store import DB_PATH, ensure_store
+from scripts.warm import SNAPSHOT_DIR, lazy_module
+
+# Chart libraries are imported on the first chart build; cached chart payloads never need them
+go = lazy_module('plotly.graph_objects')
+px = lazy_module('plotly.express')
 
 # Set page configuration
 st.set_page_config(page_title="Supply Chain Dashboard", page_icon=":bar_chart:", layout="wide")
 
-# Cache data loading
-@st.cache_data
-def load_data(file_path):
-    return pd.read_csv(file_path)
-
-# Load data
-df = load_data("D:\\Supply-Chain-Management-Dashboard\\data\\supply_chain.csv")
+# Time every stage of this rerun; the progress bar follows the stages as they finish
+prof = Profiler(progress=st.progress(0.0, text='Loading dashboard...'),
+                expected=st.session_state.get('profile_stages'))
+
+# Dataset previews, shared by all sessions; keyed on the store version so a re-ingest invalidates it
+@st.cache_resource
+def load_results():
+    return ResultCache(disk_dir=os.environ.get('RESULT_CACHE_DIR'))
+
+# Started by the first session to turn on live refresh; shared by all sessions
+@st.cache_resource
+def load_ingester(db_path):
+    return Ingester(db_path=db_path).start()
+
+# Filter-combination cube, shared by all sessions and refreshed incrementally; starts from the
+# pre-warm snapshot (scripts/warm.py) when there is one for the current store. With SHARDS or
+# SHARD_ADDRESSES set, shard workers (scripts/shards.py) answer the same lookups by scatter-gather
+@st.cache_resource
+def load_cube(db_path):
+    return Coordinator.from_env(db_path) or Cube.from_store(db_path, snapshot_dir=SNAPSHOT_DIR)
+
+# Shard failures (a worker that stays unreachable, or a query a shard rejects) stop the page with an
+# error instead of a traceback; without shards there is nothing to catch
+remote = bool(os.environ.get('SHARD_ADDRESSES'))
+shard_errors = (TimeoutError, ConnectionError, ValueError) if remote or os.environ.get('SHARDS') else ()
+
+def from_shards(compute):
+    try:
+        return compute()
+    except shard_errors as e:
+        st.error(f"Shard query failed: {e}")
+        st.stop()
+
+# DuckDB store, built from the CSV on first run; running shard workers (SHARD_ADDRESSES) hold the
+# data themselves, so this process then has no store
+with prof.stage('store', 'load'):
+    db_path = DB_PATH if remote else ensure_store("data/supply_chain.csv")
+with prof.stage('cube refresh', 'query'):
+    cube = from_shards(lambda: load_cube(db_path))
+    version = from_shards(lambda: cube.refresh(db_path))
+# Raw-row chart inputs come from the shards when there are any, else from the store
+rows = cube if isinstance(cube, Coordinator) else StoreRows(db_path)
 
 # Sidebar for filters
 st.sidebar.header("🔎 Filters", anchor=False)
 st.sidebar.markdown("<p style='color: #ffffff; font-size: 1.1em;'>Refine your insights</p>", unsafe_allow_html=True)
-product_types = ['All'] + list(df['Product type'].unique())
-locations = ['All'] + list(df['Location'].unique())
-transport_modes = ['All'] + list(df['Transportation modes'].unique())
+with prof.stage('filter options', 'query'):
+    product_types = ['All'] + from_shards(lambda: rows.distinct_values('Product type'))
+    locations = ['All'] + from_shards(lambda: rows.distinct_values('Location'))
+    transport_modes = ['All'] + from_shards(lambda: rows.distinct_values('Transportation modes'))
 
 selected_product = st.sidebar.selectbox("Product Type", product_types, index=0, format_func=lambda x: x.title())
 selected_location = st.sidebar.selectbox("Location", locations, index=0, format_func=lambda x: x.title())
 selected_transport = st.sidebar.selectbox("Transport Mode", transport_modes, index=0, format_func=lambda x: x.title())
 
-# Apply filters
-filtered_df = df.copy()
-if selected_product != 'All':
-    filtered_df = filtered_df[filtered_df['Product type'] == selected_product]
-if selected_location != 'All':
-    filtered_df = filtered_df[filtered_df['Location'] == selected_location]
-if selected_transport != 'All':
-    filtered_df = filtered_df[filtered_df['Transportation modes'] == selected_transport]
-
-# Spinner for loading
-with st.spinner('Loading dashboard...'):
-    time.sleep(1)
+# Raw-row charts above the point budget are sampled or binned before they reach the browser
+st.sidebar.subheader("⚙️ Large selections", anchor=False)
+scatter_mode = st.sidebar.radio("Costs vs Revenue above budget", ['Sample', 'Bin'], horizontal=True)
+point_budget = st.sidebar.number_input("Point budget", min_value=500, value=SCATTER_POINT_BUDGET, step=500)
+
+# Live mode: this process's one ingester thread picks up dropped / appended rows; sessions only
+# compare store versions and rerun when it moves. Running shard workers are asked for theirs
+if remote:
+    auto_refresh(version, lambda: from_shards(lambda: cube.refresh(db_path)))
+else:
+    auto_refresh(version, lambda: load_ingester(db_path).version())
+
+# Every KPI and chart aggregation is looked up from the cube. Raw-row charts and the dataset view
+# query the store with the filters in the scan and fetch only samples, bins, counts or a preview
+filters = from_selectboxes({
+    'Product type': selected_product,
+    'Location': selected_location,
+    'Transportation modes': selected_transport,
+})
+with prof.stage('cube lookup', 'groupby'):
+    aggregates = from_shards(lambda: cube.lookup(filters))
+kpis = app_kpis(aggregates)
+row_count = int(kpis['row_count'])  # the totals row comes back as floats
 
 # Modern UI header
 st.markdown(
@@ -53,7 +113,12 @@ st.markdown(
 
 # Show dataset
 with st.expander("📋 View Dataset", expanded=False):
-    st.dataframe(filtered_df, use_container_width=True)
+    with prof.stage('dataset table', 'render'):
+        preview = load_results().get_or_compute(version, filters, f'head:{PREVIEW_ROWS}',
+                                                lambda: from_shards(lambda: rows.head(filters, PREVIEW_ROWS)))
+        if len(preview) < row_count:
+            st.caption(f"First {len(preview):,} of {row_count:,} rows")
+        st.dataframe(preview, use_container_width=True)
 
 # Enhanced Key Insights with new KPIs
 st.markdown(
@@ -102,34 +167,10 @@ st.markdown(
     unsafe_allow_html=True
 )
 
-# Consolidated data query
-query = """
-SELECT 
-    SUM("Revenue generated")::DECIMAL(8, 2) AS total_revenue,
-    SUM("stock levels") AS stock_levels,
-    SUM("Lead times") AS lead_times,
-    SUM("Order quantities") AS total_orders,
-    SUM("Availability") AS total_availability,
-    SUM("Manufacturing costs") AS total_manufacturing_costs,
-    SUM("Number of products sold") AS total_products_sold,
-    SUM("Shipping costs") AS total_shipping_costs,
-    SUM("Manufacturing lead time") AS total_manufacturing_lead_time
-FROM filtered_df
-"""
-result = duckdb.query(query).df()
-total_revenue = result['total_revenue'][0]
-total_stock = result['stock_levels'][0]
-total_lead_times = result['lead_times'][0]
-total_orders = result['total_orders'][0]
-total_availability = result['total_availability'][0]
-total_manufacturing_costs = result['total_manufacturing_costs'][0]
-total_products_sold = result['total_products_sold'][0]
-total_shipping_costs = result['total_shipping_costs'][0]
-total_manufacturing_lead_time = result['total_manufacturing_lead_time'][0]
-
-# Calculate new KPIs
-stock_turnover = total_products_sold / total_stock if total_stock > 0 else 0
-shipping_cost_per_unit = total_shipping_costs / total_products_sold if total_products_sold > 0 else 0
+total_revenue = kpis['total_revenue']
+total_orders = kpis['total_orders']
+total_products_sold = kpis['total_products_sold']
+stock_turnover = kpis['stock_turnover']
 
 # Plot styling configuration
 plot_style = {
@@ -143,219 +184,307 @@ plot_style = {
 # Color palette
 colors = ['#22d3ee', '#facc15', '#f97316', '#ef4444', '#a855f7', '#ec4899', '#10b981']
 
+# Serialized charts, shared by all sessions: a chart whose data and styling are unchanged is sent
+# without rebuilding or re-serializing its figure
+@st.cache_resource
+def load_payloads():
+    return ChartPayloads('app')
+
+payloads = load_payloads()
+theme = theme_key(plot_style, colors)
+
 # Row 1: KPIs (Four Columns)
+def indicator(title, value, number):
+    fig = go.Figure(go.Indicator(mode="number", value=value, title={"text": title}, number=number))
+    fig.update_layout(**plot_style)
+    return fig
+
 row1 = st.columns(4)
 with row1[0]:
-    fig = go.Figure(go.Indicator(
-        mode="number",
-        value=total_revenue,
-        title={"text": "Total Revenue"},
-        number={'prefix': '$', 'valueformat': ',.0f'},
-    ))
-    fig.update_layout(**plot_style)
-    st.plotly_chart(fig, use_container_width=True)
+    prof.chart(payloads, 'Total Revenue', total_revenue, theme,
+               lambda: indicator("Total Revenue", total_revenue, {'prefix': '$', 'valueformat': ',.0f'}))
 
 with row1[1]:
-    fig = go.Figure(go.Indicator(
-        mode="number",
-        value=total_orders,
-        title={"text": "Total Orders"},
-        number={'valueformat': ',.0f'},
-    ))
-    fig.update_layout(**plot_style)
-    st.plotly_chart(fig, use_container_width=True)
+    prof.chart(payloads, 'Total Orders', total_orders, theme,
+               lambda: indicator("Total Orders", total_orders, {'valueformat': ',.0f'}))
 
 with row1[2]:
-    fig = go.Figure(go.Indicator(
-        mode="number",
-        value=stock_turnover,
-        title={"text": "Stock Turnover Rate"},
-        number={'valueformat': '.2f'},
-    ))
-    fig.update_layout(**plot_style)
-    st.plotly_chart(fig, use_container_width=True)
+    prof.chart(payloads, 'Stock Turnover Rate', stock_turnover, theme,
+               lambda: indicator("Stock Turnover Rate", stock_turnover, {'valueformat': '.2f'}))
 
 with row1[3]:
-    fig = go.Figure(go.Indicator(
-        mode="number",
-        value=total_products_sold,
-        title={"text": "Total Products Sold"},
-        number={'valueformat': ',.0f'},
-    ))
-    fig.update_layout(**plot_style)
-    st.plotly_chart(fig, use_container_width=True)
+    prof.chart(payloads, 'Total Products Sold', total_products_sold, theme,
+               lambda: indicator("Total Products Sold", total_products_sold, {'valueformat': ',.0f'}))
 
 # Row 2: Revenue and Cost Insights
+# Aggregate charts are keyed on the hash of the aggregates they draw
 row2 = st.columns(3)
 with row2[0]:
-    query = """
-    SELECT "Product type", SUM("Revenue generated")::DECIMAL(8, 2) AS total_revenue
-    FROM filtered_df
-    GROUP BY "Product type"
-    ORDER BY total_revenue DESC
-    """
-    result = duckdb.query(query).df()
-    fig = px.bar(result, x='Product type', y='total_revenue', title='Revenue by Product Type',
-                 labels={'total_revenue': 'Revenue ($)', 'Product type': 'Product Type'},
-                 color='Product type', color_discrete_sequence=colors)
-    fig.update_layout(**plot_style, yaxis_tickprefix='$', bargap=0.15)
-    st.plotly_chart(fig, use_container_width=True)
+    def revenue_by_product_type():
+        result = aggregates[('Product type',)].sort_values('total_revenue', ascending=False)
+        result['total_revenue'] = result['total_revenue'].round(2)
+        fig = px.bar(result, x='Product type', y='total_revenue', title='Revenue by Product Type',
+                     labels={'total_revenue': 'Revenue ($)', 'Product type': 'Product Type'},
+                     color='Product type', color_discrete_sequence=colors)
+        fig.update_layout(**plot_style, yaxis_tickprefix='$', bargap=0.15)
+        return fig
+
+    prof.chart(payloads, 'Revenue by Product Type', aggregates[('Product type',)], theme, revenue_by_product_type)
 
 with row2[1]:
-    cost_summary = filtered_df.groupby('Inspection results')['Manufacturing costs'].sum().reset_index()
-    fig = px.pie(cost_summary, names='Inspection results', values='Manufacturing costs', 
-                 title='Costs by Inspection Results', color_discrete_sequence=colors)
-    fig.update_traces(textinfo='percent+label', hoverinfo='label+value+percent')
-    fig.update_layout(**plot_style, showlegend=True)
-    st.plotly_chart(fig, use_container_width=True)
+    def costs_by_inspection_results():
+        cost_summary = aggregates[('Inspection results',)].rename(columns={'total_manufacturing_costs': 'Manufacturing costs'})
+        fig = px.pie(cost_summary, names='Inspection results', values='Manufacturing costs', 
+                     title='Costs by Inspection Results', color_discrete_sequence=colors)
+        fig.update_traces(textinfo='percent+label', hoverinfo='label+value+percent')
+        fig.update_layout(**plot_style, showlegend=True)
+        return fig
+
+    prof.chart(payloads, 'Costs by Inspection Results', aggregates[('Inspection results',)], theme,
+               costs_by_inspection_results)
 
 with row2[2]:
-    supplier_summary = filtered_df.groupby('Supplier name')['Manufacturing costs'].sum().reset_index()
-    fig = px.bar(supplier_summary, x='Supplier name', y='Manufacturing costs', title='Costs by Supplier',
-                 labels={'Manufacturing costs': 'Costs ($)'}, color='Supplier name', color_discrete_sequence=colors)
-    fig.update_layout(**plot_style, xaxis={'categoryorder': 'total descending'}, yaxis_tickprefix='$')
-    st.plotly_chart(fig, use_container_width=True)
+    def costs_by_supplier():
+        supplier_summary = aggregates[('Supplier name',)].rename(columns={'total_manufacturing_costs': 'Manufacturing costs'})
+        fig = px.bar(supplier_summary, x='Supplier name', y='Manufacturing costs', title='Costs by Supplier',
+                     labels={'Manufacturing costs': 'Costs ($)'}, color='Supplier name', color_discrete_sequence=colors)
+        fig.update_layout(**plot_style, xaxis={'categoryorder': 'total descending'}, yaxis_tickprefix='$')
+        return fig
+
+    prof.chart(payloads, 'Costs by Supplier', aggregates[('Supplier name',)], theme, costs_by_supplier)
 
 # Row 3: Operational Insights
 row3 = st.columns(3)
 with row3[0]:
-    fig = px.scatter(filtered_df, x='Manufacturing costs', y='Revenue generated', size='Price', 
-                     color='Product type', hover_name='SKU', title='Costs vs Revenue',
-                     labels={'Manufacturing costs': 'Costs ($)', 'Revenue generated': 'Revenue ($)'},
-                     color_discrete_sequence=colors)
-    fig.update_layout(**plot_style)
-    st.plotly_chart(fig, use_container_width=True)
+    # Raw-row charts are keyed on the rows (store version + filters) and the mode instead of hashing every row
+    def costs_vs_revenue():
+        if row_count > point_budget and scatter_mode == 'Bin':
+            x_centers, y_centers, counts = from_shards(lambda: rows.bins(filters, 'Manufacturing costs',
+                                                                          'Revenue generated'))
+            fig = go.Figure(go.Heatmap(x=x_centers, y=y_centers, z=np.where(counts > 0, counts, np.nan),
+                                       colorscale='Plasma', colorbar=dict(title='Rows')))
+            fig.update_layout(title=f'Costs vs Revenue (binned, {row_count:,} rows)',
+                              xaxis_title='Costs ($)', yaxis_title='Revenue ($)')
+        else:
+            scatter_df = from_shards(lambda: rows.sample(filters, ['Manufacturing costs', 'Revenue generated', 'Price',
+                                                                   'Product type', 'SKU'], 'Product type', point_budget))
+            title = 'Costs vs Revenue'
+            if len(scatter_df) < row_count:
+                title += f' (sample of {len(scatter_df):,} / {row_count:,})'
+            fig = px.scatter(scatter_df, x='Manufacturing costs', y='Revenue generated', size='Price', 
+                             color='Product type', hover_name='SKU', title=title,
+                             labels={'Manufacturing costs': 'Costs ($)', 'Revenue generated': 'Revenue ($)'},
+                             color_discrete_sequence=colors)
+        fig.update_layout(**plot_style)
+        return fig
+
+    prof.chart(payloads, 'Costs vs Revenue', (version, filter_key(filters), scatter_mode, point_budget), theme,
+               costs_vs_revenue)
 
 with row3[1]:
-    order_summary = filtered_df.groupby('Transportation modes')['Order quantities'].sum().reset_index()
-    fig = px.sunburst(order_summary, path=['Transportation modes'], values='Order quantities', 
-                      title='Orders by Transport Mode', color='Order quantities', 
-                      color_continuous_scale='Plasma')
-    fig.update_layout(**plot_style)
-    st.plotly_chart(fig, use_container_width=True)
+    def orders_by_transport_mode():
+        order_summary = aggregates[('Transportation modes',)].rename(columns={'total_orders': 'Order quantities'})
+        fig = px.sunburst(order_summary, path=['Transportation modes'], values='Order quantities', 
+                          title='Orders by Transport Mode', color='Order quantities', 
+                          color_continuous_scale='Plasma')
+        fig.update_layout(**plot_style)
+        return fig
+
+    prof.chart(payloads, 'Orders by Transport Mode', aggregates[('Transportation modes',)], theme,
+               orders_by_transport_mode)
 
 with row3[2]:
-    price_costs = filtered_df.groupby('Product type').agg(
-        Price=('Price', 'sum'),
-        Manufacturing_costs=('Manufacturing costs', 'sum')
-    ).reset_index()
-    price_costs['Profit_margin'] = (price_costs['Price'] - price_costs['Manufacturing_costs']).round(2)
-    fig = px.bar(price_costs, x='Product type', y=['Price', 'Manufacturing_costs'], 
-                 title='Price vs Manufacturing Costs',
-                 labels={'value': 'Cost ($)', 'Product type': 'Product Type', 'variable': 'Cost Type'},
-                 color_discrete_sequence=[colors[0], colors[3]], barmode='group')
-    for i, row in price_costs.iterrows():
-        fig.add_annotation(
-            x=row['Product type'], y=row['Price'] + 5,
-            text=f"Margin: ${row['Profit_margin']}", showarrow=False,
-            font=dict(size=10, color='white')
-        )
-    fig.update_layout(**plot_style, yaxis_tickprefix='$', bargap=0.2)
-    st.plotly_chart(fig, use_container_width=True)
+    def price_vs_manufacturing_costs():
+        price_costs = aggregates[('Product type',)].rename(
+            columns={'total_price': 'Price', 'total_manufacturing_costs': 'Manufacturing_costs'}
+        )[['Product type', 'Price', 'Manufacturing_costs']]
+        price_costs['Profit_margin'] = (price_costs['Price'] - price_costs['Manufacturing_costs']).round(2)
+        fig = px.bar(price_costs, x='Product type', y=['Price', 'Manufacturing_costs'], 
+                     title='Price vs Manufacturing Costs',
+                     labels={'value': 'Cost ($)', 'Product type': 'Product Type', 'variable': 'Cost Type'},
+                     color_discrete_sequence=[colors[0], colors[3]], barmode='group')
+        for i, row in price_costs.iterrows():
+            fig.add_annotation(
+                x=row['Product type'], y=row['Price'] + 5,
+                text=f"Margin: ${row['Profit_margin']}", showarrow=False,
+                font=dict(size=10, color='white')
+            )
+        fig.update_layout(**plot_style, yaxis_tickprefix='$', bargap=0.2)
+        return fig
+
+    prof.chart(payloads, 'Price vs Manufacturing Costs', aggregates[('Product type',)], theme,
+               price_vs_manufacturing_costs)
 
 # Row 4: Quality and Efficiency Insights
 row4 = st.columns(3)
 with row4[0]:
-    defect_rates = filtered_df.groupby('Product type')['Defect rates'].mean().reset_index()
-    fig = px.bar(defect_rates, x='Product type', y='Defect rates', title='Average Defect Rates by Product',
-                 labels={'Defect rates': 'Defect Rate (%)'}, color='Product type', color_discrete_sequence=colors)
-    fig.update_layout(**plot_style, yaxis_ticksuffix='%')
-    st.plotly_chart(fig, use_container_width=True)
+    def average_defect_rates():
+        defect_rates = aggregates[('Product type',)].rename(columns={'avg_defect_rate': 'Defect rates'})
+        fig = px.bar(defect_rates, x='Product type', y='Defect rates', title='Average Defect Rates by Product',
+                     labels={'Defect rates': 'Defect Rate (%)'}, color='Product type', color_discrete_sequence=colors)
+        fig.update_layout(**plot_style, yaxis_ticksuffix='%')
+        return fig
+
+    prof.chart(payloads, 'Average Defect Rates by Product', aggregates[('Product type',)], theme,
+               average_defect_rates)
 
 with row4[1]:
-    query = """
-    SELECT "Supplier name", 
-           SUM("Revenue generated")::DECIMAL(8, 2) / SUM("Manufacturing costs") AS cost_efficiency
-    FROM filtered_df
-    GROUP BY "Supplier name"
-    ORDER BY cost_efficiency DESC
-    """
-    result = duckdb.query(query).df()
-    fig = px.bar(result, x='Supplier name', y='cost_efficiency', title='Cost Efficiency by Supplier',
-                 labels={'cost_efficiency': 'Revenue per $ Cost'}, color='Supplier name', color_discrete_sequence=colors)
-    fig.update_layout(**plot_style)
-    st.plotly_chart(fig, use_container_width=True)
+    def cost_efficiency_by_supplier():
+        result = aggregates[('Supplier name',)].copy()
+        result['cost_efficiency'] = result['total_revenue'] / result['total_manufacturing_costs']
+        result = result.sort_values('cost_efficiency', ascending=False)
+        fig = px.bar(result, x='Supplier name', y='cost_efficiency', title='Cost Efficiency by Supplier',
+                     labels={'cost_efficiency': 'Revenue per $ Cost'}, color='Supplier name', color_discrete_sequence=colors)
+        fig.update_layout(**plot_style)
+        return fig
+
+    prof.chart(payloads, 'Cost Efficiency by Supplier', aggregates[('Supplier name',)], theme,
+               cost_efficiency_by_supplier)
 
 with row4[2]:
-    lead_times = filtered_df.groupby('Product type')['Lead times'].mean().reset_index()
-    fig = px.bar(lead_times, x='Product type', y='Lead times', title='Average Lead Time by Product Type',
-                 labels={'Lead times': 'Lead Time (days)', 'Product type': 'Product Type'},
-                 color='Product type', color_discrete_sequence=colors)
-    fig.update_layout(**plot_style, bargap=0.15)
-    st.plotly_chart(fig, use_container_width=True)
+    def average_lead_time():
+        lead_times = aggregates[('Product type',)].rename(columns={'avg_lead_time': 'Lead times'})
+        fig = px.bar(lead_times, x='Product type', y='Lead times', title='Average Lead Time by Product Type',
+                     labels={'Lead times': 'Lead Time (days)', 'Product type': 'Product Type'},
+                     color='Product type', color_discrete_sequence=colors)
+        fig.update_layout(**plot_style, bargap=0.15)
+        return fig
+
+    prof.chart(payloads, 'Average Lead Time by Product Type', aggregates[('Product type',)], theme,
+               average_lead_time)
 
 # Row 5: New Plots (Routes, Shipping Costs, Production Volumes)
 row5 = st.columns(3)
 with row5[0]:
-    route_counts = filtered_df['Routes'].value_counts().reset_index()
-    route_counts.columns = ['Routes', 'Count']
-    fig = px.scatter(route_counts, x='Routes', y='Count', size='Count', hover_name='Routes',
-                     title='Transportation Routes Frequency',
-                     labels={'Routes': 'Routes', 'Count': 'Frequency'},
-                     size_max=60, color='Routes', color_discrete_sequence=colors)
-    fig.update_layout(**plot_style, showlegend=False)
-    st.plotly_chart(fig, use_container_width=True)
+    def routes_frequency():
+        route_counts = aggregates[('Routes',)].rename(columns={'row_count': 'Count'})
+        route_counts = route_counts.sort_values('Count', ascending=False)[['Routes', 'Count']]
+        fig = px.scatter(route_counts, x='Routes', y='Count', size='Count', hover_name='Routes',
+                         title='Transportation Routes Frequency',
+                         labels={'Routes': 'Routes', 'Count': 'Frequency'},
+                         size_max=60, color='Routes', color_discrete_sequence=colors)
+        fig.update_layout(**plot_style, showlegend=False)
+        return fig
+
+    prof.chart(payloads, 'Transportation Routes Frequency', aggregates[('Routes',)], theme, routes_frequency)
 
 with row5[1]:
-    shipping_costs = filtered_df.groupby('Shipping carriers')['Shipping costs'].sum().reset_index()
-    fig = px.bar(shipping_costs, x='Shipping carriers', y='Shipping costs', 
-                 title='Shipping Costs by Carrier',
-                 labels={'Shipping costs': 'Shipping Costs ($)', 'Shipping carriers': 'Carrier'},
-                 color='Shipping carriers', color_discrete_sequence=colors)
-    fig.update_layout(**plot_style, yaxis_tickprefix='$', xaxis={'categoryorder': 'total descending'})
-    st.plotly_chart(fig, use_container_width=True)
+    def shipping_costs_by_carrier():
+        shipping_costs = aggregates[('Shipping carriers',)].rename(columns={'total_shipping_costs': 'Shipping costs'})
+        fig = px.bar(shipping_costs, x='Shipping carriers', y='Shipping costs', 
+                     title='Shipping Costs by Carrier',
+                     labels={'Shipping costs': 'Shipping Costs ($)', 'Shipping carriers': 'Carrier'},
+                     color='Shipping carriers', color_discrete_sequence=colors)
+        fig.update_layout(**plot_style, yaxis_tickprefix='$', xaxis={'categoryorder': 'total descending'})
+        return fig
+
+    prof.chart(payloads, 'Shipping Costs by Carrier', aggregates[('Shipping carriers',)], theme,
+               shipping_costs_by_carrier)
 
 with row5[2]:
-    location_summary = filtered_df.groupby('Location')['Production volumes'].sum().reset_index()
-    fig = px.treemap(location_summary, path=['Location'], values='Production volumes', 
-                     title='Production by Location', color='Production volumes', 
-                     color_continuous_scale='Viridis')
-    fig.update_layout(**plot_style)
-    st.plotly_chart(fig, use_container_width=True)
+    def production_by_location():
+        location_summary = aggregates[('Location',)].rename(columns={'total_production_volumes': 'Production volumes'})
+        fig = px.treemap(location_summary, path=['Location'], values='Production volumes', 
+                         title='Production by Location', color='Production volumes', 
+                         color_continuous_scale='Viridis')
+        fig.update_layout(**plot_style)
+        return fig
+
+    prof.chart(payloads, 'Production by Location', aggregates[('Location',)], theme, production_by_location)
 
 # Row 6: New Plots (Shipping Times, Cost Correlations, Supplier Performance)
 row6 = st.columns(3)
 with row6[0]:
-    fig = px.violin(filtered_df, x='Product type', y='Shipping times', 
-                    title='Shipping Times Distribution by Product',
-                    labels={'Shipping times': 'Shipping Times (days)', 'Product type': 'Product Type'},
-                    color='Product type', color_discrete_sequence=colors, box=True, points='all')
-    fig.update_layout(**plot_style)
-    st.plotly_chart(fig, use_container_width=True)
+    def shipping_times_distribution():
+        if row_count > VIOLIN_ROW_THRESHOLD:
+            # Outline and box from per-group KDEs and quartiles of the value counts instead of every row
+            counts = from_shards(lambda: rows.value_counts(filters, 'Product type', 'Shipping times'))
+            profiles = profiles_from_counts(counts, 'Product type', 'Shipping times')
+            widest = max((p['density'].max() for p in profiles), default=1) or 1
+            fig = go.Figure()
+            for i, p in enumerate(profiles):
+                color = colors[i % len(colors)]
+                half = 0.4 * p['density'] / widest
+                fig.add_trace(go.Scatter(x=np.concatenate([i - half, (i + half)[::-1]]),
+                                         y=np.concatenate([p['grid'], p['grid'][::-1]]),
+                                         fill='toself', mode='lines', line=dict(color=color),
+                                         name=p['group'], hoverinfo='name'))
+                fig.add_trace(go.Box(x=[i], q1=[p['q1']], median=[p['median']], q3=[p['q3']],
+                                     lowerfence=[p['lowerfence']], upperfence=[p['upperfence']],
+                                     mean=[p['mean']], width=0.1, marker_color=color, showlegend=False,
+                                     name=p['group']))
+            fig.update_layout(title=f'Shipping Times Distribution by Product ({row_count:,} rows)',
+                              xaxis=dict(tickvals=list(range(len(profiles))), ticktext=[p['group'] for p in profiles],
+                                         title='Product Type'),
+                              yaxis_title='Shipping Times (days)')
+        else:
+            violin_df = from_shards(lambda: rows.sample(filters, ['Product type', 'Shipping times'], 'Product type',
+                                                        VIOLIN_ROW_THRESHOLD))
+            fig = px.violin(violin_df, x='Product type', y='Shipping times', 
+                            title='Shipping Times Distribution by Product',
+                            labels={'Shipping times': 'Shipping Times (days)', 'Product type': 'Product Type'},
+                            color='Product type', color_discrete_sequence=colors, box=True, points='all')
+        fig.update_layout(**plot_style)
+        return fig
+
+    prof.chart(payloads, 'Shipping Times Distribution by Product', (version, filter_key(filters)), theme,
+               shipping_times_distribution)
 
 with row6[1]:
-    corr_data = filtered_df[['Manufacturing costs', 'Shipping costs', 'Costs', 'Revenue generated']].corr()
-    fig = go.Figure(data=go.Heatmap(
-        z=corr_data.values, x=corr_data.columns, y=corr_data.columns,
-        colorscale='RdYlBu', zmin=-1, zmax=1, text=corr_data.values.round(2),
-        texttemplate='%{text}', textfont=dict(size=12, color='white')
-    ))
-    fig.update_layout(title='Cost and Revenue Correlations', **plot_style)
-    st.plotly_chart(fig, use_container_width=True)
+    # Keyed on the correlation matrix itself: it is cheap next to building and serializing the heatmap
+    with prof.stage('correlations', 'groupby'):
+        corr_data = correlation_matrix(aggregates)
+
+    def cost_revenue_correlations():
+        fig = go.Figure(data=go.Heatmap(
+            z=corr_data.values, x=corr_data.columns, y=corr_data.columns,
+            colorscale='RdYlBu', zmin=-1, zmax=1, text=corr_data.values.round(2),
+            texttemplate='%{text}', textfont=dict(size=12, color='white')
+        ))
+        fig.update_layout(title='Cost and Revenue Correlations', **plot_style)
+        return fig
+
+    prof.chart(payloads, 'Cost and Revenue Correlations', corr_data.reset_index(), theme, cost_revenue_correlations)
 
 with row6[2]:
-    supplier_metrics = filtered_df.groupby('Supplier name').agg({
-        'Revenue generated': 'sum',
-        'Manufacturing costs': 'sum',
-        'Defect rates': 'mean'
-    }).reset_index()
-    supplier_metrics['Revenue generated'] = supplier_metrics['Revenue generated'] / supplier_metrics['Revenue generated'].max()
-    supplier_metrics['Manufacturing costs'] = supplier_metrics['Manufacturing costs'] / supplier_metrics['Manufacturing costs'].max()
-    supplier_metrics['Defect rates'] = supplier_metrics['Defect rates'] / supplier_metrics['Defect rates'].max()
-    fig = go.Figure()
-    for index, row in supplier_metrics.iterrows():
-        fig.add_trace(go.Scatterpolar(
-            r=[row['Revenue generated'], row['Manufacturing costs'], row['Defect rates']],
-            theta=['Revenue', 'Costs', 'Defect Rate'],
-            fill='toself', name=row['Supplier name'],
-            line=dict(color=colors[index % len(colors)])
-        ))
-    fig.update_layout(
-        title='Supplier Performance Metrics',
-        polar=dict(radialaxis=dict(visible=True, range=[0, 1])),
-        showlegend=True, **plot_style
-    )
-    st.plotly_chart(fig, use_container_width=True)
+    def supplier_performance():
+        supplier_metrics = aggregates[('Supplier name',)].rename(columns={
+            'total_revenue': 'Revenue generated',
+            'total_manufacturing_costs': 'Manufacturing costs',
+            'avg_defect_rate': 'Defect rates'
+        })
+        supplier_metrics['Revenue generated'] = supplier_metrics['Revenue generated'] / supplier_metrics['Revenue generated'].max()
+        supplier_metrics['Manufacturing costs'] = supplier_metrics['Manufacturing costs'] / supplier_metrics['Manufacturing costs'].max()
+        supplier_metrics['Defect rates'] = supplier_metrics['Defect rates'] / supplier_metrics['Defect rates'].max()
+        fig = go.Figure()
+        for index, row in supplier_metrics.iterrows():
+            fig.add_trace(go.Scatterpolar(
+                r=[row['Revenue generated'], row['Manufacturing costs'], row['Defect rates']],
+                theta=['Revenue', 'Costs', 'Defect Rate'],
+                fill='toself', name=row['Supplier name'],
+                line=dict(color=colors[index % len(colors)])
+            ))
+        fig.update_layout(
+            title='Supplier Performance Metrics',
+            polar=dict(radialaxis=dict(visible=True, range=[0, 1])),
+            showlegend=True, **plot_style
+        )
+        return fig
+
+    prof.chart(payloads, 'Supplier Performance Metrics', aggregates[('Supplier name',)], theme, supplier_performance)
+
+# Stage timings (collapsible), also written to $PROFILE_DUMP (.json or .csv) when set
+st.session_state['profile_stages'] = prof.finish()
+for name, cache in [('Preview', load_results()), ('Aggregates', cube.results)]:
+    stats = cache.stats()
+    st.sidebar.caption(f"{name} cache: {stats['hit_rate']:.0%} hits ({stats['entries']} entries, "
+                       f"{stats['bytes'] / 1024 ** 2:.1f} MB)")
+charts = prof.chart_bytes()
+st.sidebar.caption(f"Charts: {int(charts['cached'].sum())}/{len(charts)} cached, "
+                   f"{charts['bytes'].sum() / 1024:,.1f} KB shipped ({payloads.stats()['entries']} payloads)")
+prof.render()
+if os.environ.get('PROFILE_DUMP'):
+    prof.dump(os.environ['PROFILE_DUMP'])
 
 # Footer
 st.markdown(
@@ -0,0 +1,87 @@
+# benchmarks/bench_aggregations.py
+"""Rerun latency of the app.py aggregation block: per-widget groupbys vs one grouping-sets scan.
+
+Run from the repository root:
+    python -m benchmarks.bench_aggregations --sizes 1000 100000 1000000
+"""
+import argparse
+import json
+import time
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+from scripts.aggregations import compute_aggregates
+
+
+def scale_dataset(df, n_rows, seed=0):
+    """Resample the rows of df (with replacement) up to n_rows."""
+    rng = np.random.default_rng(seed)
+    return df.iloc[rng.integers(0, len(df), n_rows)].reset_index(drop=True)
+
+
+def per_widget_aggregates(filtered_df):
+    """The aggregation work app.py used to do: one query or groupby per chart."""
+    con = duckdb.connect()
+    con.register('filtered_df', filtered_df)
+    con.execute("""
+        SELECT SUM("Revenue generated"), SUM("Stock levels"), SUM("Lead times"), SUM("Order quantities"),
+               SUM("Availability"), SUM("Manufacturing costs"), SUM("Number of products sold"),
+               SUM("Shipping costs"), SUM("Manufacturing lead time")
+        FROM filtered_df
+    """).df()
+    con.execute('SELECT "Product type", SUM("Revenue generated") FROM filtered_df GROUP BY 1').df()
+    filtered_df.groupby('Inspection results')['Manufacturing costs'].sum()
+    filtered_df.groupby('Supplier name')['Manufacturing costs'].sum()
+    filtered_df.groupby('Transportation modes')['Order quantities'].sum()
+    filtered_df.groupby('Product type').agg(Price=('Price', 'sum'), Costs=('Manufacturing costs', 'sum'))
+    filtered_df.groupby('Product type')['Defect rates'].mean()
+    con.execute('SELECT "Supplier name", SUM("Revenue generated") / SUM("Manufacturing costs") '
+                'FROM filtered_df GROUP BY 1').df()
+    filtered_df.groupby('Product type')['Lead times'].mean()
+    filtered_df['Routes'].value_counts()
+    filtered_df.groupby('Shipping carriers')['Shipping costs'].sum()
+    filtered_df.groupby('Location')['Production volumes'].sum()
+    filtered_df[['Manufacturing costs', 'Shipping costs', 'Costs', 'Revenue generated']].corr()
+    filtered_df.groupby('Supplier name').agg({'Revenue generated': 'sum', 'Manufacturing costs': 'sum',
+                                              'Defect rates': 'mean'})
+    con.close()
+
+
+def best_of(fn, arg, repeat):
+    """Return the fastest of `repeat` timed calls, in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(arg)
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--csv', default='data/supply_chain.csv')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', help='Write results to this JSON file')
+    args = parser.parse_args()
+
+    base = pd.read_csv(args.csv)
+    results = []
+    print(f"{'rows':>12} {'per-widget ms':>15} {'single-pass ms':>15} {'speedup':>8}")
+    for n_rows in args.sizes:
+        df = scale_dataset(base, n_rows)
+        legacy = best_of(per_widget_aggregates, df, args.repeat)
+        single = best_of(compute_aggregates, df, args.repeat)
+        results.append({'rows': n_rows, 'per_widget_ms': legacy, 'single_pass_ms': single})
+        print(f'{n_rows:>12,} {legacy:>15.1f} {single:>15.1f} {legacy / single:>7.1f}x')
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'Results saved to {args.json}')
+
+
+if __name__ == '__main__':
+    main()
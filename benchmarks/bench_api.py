@@ -0,0 +1,173 @@
+# benchmarks/bench_api.py
+"""Load test of the KPI API: p50/p99 latency and throughput at increasing concurrency.
+
+Starts `python -m scripts.api` on a resampled copy of the data (or targets a
+running server with --url), then fires a mix of KPI and aggregation requests
+over every filter combination from 1, 4, 16, ... concurrent clients.
+
+Run from the repository root:
+    python -m benchmarks.bench_api --rows 100000 --concurrency 1 4 16 64
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import product
+from urllib.parse import urlencode, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.bench_aggregations import scale_dataset
+from scripts.store import ensure_store
+
+APP_FILTERS = {
+    'product_type': [None, 'haircare', 'skincare', 'cosmetics'],
+    'location': [None, 'Mumbai', 'Kolkata', 'Delhi', 'Bangalore', 'Chennai'],
+    'transportation_modes': [None, 'Road', 'Air', 'Rail', 'Sea'],
+}
+DASHBOARD_FILTERS = {
+    'location': [None, ['Mumbai'], ['Kolkata', 'Delhi'], ['Bangalore', 'Chennai', 'Mumbai']],
+    'product_type': [None, ['haircare'], ['skincare', 'cosmetics']],
+    'shipping_carriers': [None, ['Carrier A'], ['Carrier B', 'Carrier C']],
+}
+
+
+def request_paths():
+    """Every filter combination of both views, as KPI and as aggregation requests."""
+    paths = []
+    for view, options in [('app', APP_FILTERS), ('dashboard', DASHBOARD_FILTERS)]:
+        for values in product(*options.values()):
+            params = [(name, v) for name, value in zip(options, values) if value is not None
+                      for v in (value if isinstance(value, list) else [value])]
+            query = '?' + urlencode(params) if params else ''
+            paths += [f'/kpis/{view}{query}', f'/aggregations/{view}{query}']
+    return paths
+
+
+def get(conn, path):
+    conn.request('GET', path)
+    response = conn.getresponse()
+    body = response.read()
+    if response.status != 200:
+        raise RuntimeError(f'{path}: HTTP {response.status} {body[:200]!r}')
+    return body
+
+
+def run_level(host, port, paths, concurrency, requests, seed):
+    """Latencies (ms) of `requests` requests spread over `concurrency` keep-alive clients."""
+    per_client = max(1, requests // concurrency)
+    latencies = [[] for _ in range(concurrency)]
+    start_gate = threading.Barrier(concurrency)
+
+    def client(i):
+        rng = random.Random(seed + i)
+        conn = http.client.HTTPConnection(host, port, timeout=60)
+        start_gate.wait()
+        for _ in range(per_client):
+            path = rng.choice(paths)
+            t = time.perf_counter()
+            get(conn, path)
+            latencies[i].append((time.perf_counter() - t) * 1000)
+        conn.close()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(client, range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return np.concatenate([np.array(l) for l in latencies]), elapsed
+
+
+def fetch_stats(host, port):
+    # A fresh connection: the server drops keep-alive connections left idle during a level
+    conn = http.client.HTTPConnection(host, port, timeout=60)
+    try:
+        return json.loads(get(conn, '/stats'))
+    finally:
+        conn.close()
+
+
+def wait_for(host, port, timeout=300):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=5)
+            get(conn, '/health')
+            conn.close()
+            return
+        except (OSError, RuntimeError):
+            time.sleep(0.5)
+    raise RuntimeError(f'API did not come up on {host}:{port}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--csv', default='data/supply_chain.csv')
+    parser.add_argument('--rows', type=int, default=100_000, help='Resample the CSV to this many rows')
+    parser.add_argument('--url', help='Benchmark an already running API instead of starting one')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--pool-size', type=int, default=4)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16, 64])
+    parser.add_argument('--requests', type=int, default=2000, help='Requests per concurrency level')
+    parser.add_argument('--json', help='Write results to this JSON file')
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    server = None
+    if args.url:
+        host, port = urlsplit(args.url).hostname, urlsplit(args.url).port or 80
+    else:
+        host, port = '127.0.0.1', args.port
+        csv_path = os.path.join(tmp.name, 'scaled.csv')
+        base = pd.read_csv(args.csv)
+        scaled = scale_dataset(base, args.rows)
+        scaled['SKU'] = [f'SKU{i}' for i in range(len(scaled))]
+        scaled.to_csv(csv_path, index=False)
+        db_path = ensure_store(csv_path, os.path.join(tmp.name, 'scaled.duckdb'))
+        server = subprocess.Popen([sys.executable, '-m', 'scripts.api', '--db', db_path, '--port', str(port),
+                                   '--pool-size', str(args.pool_size)])
+    results = []
+    try:
+        wait_for(host, port)
+        paths = request_paths()
+        print(f"{len(paths)} distinct requests against {host}:{port}")
+        print(f"{'clients':>8} {'requests':>9} {'p50 ms':>8} {'p99 ms':>8} {'req/s':>8} {'coalesced':>10}")
+        for concurrency in args.concurrency:
+            before = fetch_stats(host, port)['requests']['coalesced']
+            latencies, elapsed = run_level(host, port, paths, concurrency, args.requests, seed=concurrency)
+            coalesced = fetch_stats(host, port)['requests']['coalesced'] - before
+            result = {
+                'concurrency': concurrency,
+                'requests': len(latencies),
+                'p50_ms': float(np.percentile(latencies, 50)),
+                'p99_ms': float(np.percentile(latencies, 99)),
+                'requests_per_second': len(latencies) / elapsed,
+                'coalesced': coalesced,
+            }
+            results.append(result)
+            print(f"{concurrency:>8} {result['requests']:>9} {result['p50_ms']:>8.1f} {result['p99_ms']:>8.1f} "
+                  f"{result['requests_per_second']:>8.0f} {coalesced:>10}")
+        stats = fetch_stats(host, port)
+        print(f"Result cache hit rate {stats['result_cache']['hit_rate']:.0%}; "
+              f"{stats['requests']['computed']} computed, {stats['requests']['coalesced']} coalesced")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        tmp.cleanup()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'Results saved to {args.json}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+# benchmarks/bench_charts.py
+"""Chart payload cache: figure build + serialization vs a cache hit, and bytes shipped per chart.
+
+Synthetic rows (scripts/synthetic.py) are ingested into a temporary DuckDB
+store and drawn as a few app.py-style charts: an aggregate bar chart, a
+per-supplier polar chart built in a trace loop, the sampled raw-row scatter and
+its binned heatmap. The raw-row charts get their inputs from the store through
+StoreRows, as app.py does. For each chart the report shows the time to build
+the figure (including those queries) and serialize it the way st.plotly_chart
+does, the time of a payload cache hit, and the JSON size before and after the
+arrays are compacted.
+
+Run from the repository root:
+    python -m benchmarks.bench_charts --rows 100000 --point-budget 5000
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import plotly.express as px
+import plotly.graph_objects as go
+import plotly.io as pio
+
+from benchmarks.bench_aggregations import best_of
+from scripts.chart_cache import ChartPayloads, theme_key
+from scripts.downsampling import SCATTER_POINT_BUDGET, StoreRows
+from scripts.store import ensure_store, read_table
+from scripts.synthetic import write_dataset
+
+STYLE = {'template': 'plotly_dark', 'paper_bgcolor': 'rgba(0,0,0,0)', 'plot_bgcolor': 'rgba(0,0,0,0)'}
+
+
+def charts(df, rows, point_budget):
+    """(name, inputs, build) for each benchmarked chart; inputs are what app.py keys the chart on.
+
+    df holds the columns of the aggregate charts; rows (StoreRows) answers the raw-row ones.
+    """
+    by_product = df.groupby('Product type', as_index=False)['Revenue generated'].sum()
+    by_supplier = df.groupby('Supplier name', as_index=False)[
+        ['Revenue generated', 'Manufacturing costs', 'Defect rates']].mean()
+
+    def revenue_bar():
+        return px.bar(by_product, x='Product type', y='Revenue generated', color='Product type').update_layout(**STYLE)
+
+    def supplier_polar():
+        scaled = by_supplier.set_index('Supplier name')
+        scaled = scaled / scaled.max()
+        fig = go.Figure()
+        for name, row in scaled.iterrows():
+            fig.add_trace(go.Scatterpolar(r=list(row), theta=['Revenue', 'Costs', 'Defect Rate'], fill='toself', name=name))
+        return fig.update_layout(**STYLE)
+
+    def scatter():
+        sample = rows.sample({}, ['Manufacturing costs', 'Revenue generated', 'Price', 'Product type', 'SKU'],
+                             'Product type', point_budget)
+        return px.scatter(sample, x='Manufacturing costs', y='Revenue generated', size='Price',
+                          color='Product type', hover_name='SKU').update_layout(**STYLE)
+
+    def binned():
+        x, y, counts = rows.bins({}, 'Manufacturing costs', 'Revenue generated')
+        return go.Figure(go.Heatmap(x=x, y=y, z=np.where(counts > 0, counts, np.nan))).update_layout(**STYLE)
+
+    return [
+        ('revenue bar', by_product, revenue_bar),
+        ('supplier polar', by_supplier, supplier_polar),
+        ('scatter (sampled)', ('rows', len(df), point_budget), scatter),
+        ('scatter (binned)', ('rows', len(df), 'bin'), binned),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--point-budget', type=int, default=SCATTER_POINT_BUDGET)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', help='Write results to this JSON file')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_charts_')
+    try:
+        csv_path, db_path = os.path.join(workdir, 'data.csv'), os.path.join(workdir, 'data.duckdb')
+        write_dataset(csv_path, args.rows, seed=1)
+        ensure_store(csv_path, db_path)
+        df = read_table(db_path, ['Product type', 'Supplier name', 'Revenue generated', 'Manufacturing costs',
+                                  'Defect rates'])
+        payloads = ChartPayloads()
+        theme = theme_key(STYLE)
+        results = []
+        print(f"{'chart':<20} {'build+json ms':>14} {'hit ms':>8} {'speedup':>8} {'plain KB':>9} {'compact KB':>11}")
+        for name, inputs, build in charts(df, StoreRows(db_path), args.point_budget):
+            plain = pio.to_json(build().to_dict(), validate=False)
+            spec, _ = payloads.payload(name, inputs, theme, build)
+            result = {
+                'chart': name,
+                'build_ms': best_of(lambda fig_build: pio.to_json(fig_build().to_dict()), build, args.repeat),
+                'hit_ms': best_of(lambda key: payloads.payload(name, key, theme, build), inputs, args.repeat),
+                'plain_bytes': len(plain),
+                'compact_bytes': len(spec),
+            }
+            results.append(result)
+            print(f"{name:<20} {result['build_ms']:>14.2f} {result['hit_ms']:>8.3f} "
+                  f"{result['build_ms'] / result['hit_ms']:>7.0f}x {len(plain) / 1024:>9.1f} {len(spec) / 1024:>11.1f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    stats = payloads.stats()
+    print(f"Cache: {stats['hits']} hits, {stats['misses']} misses, {stats['bytes'] / 1024:.1f} KB")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'Results saved to {args.json}')
+
+
+if __name__ == '__main__':
+    main()
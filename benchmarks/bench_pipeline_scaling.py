@@ -0,0 +1,51 @@
+# benchmarks/bench_pipeline_scaling.py
+"""Scaling of the clean + derive pipeline stage across worker processes.
+
+Run from the repository root:
+    python -m benchmarks.bench_pipeline_scaling --rows 2000000 --workers 1 2 4 8 16
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.bench_aggregations import scale_dataset
+from scripts.data_processing import process_data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--csv', default='data/supply_chain.csv')
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--skus', type=int, default=100_000, help='Distinct SKUs in the scaled dataset')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--json', help='Write results to this JSON file')
+    args = parser.parse_args()
+
+    base = scale_dataset(pd.read_csv(args.csv), args.rows)
+    base['SKU'] = 'SKU' + (np.arange(args.rows) % args.skus).astype(str)
+    print(f"{args.rows:,} rows, {args.skus:,} SKUs, {os.cpu_count()} CPUs available")
+
+    results = []
+    baseline = None
+    print(f"{'workers':>8} {'seconds':>10} {'speedup':>8}")
+    for workers in args.workers:
+        df = base.copy()
+        start = time.perf_counter()
+        process_data(df, workers)
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        results.append({'workers': workers, 'rows': args.rows, 'seconds': elapsed})
+        print(f'{workers:>8} {elapsed:>10.2f} {baseline / elapsed:>7.2f}x')
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'Results saved to {args.json}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+# benchmarks/bench_schema.py
+"""Memory and groupby latency of the supply chain frame: default pd.read_csv vs the canonical schema.
+
+Run from the repository root:
+    python -m benchmarks.bench_schema --sizes 100000 1000000
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks.bench_aggregations import best_of, scale_dataset
+from scripts.schema import memory_per_row, read_csv
+
+
+def dashboard_groupbys(df):
+    """Categorical groupbys of the kind the dashboards run."""
+    df.groupby('Product type', observed=True)['Revenue generated'].sum()
+    df.groupby('Location', observed=True)['Production volumes'].sum()
+    df.groupby('Supplier name', observed=True)['Defect rates'].mean()
+    df.groupby(['Location', 'Product type'], observed=True)['Lead time'].mean()
+    df.groupby(['Shipping carriers', 'Transportation modes', 'Routes'], observed=True).size()
+
+
+def measure(label, load, path, repeat):
+    start = time.perf_counter()
+    df = load(path)
+    load_seconds = time.perf_counter() - start
+    return {
+        'loader': label,
+        'rows': len(df),
+        'bytes_per_row': memory_per_row(df),
+        'load_seconds': load_seconds,
+        'groupby_ms': best_of(dashboard_groupbys, df, repeat),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--csv', default='data/supply_chain.csv')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', help='Write results to this JSON file')
+    args = parser.parse_args()
+
+    base = pd.read_csv(args.csv)
+    results = []
+    print(f"{'rows':>10} {'loader':>8} {'bytes/row':>10} {'load s':>8} {'groupby ms':>11}")
+    for n_rows in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'scaled.csv')
+            scale_dataset(base, n_rows).to_csv(path, index=False)
+            for label, load in [('default', pd.read_csv), ('schema', read_csv)]:
+                result = measure(label, load, path, args.repeat)
+                results.append(result)
+                print(f"{n_rows:>10,} {label:>8} {result['bytes_per_row']:>10.1f} "
+                      f"{result['load_seconds']:>8.2f} {result['groupby_ms']:>11.1f}")
+        before, after = results[-2], results[-1]
+        print(f"{'':>10} {'':>8} {before['bytes_per_row'] / after['bytes_per_row']:>9.1f}x "
+              f"{'':>8} {before['groupby_ms'] / after['groupby_ms']:>10.1f}x")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'Results saved to {args.json}')
+
+
+if __name__ == '__main__':
+    main()
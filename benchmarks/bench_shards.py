@@ -0,0 +1,94 @@
+# benchmarks/bench_shards.py
+"""Scaling of scatter-gather aggregation as shards are added.
+
+A synthetic store (scripts/synthetic.py) is split into 1, 2, 4, ... shards
+served by local worker processes (scripts/shards.py). For each shard count the
+report shows:
+
+- the time for the workers to load their shards;
+- the wall time of the app.py query mix (uncached Coordinator.aggregate calls)
+  and its speedup over the first shard count.
+
+Every worker's DuckDB runs one thread (--threads), so one shard is a
+single-threaded scan and the speedup is what splitting it buys. Shards run in
+parallel only when there are cores for them: expect no speedup beyond
+os.cpu_count() shards, and none at all on one core.
+
+Run from the repository root:
+    python -m benchmarks.bench_shards --rows 4000000 --shards 1 2 4 8
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from scripts.shards import Coordinator
+from scripts.store import ensure_store
+from scripts.synthetic import write_dataset
+
+# app.py selectbox selections: no filter, one value, two filters, and the sharding key
+SELECTIONS = [
+    {},
+    {'Product type': ['skincare']},
+    {'Location': ['Mumbai']},
+    {'Location': ['Delhi'], 'Transportation modes': ['Air']},
+    {'Product type': ['haircare'], 'Transportation modes': ['Road']},
+]
+
+
+def run_mix(coordinator):
+    """Seconds of wall time for the SELECTIONS queries."""
+    start = time.perf_counter()
+    for filters in SELECTIONS:
+        coordinator.aggregate(filters)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--by', choices=['sku', 'location'], default='sku')
+    parser.add_argument('--threads', type=int, default=1, help='DuckDB threads per shard worker')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', help='Write results to this JSON file')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_shards_')
+    try:
+        csv_path, db_path = os.path.join(workdir, 'data.csv'), os.path.join(workdir, 'data.duckdb')
+        write_dataset(csv_path, args.rows)
+        ensure_store(csv_path, db_path)
+        print(f"{args.rows:,} rows sharded by {args.by}, {args.threads} DuckDB thread(s) per shard, "
+              f"{os.cpu_count()} CPUs available")
+
+        results = []
+        baseline = None
+        print(f"{'shards':>7} {'load s':>8} {'query ms':>9} {'speedup':>8}")
+        for shards in args.shards:
+            start = time.perf_counter()
+            coordinator = Coordinator.local(db_path, shards, args.by, threads=args.threads)
+            load_seconds = time.perf_counter() - start
+            try:
+                run_mix(coordinator)  # first queries pay DuckDB's warm-up
+                wall = min(run_mix(coordinator) for _ in range(args.repeat))
+            finally:
+                coordinator.close()
+            baseline = baseline or wall
+            result = {'shards': shards, 'rows': args.rows, 'by': args.by, 'threads': args.threads,
+                      'load_seconds': load_seconds, 'query_ms': wall * 1000, 'speedup': baseline / wall}
+            results.append(result)
+            print(f"{shards:>7} {load_seconds:>8.2f} {wall * 1000:>9.1f} {baseline / wall:>7.2f}x")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'Results saved to {args.json}')
+
+
+if __name__ == '__main__':
+    main()
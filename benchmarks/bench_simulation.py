@@ -0,0 +1,55 @@
+# benchmarks/bench_simulation.py
+"""Stock-out simulation throughput: SKUs x scenarios per second at increasing worker counts.
+
+Synthetic SKUs (scripts/synthetic.py, one row per SKU) are simulated with
+scripts.simulation.simulate for every --workers value. The target workload is
+100k SKUs x 10k scenarios in minutes on a multi-core machine.
+
+Run from the repository root:
+    python -m benchmarks.bench_simulation --skus 100000 --scenarios 10000 --workers 1 2 4 8
+"""
+import argparse
+import json
+import time
+
+from scripts.data_processing import clean_data
+from scripts.schema import read_csv
+from scripts.simulation import HORIZON_DAYS, simulate
+from scripts.synthetic import SAMPLE_CSV, generate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--skus', type=int, default=10_000)
+    parser.add_argument('--scenarios', type=int, default=10_000)
+    parser.add_argument('--horizon', type=int, default=HORIZON_DAYS)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--json', help='Write results to this JSON file')
+    args = parser.parse_args()
+
+    df = clean_data(generate(read_csv(SAMPLE_CSV), args.skus, seed=1))
+    results = []
+    print(f"{'workers':>8} {'SKUs':>10} {'scenarios':>10} {'seconds':>9} {'SKU-scenarios/s':>16}")
+    for workers in args.workers:
+        start = time.perf_counter()
+        simulation = simulate(df, args.scenarios, args.horizon, workers=workers)
+        seconds = time.perf_counter() - start
+        result = {
+            'workers': workers,
+            'skus': len(simulation),
+            'scenarios': args.scenarios,
+            'seconds': seconds,
+            'sku_scenarios_per_second': len(simulation) * args.scenarios / seconds,
+        }
+        results.append(result)
+        print(f"{workers:>8} {result['skus']:>10,} {args.scenarios:>10,} {seconds:>9.2f} "
+              f"{result['sku_scenarios_per_second']:>16,.0f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'Results saved to {args.json}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+# benchmarks/bench_sketches.py
+"""Approximate vs exact planner statistics: query latency and observed error at increasing row counts.
+
+For each size, synthetic rows (scripts/synthetic.py) are sketched once per
+partition and the partitions are merged. A mix of filter selections is then
+answered from the sketches, exactly with pandas, and exactly by DuckDB on a
+store of the same rows (what dashboard_app.py runs). The report shows the
+sketch build time, the best query time of each mode, the speedup of the
+sketches over the DuckDB queries, and the largest relative error seen for
+distinct SKUs and for the percentiles.
+
+Run from the repository root:
+    python -m benchmarks.bench_sketches --sizes 100000 1000000 10000000
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks.bench_aggregations import best_of
+from scripts.data_processing import clean_data
+from scripts.schema import read_csv
+from scripts.sketches import (PERCENTILES, SKETCH_CONFIG, SketchCube, exact_breakdown, exact_summary,
+                              query_breakdown, query_summary)
+from scripts.store import ensure_store
+from scripts.synthetic import SAMPLE_CSV, iter_chunks, write_dataset
+
+SELECTIONS = [
+    {},
+    {'location': ['Mumbai']},
+    {'location': ['Delhi', 'Kolkata'], 'shipping_carriers': ['Carrier A']},
+    {'product_type': ['skincare'], 'shipping_carriers': ['Carrier B', 'Carrier C']},
+]
+
+
+def approximate(cube):
+    for filters in SELECTIONS:
+        cube.summary(filters)
+        for by in SKETCH_CONFIG['breakdowns']:
+            cube.breakdown(by, filters)
+
+
+def exact(df):
+    for filters in SELECTIONS:
+        exact_summary(df, filters)
+        for by in SKETCH_CONFIG['breakdowns']:
+            exact_breakdown(df, by, filters)
+
+
+def exact_sql(db_path):
+    for filters in SELECTIONS:
+        query_summary(db_path, filters)
+        for by in SKETCH_CONFIG['breakdowns']:
+            query_breakdown(db_path, by, filters)
+
+
+def max_errors(cube, df):
+    """Largest relative error of the distinct count and of any percentile over SELECTIONS."""
+    distinct, percentile = 0.0, 0.0
+    columns = [f'{c}_p{round(q * 100)}' for c in SKETCH_CONFIG['quantiles'] for q in PERCENTILES]
+    for filters in SELECTIONS:
+        approx, true = cube.summary(filters), exact_summary(df, filters)
+        distinct = max(distinct, abs(approx['distinct_sku'] - true['distinct_sku']) / max(true['distinct_sku'], 1))
+        for column in columns:
+            if true[column]:
+                percentile = max(percentile, abs(approx[column] - true[column]) / true[column])
+    return distinct, percentile
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--skus', type=int, default=None, help='Distinct SKUs (default: one per row)')
+    parser.add_argument('--partition-rows', type=int, default=1_000_000, help='Rows per sketched partition')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', help='Write results to this JSON file')
+    args = parser.parse_args()
+
+    sample = read_csv(SAMPLE_CSV)
+    results = []
+    workdir = tempfile.mkdtemp(prefix='bench_sketches_')
+    print(f"{'rows':>12} {'build s':>8} {'approx ms':>10} {'exact ms':>10} {'sql ms':>9} {'speedup':>8} "
+          f"{'distinct err':>13} {'pctile err':>11}")
+    for n_rows in args.sizes:
+        partitions = [clean_data(chunk) for chunk in iter_chunks(sample, n_rows, args.partition_rows, skus=args.skus)]
+        start = time.perf_counter()
+        cube = SketchCube(SKETCH_CONFIG)
+        for part in partitions:
+            cube.merge(SketchCube(SKETCH_CONFIG).add(part))
+        build_seconds = time.perf_counter() - start
+        df = pd.concat(partitions, ignore_index=True)
+        distinct_error, percentile_error = max_errors(cube, df)
+        # The same rows (same chunks and seeds) in a store, for the exact statistics the dashboard runs
+        csv_path, db_path = os.path.join(workdir, f'{n_rows}.csv'), os.path.join(workdir, f'{n_rows}.duckdb')
+        write_dataset(csv_path, n_rows, chunk_rows=args.partition_rows, skus=args.skus)
+        ensure_store(csv_path, db_path)
+        result = {
+            'rows': n_rows,
+            'build_seconds': build_seconds,
+            'approximate_ms': best_of(approximate, cube, args.repeat),
+            'exact_ms': best_of(exact, df, args.repeat),
+            'exact_sql_ms': best_of(exact_sql, db_path, args.repeat),
+            'max_distinct_error': distinct_error,
+            'max_percentile_error': percentile_error,
+        }
+        results.append(result)
+        print(f"{n_rows:>12,} {build_seconds:>8.2f} {result['approximate_ms']:>10.1f} {result['exact_ms']:>10.1f} "
+              f"{result['exact_sql_ms']:>9.1f} {result['exact_sql_ms'] / result['approximate_ms']:>7.1f}x "
+              f"{distinct_error:>13.2%} {percentile_error:>11.2%}")
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'Results saved to {args.json}')
+
+
+if __name__ == '__main__':
+    main()
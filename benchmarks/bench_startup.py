@@ -0,0 +1,124 @@
+# benchmarks/bench_startup.py
+"""Cold start: import times and time to first paint of each dashboard, without and with pre-warming.
+
+Every measurement runs in a fresh interpreter, as a restarted pod would. The
+import table times each heavy module on its own. For the dashboards, a work
+directory gets a synthetic CSV (scripts/synthetic.py) and its DuckDB store.
+Each dashboard is then run once with Streamlit's AppTest: first with no
+snapshot and no on-disk caches, then after `python -m scripts.warm --render`.
+The report shows the seconds to the end of the first run and whether
+plotly.express was imported at all.
+
+Run from the repository root:
+    python -m benchmarks.bench_startup --rows 100000 1000000
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DASHBOARDS = ['app.py', 'dashboard_app.py']
+MODULES = ['streamlit', 'pandas', 'duckdb', 'pyarrow', 'plotly.graph_objects', 'plotly.express', 'openpyxl']
+
+IMPORT_CODE = """
+import importlib, json, time
+start = time.perf_counter()
+importlib.import_module({module!r})
+print(json.dumps(time.perf_counter() - start))
+"""
+
+RUN_CODE = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+start = time.perf_counter()
+at = AppTest.from_file({script!r}, default_timeout=600).run()
+print(json.dumps({{'seconds': time.perf_counter() - start, 'errors': [str(e.value) for e in at.exception],
+                  'plotly_express': 'plotly.express' in sys.modules}}))
+"""
+
+
+def run_python(code, cwd, env):
+    out = subprocess.run([sys.executable, '-c', code], cwd=cwd, env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def import_times(repeat):
+    """Best-of-`repeat` import seconds of each module in a fresh interpreter."""
+    return {module: min(run_python(IMPORT_CODE.format(module=module), ROOT, os.environ) for _ in range(repeat))
+            for module in MODULES}
+
+
+def first_runs(workdir, env):
+    results = {}
+    for script in DASHBOARDS:
+        result = run_python(RUN_CODE.format(script=os.path.join(ROOT, script)), workdir, env)
+        if result['errors']:
+            raise ValueError(f"{script} failed: {result['errors']}")
+        results[script] = result
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[100_000])
+    parser.add_argument('--repeat', type=int, default=3, help='Fresh interpreters per import timing')
+    parser.add_argument('--json', help='Write results to this JSON file')
+    args = parser.parse_args()
+
+    imports = import_times(args.repeat)
+    print(f"{'module':<22} {'import s':>9}")
+    for module, seconds in imports.items():
+        print(f"{module:<22} {seconds:>9.3f}")
+
+    results = {'imports': imports, 'dashboards': []}
+    print(f"\n{'rows':>10} {'dashboard':<18} {'cold s':>8} {'warm s':>8} {'px cold':>8} {'px warm':>8}")
+    for n_rows in args.rows:
+        workdir = tempfile.mkdtemp(prefix='bench_startup_')
+        try:
+            env = dict(os.environ, PYTHONPATH=ROOT, SNAPSHOT_DIR='data/snapshot',
+                       RESULT_CACHE_DIR=os.path.join(workdir, 'result_cache'),
+                       CHART_CACHE_DIR=os.path.join(workdir, 'chart_cache'))
+            os.makedirs(os.path.join(workdir, 'data'))
+            subprocess.run([sys.executable, '-c',
+                            "from scripts.synthetic import write_dataset; from scripts.store import ensure_store; "
+                            f"write_dataset('data/supply_chain.csv', {n_rows}, sample_csv={os.path.join(ROOT, 'data', 'supply_chain.csv')!r}); "
+                            "ensure_store('data/supply_chain.csv')"],
+                           cwd=workdir, env=env, check=True, capture_output=True)
+
+            cold = first_runs(workdir, dict(env, SNAPSHOT_DIR='', RESULT_CACHE_DIR='', CHART_CACHE_DIR=''))
+            start = time.perf_counter()
+            subprocess.run([sys.executable, '-m', 'scripts.warm', '--render', *[os.path.join(ROOT, s) for s in DASHBOARDS]],
+                           cwd=workdir, env=env, check=True, capture_output=True)
+            prewarm_seconds = time.perf_counter() - start
+            warm = first_runs(workdir, env)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        for script in DASHBOARDS:
+            result = {
+                'rows': n_rows,
+                'dashboard': script,
+                'cold_seconds': cold[script]['seconds'],
+                'warm_seconds': warm[script]['seconds'],
+                'prewarm_seconds': prewarm_seconds,
+                'plotly_express_cold': cold[script]['plotly_express'],
+                'plotly_express_warm': warm[script]['plotly_express'],
+            }
+            results['dashboards'].append(result)
+            print(f"{n_rows:>10,} {script:<18} {result['cold_seconds']:>8.2f} {result['warm_seconds']:>8.2f} "
+                  f"{'yes' if result['plotly_express_cold'] else 'no':>8} {'yes' if result['plotly_express_warm'] else 'no':>8}")
+        print(f"{'':>10} pre-warm took {prewarm_seconds:.2f}s")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'Results saved to {args.json}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+# benchmarks/bench_suite.py
+"""End-to-end scaling suite on synthetic data: time and peak memory of every pipeline stage per size.
+
+For each size a synthetic CSV is generated (scripts/synthetic.py), then the
+stages run in order: load, clean, derive, persist (Parquet), SQLite load,
+SQL reports, DuckDB store build, and the app.py / dashboard_app.py
+aggregations. Each stage records seconds and the process's peak RSS during
+the stage. Results are written as JSON; --compare flags stages slower than a
+baseline file by more than --tolerance and exits 1.
+
+Run from the repository root:
+    python -m benchmarks.bench_suite --sizes 1000 10000 100000 1000000 --json bench.json
+    python -m benchmarks.bench_suite --sizes 1000 10000 100000 --compare bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
+
+import duckdb
+import pandas as pd
+
+from scripts.aggregations import DASHBOARD_GROUPINGS, DASHBOARD_MEASURES, aggregate_store, compute_aggregates
+from scripts.cube import Cube
+from scripts.data_processing import add_calculated_fields, clean_data, load_data, save_processed_data
+from scripts.db_operations import QUERIES_FILE, create_connection, create_indexes, create_table, insert_data, run_queries
+from scripts.formats import read_frame
+from scripts.schema import apply_schema
+from scripts.store import ensure_store
+from scripts.synthetic import write_dataset
+
+
+def _reset_peak():
+    # Linux: writing 5 to clear_refs resets VmHWM, so each stage gets its own peak
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def peak_rss_mb():
+    """Peak resident memory since the last reset (Linux), else over the process lifetime."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in KiB on Linux, bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / 1024 ** 2 if platform.system() == 'Darwin' else maxrss / 1024
+
+
+class Recorder:
+    """Collects one {rows, stage, seconds, peak_rss_mb} record per timed stage."""
+
+    def __init__(self):
+        self.records = []
+
+    @contextmanager
+    def stage(self, rows, name):
+        _reset_peak()
+        start = time.perf_counter()
+        yield
+        record = {'rows': rows, 'stage': name, 'seconds': time.perf_counter() - start,
+                  'peak_rss_mb': peak_rss_mb()}
+        self.records.append(record)
+        print(f"{rows:>12,} {name:<24} {record['seconds']:>9.3f} {record['peak_rss_mb']:>10.0f}", flush=True)
+
+
+def run_size(rec, rows, tmp, workers):
+    csv_path = os.path.join(tmp, 'synthetic.csv')
+    parquet_path = os.path.join(tmp, 'processed.parquet')
+    sqlite_path = os.path.join(tmp, 'supply_chain.db')
+    store_path = os.path.join(tmp, 'supply_chain.duckdb')
+
+    with rec.stage(rows, 'generate'):
+        write_dataset(csv_path, rows)
+    with rec.stage(rows, 'load'):
+        df = load_data(csv_path)
+    with rec.stage(rows, 'clean'):
+        df = clean_data(df)
+    with rec.stage(rows, 'derive'):
+        df = add_calculated_fields(df)
+    with rec.stage(rows, 'persist'):
+        save_processed_data(df, parquet_path)
+    with rec.stage(rows, 'sqlite_load'):
+        conn = create_connection(sqlite_path)
+        create_table(conn)
+        insert_data(conn, apply_schema(read_frame(parquet_path)))
+        create_indexes(conn, QUERIES_FILE)
+        conn.close()
+    with rec.stage(rows, 'sql_reports'):
+        run_queries(sqlite_path, QUERIES_FILE, os.path.join(tmp, 'reports'), '.parquet', workers)
+    with rec.stage(rows, 'store_build'):
+        ensure_store(csv_path, store_path)
+    with rec.stage(rows, 'app_aggregations'):
+        aggregate_store(store_path)
+    with rec.stage(rows, 'app_cube_build'):
+        Cube.from_store(store_path)
+    with rec.stage(rows, 'dashboard_aggregations'):
+        compute_aggregates(df, DASHBOARD_GROUPINGS, DASHBOARD_MEASURES)
+
+
+def environment():
+    """Where and on what the numbers were taken."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        'commit': commit or None,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'pandas': pd.__version__,
+        'duckdb': duckdb.__version__,
+    }
+
+
+def compare(records, baseline_path, tolerance):
+    """Stages slower than the baseline by more than `tolerance` (a fraction)."""
+    with open(baseline_path) as f:
+        baseline = {(r['rows'], r['stage']): r for r in json.load(f)['results']}
+    regressions = []
+    for record in records:
+        before = baseline.get((record['rows'], record['stage']))
+        # Sub-10ms stages are mostly noise
+        if before and max(record['seconds'], before['seconds']) >= 0.01 \
+                and record['seconds'] > before['seconds'] * (1 + tolerance):
+            regressions.append((record, before))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 100_000, 1_000_000],
+                        help='Row counts, e.g. 1000 ... 100000000 (10^8 rows need ~25 GB of disk and RAM to match)')
+    parser.add_argument('--workers', type=int, default=4, help='Concurrent report connections')
+    parser.add_argument('--json', help='Write results to this JSON file')
+    parser.add_argument('--compare', help='Baseline JSON from an earlier run')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed slowdown vs the baseline (0.2 = 20%%)')
+    args = parser.parse_args()
+
+    rec = Recorder()
+    print(f"{'rows':>12} {'stage':<24} {'seconds':>9} {'peak MB':>10}")
+    for rows in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            run_size(rec, rows, tmp, args.workers)
+
+    results = {'environment': environment(), 'results': rec.records}
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'Results saved to {args.json}')
+
+    if args.compare:
+        regressions = compare(rec.records, args.compare, args.tolerance)
+        for record, before in regressions:
+            print(f"REGRESSION {record['rows']:,} rows {record['stage']}: "
+                  f"{before['seconds']:.3f}s -> {record['seconds']:.3f}s")
+        if regressions:
+            raise SystemExit(1)
+        print(f'No stage slower than the baseline by more than {args.tolerance:.0%}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,80 +1,263 @@
 # dashboard_app.py
+import os
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-from scripts.data_processing import run_pipeline
+from scripts.store import distinct_values, ensure_store
+from scripts.aggregations import dashboard_kpis
+from scripts.chart_cache import ChartPayloads, theme_key
+from scripts.data_processing import read_processed
+from scripts.formats import MIME_TYPES, frame_bytes
+from scripts.filters import from_multiselects, from_slider
+from scripts.ingest import Ingester, LiveProcessed
+from scripts.metrics import CSV_NAMES
+from scripts.profiling import Profiler
+from scripts.result_cache import ResultCache
+from scripts.shards import Coordinator
+from scripts.live import auto_refresh
+from scripts.simulation import DELAY_DAYS, HORIZON_DAYS, INPUT_COLUMNS, PERIOD_DAYS, simulate
+from scripts.sketches import SKETCH_CONFIG, query_breakdown, query_summary
+from scripts.timeseries import DATE_COLUMN, GRAINS
+from scripts.warm import SNAPSHOT_DIR, lazy_module
+
+# Imported on the first chart build; cached chart payloads never need it
+px = lazy_module('plotly.express')
 
 st.set_page_config(page_title="Supply Chain Dashboard", layout="wide")
 st.title("📦 Supply Chain Management Dashboard")
 
-# Load / process data
-df = run_pipeline('data/supply_chain.csv', 'data/processed_data.xlsx')
+# Filter cube + time rollups of the processed rows, aggregated by DuckDB in the store and shared by all
+# sessions; appended store rows are folded in incrementally. Starts from the pre-warm snapshot
+# (scripts/warm.py) instead of aggregating every row when there is one
+@st.cache_resource
+def load_live(db_path):
+    return LiveProcessed.from_store(db_path, snapshot_dir=SNAPSHOT_DIR)
+
+# Filter options, read from the store's ENUM types once per store version
+@st.cache_data(max_entries=4)
+def load_options(db_path, version):
+    return {c: distinct_values(db_path, CSV_NAMES[c]) for c in ['location', 'product_type', 'shipping_carriers']}
+
+# Exact planner statistics, shared by all sessions; keyed on the store version so an append invalidates them
+@st.cache_resource
+def load_results():
+    return ResultCache(disk_dir=os.environ.get('RESULT_CACHE_DIR'))
+
+# Started by the first session to turn on live refresh; shared by all sessions
+@st.cache_resource
+def load_ingester(db_path):
+    return Ingester(db_path=db_path).start()
+
+# With SHARDS or SHARD_ADDRESSES set, shard workers (scripts/shards.py) hold the approximate-mode
+# sketches and merge them per selection; shared by all sessions
+@st.cache_resource
+def load_shards(db_path):
+    return Coordinator.from_env(db_path)
+
+# Serialized charts, shared by all sessions (default Plotly styling)
+@st.cache_resource
+def load_payloads():
+    return ChartPayloads('dashboard_app')
+
+payloads = load_payloads()
+results = load_results()
+theme = theme_key('plotly')
+prof = Profiler()
+
+# Load / process data (from the DuckDB store, built from the CSV on first run)
+db_path = ensure_store('data/supply_chain.csv')
+live = load_live(db_path)
+live.refresh(db_path)
+cube, rollups = live.cube, live.rollups
+version = live.version
 
 # ---------------------------
 # Sidebar filters
 # ---------------------------
 st.sidebar.header("Filters")
-regions = st.sidebar.multiselect("Select Location", options=df['location'].unique(), default=df['location'].unique())
-products = st.sidebar.multiselect("Select Product Type", options=df['product_type'].unique(), default=df['product_type'].unique())
-carriers = st.sidebar.multiselect("Select Shipping Carrier", options=df['shipping_carriers'].unique(), default=df['shipping_carriers'].unique())
+options = load_options(db_path, version)
+regions = st.sidebar.multiselect("Select Location", options=options['location'], default=options['location'])
+products = st.sidebar.multiselect("Select Product Type", options=options['product_type'], default=options['product_type'])
+carriers = st.sidebar.multiselect("Select Shipping Carrier", options=options['shipping_carriers'], default=options['shipping_carriers'])
 
-df_filtered = df[(df['location'].isin(regions)) & 
-                 (df['product_type'].isin(products)) & 
-                 (df['shipping_carriers'].isin(carriers))]
+# Time range (when the data has shipment dates): answered from the pre-rolled daily/weekly/monthly cells
+bounds = rollups.bounds() if rollups is not None else None
+date_filter, grain = {}, 'day'
+if bounds:
+    if bounds[0] < bounds[1]:
+        dates = st.sidebar.slider("Shipment dates", min_value=bounds[0], max_value=bounds[1], value=bounds)
+        date_filter = from_slider(DATE_COLUMN, dates, bounds)
+    grain = st.sidebar.radio("Trend granularity", GRAINS, index=GRAINS.index('week'), horizontal=True)
 
-# ---------------------------
-# KPI Metrics
-# ---------------------------
-st.subheader("Key Metrics")
-total_revenue = df_filtered['total_revenue'].sum()
-avg_lead_time = df_filtered['lead_time'].mean()
-delayed_shipments = df_filtered['delayed_shipment'].sum()
-delivery_ratio = df_filtered['delivery_ratio'].mean()
-avg_inventory_turnover = df_filtered['inventory_turnover'].mean()
-avg_shipping_cost = df_filtered['avg_shipping_cost'].mean()
-
-kpi1, kpi2, kpi3, kpi4, kpi5, kpi6 = st.columns(6)
-kpi1.metric("Total Revenue ($)", f"{total_revenue:,.2f}")
-kpi2.metric("Avg Lead Time (days)", f"{avg_lead_time:.2f}")
-kpi3.metric("Delayed Shipments", f"{delayed_shipments}")
-kpi4.metric("On-time Delivery Ratio", f"{delivery_ratio:.2%}")
-kpi5.metric("Avg Inventory Turnover", f"{avg_inventory_turnover:.2f}")
-kpi6.metric("Avg Shipping Cost ($/unit)", f"{avg_shipping_cost:.2f}")
+# Opt-in approximate mode: planner statistics from precomputed sketches instead of full scans
+approximate = st.sidebar.toggle("Approximate mode", value=False,
+                                help="Distinct counts, percentiles and top routes from mergeable sketches")
 
-# ---------------------------
-# Visualizations
-# ---------------------------
-st.subheader("Visualizations")
-
-# Revenue by Product Type
-fig1 = px.bar(df_filtered.groupby('product_type')['total_revenue'].sum().reset_index(),
-              x='product_type', y='total_revenue', title="Total Revenue by Product Type")
-st.plotly_chart(fig1, use_container_width=True)
-
-# Avg Lead Time by Location
-fig2 = px.bar(df_filtered.groupby('location')['lead_time'].mean().reset_index(),
-              x='location', y='lead_time', title="Average Lead Time by Location")
-st.plotly_chart(fig2, use_container_width=True)
-
-# Heatmap of Delayed Shipments by Location x Product Type
-heatmap_data = df_filtered.pivot_table(index='location', columns='product_type', values='delayed_shipment', aggfunc='mean')
-fig3 = px.imshow(heatmap_data, text_auto=True, color_continuous_scale='RdYlGn_r', title="Delay Heatmap (1=Delayed)")
-st.plotly_chart(fig3, use_container_width=True)
-
-# Revenue Trend over Time (if shipment_date exists)
-if 'shipment_date' in df_filtered.columns:
-    df_filtered['shipment_date'] = pd.to_datetime(df_filtered['shipment_date'])
-    trend_data = df_filtered.groupby('shipment_date')['total_revenue'].sum().reset_index()
-    fig4 = px.line(trend_data, x='shipment_date', y='total_revenue', title="Revenue Trend Over Time")
-    st.plotly_chart(fig4, use_container_width=True)
+# Live mode: this process's one ingester thread picks up dropped / appended rows; sessions only
+# compare store versions and rerun when it moves
+auto_refresh(version, lambda: load_ingester(db_path).version())
 
-# ---------------------------
-# Download Processed Data
-# ---------------------------
-st.subheader("Download Processed Data")
-st.download_button(
-    label="Download Excel",
-    data=open('data/processed_data.xlsx', 'rb').read(),
-    file_name="processed_data.xlsx",
-    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-)
+caches = [('Aggregates', cube.results), ('Statistics', results)] + ([('Trend', rollups.results)] if rollups is not None else [])
+for name, cache in caches:
+    stats = cache.stats()
+    st.sidebar.caption(f"{name} cache: {stats['hit_rate']:.0%} hits ({stats['entries']} entries)")
+
+# One filter spec: the cube and rollups answer it from their cells; the exact statistics run it as
+# a WHERE clause in DuckDB (query_summary), and the simulation pushes it into its store scan
+filters = from_multiselects({'location': regions, 'product_type': products, 'shipping_carriers': carriers}, options)
+filters.update(date_filter)
+
+# Tabs rerun on selection, so the simulation only runs once its tab is opened
+overview_tab, simulation_tab = st.tabs(["Overview", "Stock-out Simulation"], key="tab", on_change="rerun")
+
+with overview_tab:
+    # ---------------------------
+    # KPI Metrics
+    # ---------------------------
+    st.subheader("Key Metrics")
+    # A narrowed date range is summed from the rollups; the full history comes from the cube
+    aggregates = rollups.lookup(filters) if date_filter else cube.lookup(filters)
+    kpis = dashboard_kpis(aggregates)
+    total_revenue = kpis['total_revenue']
+    avg_lead_time = kpis['avg_lead_time']
+    delayed_shipments = kpis['delayed_shipments']
+    delivery_ratio = kpis['delivery_ratio']
+    avg_inventory_turnover = kpis['avg_inventory_turnover']
+    avg_shipping_cost = kpis['avg_shipping_cost']
+
+    kpi1, kpi2, kpi3, kpi4, kpi5, kpi6 = st.columns(6)
+    kpi1.metric("Total Revenue ($)", f"{total_revenue:,.2f}")
+    kpi2.metric("Avg Lead Time (days)", f"{avg_lead_time:.2f}")
+    kpi3.metric("Delayed Shipments", f"{delayed_shipments}")
+    kpi4.metric("On-time Delivery Ratio", f"{delivery_ratio:.2%}")
+    kpi5.metric("Avg Inventory Turnover", f"{avg_inventory_turnover:.2f}")
+    kpi6.metric("Avg Shipping Cost ($/unit)", f"{avg_shipping_cost:.2f}")
+
+    # ---------------------------
+    # Visualizations
+    # ---------------------------
+    st.subheader("Visualizations")
+
+    # Charts are built and serialized only when the aggregates they draw changed, across all sessions
+    # Revenue by Product Type
+    prof.chart(payloads, 'revenue_by_product', aggregates[('product_type',)], theme, lambda: px.bar(
+        aggregates[('product_type',)], x='product_type', y='total_revenue', title="Total Revenue by Product Type"))
+
+    # Avg Lead Time by Location
+    prof.chart(payloads, 'lead_time_by_location', aggregates[('location',)], theme, lambda: px.bar(
+        aggregates[('location',)], x='location', y='lead_time', title="Average Lead Time by Location"))
+
+    # Heatmap of Delayed Shipments by Location x Product Type
+    heatmap_data = aggregates[('location', 'product_type')].pivot(index='location', columns='product_type', values='delayed_shipment')
+    prof.chart(payloads, 'delay_heatmap', heatmap_data.reset_index(), theme, lambda: px.imshow(
+        heatmap_data, text_auto=True, color_continuous_scale='RdYlGn_r', title="Delay Heatmap (1=Delayed)"))
+
+    # Revenue Trend over Time (if shipment_date exists), from the rollups at the chosen granularity
+    if bounds:
+        trend_data = rollups.trend(filters, grain)[[DATE_COLUMN, 'total_revenue']]
+        prof.chart(payloads, 'revenue_trend', trend_data, theme, lambda: px.line(
+            trend_data, x=DATE_COLUMN, y='total_revenue', title="Revenue Trend Over Time"))
+
+    # ---------------------------
+    # Planner Statistics
+    # ---------------------------
+    st.subheader("Planner Statistics")
+    # Sketches have no date dimension, so a narrowed date range is always computed exactly
+    use_sketches = approximate and not date_filter
+    if use_sketches:
+        sketches = None
+        try:
+            shards = load_shards(db_path)
+            if shards is not None:
+                shards.refresh(db_path)
+                sketches = shards.sketches(filters)
+        except (TimeoutError, ConnectionError, ValueError) as e:
+            st.warning(f"Shard sketches unavailable ({e}); using this process's sketches instead")
+        if sketches is None:
+            sketches = live.sketch_cube()
+        summary = sketches.summary(filters)
+        breakdowns = {by: sketches.breakdown(by, filters) for by in SKETCH_CONFIG['breakdowns']}
+        st.badge("approximate", icon=":material/speed:", color="orange")
+        st.caption("Error bounds: " + "; ".join(f"{name}: {bound}" for name, bound in sketches.error_bounds(filters).items()))
+    else:
+        summary = results.get_or_compute(version, filters, 'exact_summary', lambda: query_summary(db_path, filters))
+        breakdowns = {by: results.get_or_compute(version, filters, f'exact_breakdown:{by}',
+                                                 lambda by=by: query_breakdown(db_path, by, filters))
+                      for by in SKETCH_CONFIG['breakdowns']}
+        if approximate:
+            st.caption("Approximate mode covers the full history; the selected date range is computed exactly.")
+
+    stat1, stat2, stat3, stat4 = st.columns(4)
+    stat1.metric("Distinct SKUs", f"{summary['distinct_sku']:,.0f}")
+    stat2.metric("Lead Time p50 / p90 (days)", f"{summary['lead_time_p50']:.1f} / {summary['lead_time_p90']:.1f}")
+    stat3.metric("Lead Time p99 (days)", f"{summary['lead_time_p99']:.1f}")
+    stat4.metric("Shipping Time p50 / p90 / p99", f"{summary['shipping_times_p50']:.1f} / {summary['shipping_times_p90']:.1f}"
+                 f" / {summary['shipping_times_p99']:.1f}")
+
+    by_carrier, by_route, top_routes = st.columns(3)
+    by_carrier.caption("Percentiles by carrier")
+    by_carrier.dataframe(breakdowns['shipping_carriers'], hide_index=True)
+    by_route.caption("Percentiles by route")
+    by_route.dataframe(breakdowns['routes'], hide_index=True)
+    top_routes.caption("Top routes (shipments)")
+    top_routes.dataframe(summary['top_routes'], hide_index=True)
+
+    # ---------------------------
+    # Download Processed Data
+    # ---------------------------
+    # Exports are only built when a button is clicked, from rows DuckDB derives in the store
+    st.subheader("Download Processed Data")
+    download_xlsx, download_csv = st.columns(2)
+    download_xlsx.download_button(
+        label="Download Excel",
+        data=lambda: frame_bytes(read_processed(db_path), '.xlsx'),
+        file_name="processed_data.xlsx",
+        mime=MIME_TYPES['.xlsx']
+    )
+    download_csv.download_button(
+        label="Download CSV",
+        data=lambda: frame_bytes(read_processed(db_path), '.csv'),
+        file_name="processed_data.csv",
+        mime=MIME_TYPES['.csv']
+    )
+
+# Monte Carlo stock-out simulation of the selected SKUs; cached per store version and settings.
+# In-process: forking a pool from the threaded server risks deadlocks, and spawned workers
+# would re-run this script (python -m scripts.simulation uses the pool)
+@st.cache_data(max_entries=16, show_spinner="Simulating...")
+def run_simulation(version, filters, scenarios, horizon, period_days):
+    return simulate(read_processed(db_path, INPUT_COLUMNS, filters), scenarios, horizon, period_days)
+
+with simulation_tab:
+    if simulation_tab.open:
+        st.subheader("Stock-out Simulation")
+        setting1, setting2, setting3 = st.columns(3)
+        scenarios = setting1.select_slider("Scenarios per SKU", options=[1_000, 2_000, 5_000, 10_000], value=1_000)
+        horizon = setting2.slider("Horizon (days)", min_value=7, max_value=90, value=HORIZON_DAYS)
+        period_days = setting3.number_input("Days of sales history", min_value=7, max_value=365, value=PERIOD_DAYS,
+                                            help="Period 'Number of products sold' covers; sets the daily demand")
+        simulation = run_simulation(version, filters, scenarios, horizon, period_days)
+        if simulation.empty:
+            st.info("No SKUs in the current selection.")
+        else:
+            risk1, risk2, risk3, risk4 = st.columns(4)
+            risk1.metric("SKUs Simulated", f"{len(simulation):,}")
+            risk2.metric("Mean Stock-out Probability", f"{simulation['stockout_probability'].mean():.1%}")
+            risk3.metric("Mean Fill Rate", f"{simulation['fill_rate'].mean():.1%}")
+            risk4.metric("SKUs at Risk (>50%)", f"{int((simulation['stockout_probability'] > 0.5).sum()):,}")
+
+            prof.chart(payloads, 'stockout_histogram', (simulation[['sku', 'stockout_probability']], horizon), theme,
+                       lambda: px.histogram(simulation, x='stockout_probability', nbins=20,
+                                            title=f"Stock-out Probability within {horizon} Days"))
+
+            by_supplier = simulation.groupby('supplier_name', sort=True)[
+                ['stockout_probability', 'fill_rate', 'delay_probability']].mean().reset_index()
+            prof.chart(payloads, 'stockout_by_supplier', by_supplier, theme, lambda: px.bar(
+                by_supplier, x='supplier_name', y=['stockout_probability', 'delay_probability'], barmode='group',
+                title=f"Stock-out vs Lead Time > {DELAY_DAYS} Days Probability by Supplier"))
+
+            st.caption("Riskiest SKUs")
+            st.dataframe(simulation.nlargest(20, 'stockout_probability'), hide_index=True)
+
+# Chart payloads sent this rerun
+charts = prof.chart_bytes()
+st.sidebar.caption(f"Charts: {int(charts['cached'].sum())}/{len(charts)} cached, "
+                   f"{charts['bytes'].sum() / 1024:,.1f} KB shipped")
@@ -0,0 +1,200 @@
+# scripts/aggregations.py
+import duckdb
+import pandas as pd
+import pyarrow as pa
+
+from scripts import metrics
+from scripts.store import TABLE, build_where, connect, quote
+
+# Every dimension the app.py charts group by; () is the grand total used by the KPI row.
+APP_GROUPINGS = [
+    (),
+    ('Product type',),
+    ('Inspection results',),
+    ('Supplier name',),
+    ('Transportation modes',),
+    ('Routes',),
+    ('Shipping carriers',),
+    ('Location',),
+]
+
+# Columns of the "Cost and Revenue Correlations" heatmap.
+CORRELATION_COLUMNS = ['Manufacturing costs', 'Shipping costs', 'Costs', 'Revenue generated']
+
+# app.py KPIs and charts: measure name -> registry metric (scripts/metrics.py)
+APP_METRICS = {
+    'total_revenue': 'total_revenue',
+    'stock_levels': 'total_stock',
+    'lead_times': 'total_lead_times',
+    'total_orders': 'total_orders',
+    'total_availability': 'total_availability',
+    'total_manufacturing_costs': 'total_manufacturing_costs',
+    'total_products_sold': 'total_products_sold',
+    'total_shipping_costs': 'total_shipping_costs',
+    'total_manufacturing_lead_time': 'total_manufacturing_lead_time',
+    'total_price': 'total_price',
+    'total_production_volumes': 'total_production_volumes',
+    'avg_defect_rate': 'avg_defect_rate',
+    'avg_lead_time': 'avg_lead_time',
+    'row_count': 'order_count',
+}
+
+# The store keeps the CSV headers, so the registry's columns are mapped back to them
+APP_MEASURES = metrics.measures(APP_METRICS, columns=metrics.CSV_NAMES)
+for _i, _a in enumerate(CORRELATION_COLUMNS):
+    for _j, _b in enumerate(CORRELATION_COLUMNS[_i + 1:], start=_i + 1):
+        APP_MEASURES[f'corr_{_i}_{_j}'] = f'CORR("{_a}", "{_b}")'
+
+# Same idea for dashboard_app.py, which works on the processed snake_case columns.
+DASHBOARD_GROUPINGS = [
+    (),
+    ('product_type',),
+    ('location',),
+    ('location', 'product_type'),
+]
+
+DASHBOARD_METRICS = {
+    'total_revenue': 'total_revenue',
+    'lead_time': 'avg_delivery_time',
+    'delayed_shipments': 'delayed_shipments',
+    'delayed_shipment': 'delay_rate',
+    'delivery_ratio': 'avg_delivery_ratio',
+    'inventory_turnover': 'avg_inventory_turnover',
+    'avg_shipping_cost': 'avg_unit_shipping_cost',
+}
+
+DASHBOARD_MEASURES = metrics.measures(DASHBOARD_METRICS)
+
+
+def grouping_dimensions(groupings):
+    """Return the distinct dimensions used by the grouping sets, in first-seen order."""
+    dims = []
+    for grouping in groupings:
+        for dim in grouping:
+            if dim not in dims:
+                dims.append(dim)
+    return dims
+
+
+def grouping_id(grouping, dims):
+    """Return the GROUPING() bitmask DuckDB reports for a grouping set (1 = rolled up)."""
+    mask = 0
+    for dim in dims:
+        mask = (mask << 1) | (0 if dim in grouping else 1)
+    return mask
+
+
+def build_grouping_sets_query(table, groupings, measures, where=''):
+    """Build one GROUPING SETS query computing every measure for every grouping."""
+    dims = grouping_dimensions(groupings)
+    select = [quote(d) for d in dims]
+    if dims:
+        select.append(f"GROUPING({', '.join(quote(d) for d in dims)}) AS _grouping_id")
+    else:
+        select.append('0 AS _grouping_id')
+    select += [f'{expr} AS {quote(name)}' for name, expr in measures.items()]
+    sets = ', '.join('(' + ', '.join(quote(d) for d in g) + ')' for g in groupings)
+    query = f"SELECT {', '.join(select)}\nFROM {table}{where}"
+    if dims:
+        query += f'\nGROUP BY GROUPING SETS ({sets})'
+    return query
+
+
+def split_grouping_sets(result, groupings):
+    """Split a GROUPING SETS result into one frame per grouping, sorted like pandas groupby."""
+    dims = grouping_dimensions(groupings)
+    measure_cols = [c for c in result.columns if c not in dims and c != '_grouping_id']
+    frames = {}
+    for grouping in groupings:
+        part = result[result['_grouping_id'] == grouping_id(grouping, dims)]
+        part = part[list(grouping) + measure_cols]
+        if grouping:
+            part = part.sort_values(list(grouping))
+        frames[grouping] = part.reset_index(drop=True)
+    return frames
+
+
+def run_aggregates(con, table, groupings, measures, filters=None):
+    """Run the grouping-sets query on an open connection, filtering inside the scan."""
+    where, params = build_where(filters)
+    result = con.execute(build_grouping_sets_query(table, groupings, measures, where), params).df()
+    return split_grouping_sets(result, groupings)
+
+
+def compute_aggregates(df, groupings=APP_GROUPINGS, measures=APP_MEASURES, filters=None):
+    """Compute every grouping/measure pair in a single scan of df."""
+    con = duckdb.connect()
+    try:
+        # DuckDB scans Arrow string columns far faster than pandas object/str columns
+        con.register('source_df', pa.Table.from_pandas(df, preserve_index=False))
+        return run_aggregates(con, 'source_df', groupings, measures, filters)
+    finally:
+        con.close()
+
+
+def aggregate_store(db_path, filters=None, groupings=APP_GROUPINGS, measures=APP_MEASURES):
+    """Compute every grouping/measure pair directly against the DuckDB store."""
+    con = connect(db_path)
+    try:
+        return run_aggregates(con, TABLE, groupings, measures, filters)
+    finally:
+        con.close()
+
+
+def totals(aggregates):
+    """Return the grand-total row as a Series (NaN/0 safe for an empty selection)."""
+    total = aggregates[()]
+    if total.empty:
+        return pd.Series(dtype='float64')
+    return total.iloc[0].fillna(0)
+
+
+# app.py measure -> processed column it sums, for evaluating registry metrics on the totals
+APP_SUMS = {
+    'total_products_sold': 'number_of_products_sold',
+    'stock_levels': 'stock_levels',
+    'total_shipping_costs': 'shipping_costs',
+}
+
+
+def app_kpis(aggregates):
+    """Headline KPIs of app.py from its aggregates (0 for an empty selection)."""
+    kpis = totals(aggregates)
+    sums = {metrics.aggregate_key(metrics.Sum(metrics.Col(column))): kpis.get(measure, 0)
+            for measure, column in APP_SUMS.items()}
+    ratios = metrics.evaluate(['stock_turnover', 'shipping_cost_per_unit'], sums)
+    return {
+        'total_revenue': kpis.get('total_revenue', 0),
+        'total_orders': kpis.get('total_orders', 0),
+        'total_products_sold': kpis.get('total_products_sold', 0),
+        'stock_turnover': ratios['stock_turnover'] if pd.notna(ratios['stock_turnover']) else 0,
+        'shipping_cost_per_unit': ratios['shipping_cost_per_unit'] if pd.notna(ratios['shipping_cost_per_unit']) else 0,
+        'total_manufacturing_lead_time': kpis.get('total_manufacturing_lead_time', 0),
+        'avg_lead_time': kpis.get('avg_lead_time', 0),
+        'avg_defect_rate': kpis.get('avg_defect_rate', 0),
+        'row_count': kpis.get('row_count', 0),
+    }
+
+
+def dashboard_kpis(aggregates):
+    """Key metrics of dashboard_app.py from its aggregates (averages are NaN for an empty selection)."""
+    kpis = aggregates[()].iloc[0]
+    return {
+        'total_revenue': kpis['total_revenue'] if pd.notna(kpis['total_revenue']) else 0,
+        'avg_lead_time': kpis['lead_time'],
+        'delayed_shipments': int(kpis['delayed_shipments']) if pd.notna(kpis['delayed_shipments']) else 0,
+        'delivery_ratio': kpis['delivery_ratio'],
+        'avg_inventory_turnover': kpis['inventory_turnover'],
+        'avg_shipping_cost': kpis['avg_shipping_cost'],
+    }
+
+
+def correlation_matrix(aggregates, columns=CORRELATION_COLUMNS):
+    """Rebuild the correlation matrix from the CORR() measures of the grand total."""
+    row = aggregates[()].iloc[0] if not aggregates[()].empty else {}
+    matrix = pd.DataFrame(1.0, index=columns, columns=columns)
+    for i in range(len(columns)):
+        for j in range(i + 1, len(columns)):
+            value = row.get(f'corr_{i}_{j}', float('nan'))
+            matrix.iloc[i, j] = matrix.iloc[j, i] = value
+    return matrix
@@ -0,0 +1,307 @@
+# scripts/api.py
+"""Headless HTTP/JSON API for the dashboard KPIs and chart aggregations.
+
+Other teams can embed the numbers without running a Streamlit process per
+viewer. The app.py view runs its GROUPING SETS query on a pool of read-only
+connections to the store file, kept open between requests and reopened when
+the store version changes; they are closed while an ingester elsewhere holds
+the store's write lock, so ingestion is never locked out. The
+dashboard_app.py view comes from the same LiveProcessed cube the dashboard
+uses. Identical concurrent requests are coalesced onto one computation, and
+finished results go to a ResultCache keyed by store version.
+
+The API only reads: the store is built and appended to by its single owner
+(python -m scripts.store / scripts.ingest, or a dashboard's ingester).
+
+    python -m scripts.api [--port 8000] [--pool-size 4]
+
+    GET /health
+    GET /kpis/app?location=Mumbai&product_type=haircare
+    GET /kpis/dashboard?location=Delhi&location=Kolkata&from=2024-01-01&to=2024-03-31
+    GET /aggregations/{app|dashboard}?grouping=location
+    GET /stats
+"""
+import argparse
+import asyncio
+import json
+import math
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import Response
+from starlette.routing import Route
+
+from scripts.aggregations import APP_GROUPINGS, APP_MEASURES, app_kpis, dashboard_kpis, run_aggregates
+from scripts.filters import Range, filter_key
+from scripts.ingest import LiveProcessed
+from scripts.result_cache import ResultCache
+from scripts.schema import snake_case
+from scripts.store import DATE_COLUMN, DB_PATH, TABLE, connect, require_info, store_lock
+from scripts.timeseries import DATE_COLUMN as PROCESSED_DATE_COLUMN
+
+POOL_SIZE = 4
+WATCH_SECONDS = 0.5  # how often idle pooled connections check for a waiting ingester
+VERSION_TTL = 1.0  # seconds a store version check is trusted for
+
+# Query parameter (snake_case) -> filter column, per view
+VIEWS = {
+    'app': {snake_case(c): c for c in ['Product type', 'Location', 'Transportation modes']},
+    'dashboard': {c: c for c in ['location', 'product_type', 'shipping_carriers']},
+}
+DATE_COLUMNS = {'app': DATE_COLUMN, 'dashboard': PROCESSED_DATE_COLUMN}
+
+
+class StoreReaders:
+    """Pool of `size` read-only connections to the store file, handed out one per query.
+
+    A connection is opened on first use and kept open for later queries until
+    the store version moves on (refresh), when it is reopened. DuckDB lets a
+    writer open the file only once every reader has closed it, so while an
+    ingester in another process holds the store's write lock, connections are
+    closed as they come back (or, when idle, by a watcher thread) and queries
+    wait for the write to finish.
+    """
+
+    def __init__(self, db_path, size=POOL_SIZE):
+        self.db_path = db_path
+        self.size = size
+        self.lock = store_lock(db_path)
+        self.idle = queue.LifoQueue()  # (connection, version) or None for a slot with nothing open
+        for _ in range(size):
+            self.idle.put(None)
+        self.version = None
+        self.counters = {'queries': 0, 'opened': 0, 'closed': 0}
+        self.columns = None
+        threading.Thread(target=self._watch, daemon=True).start()
+
+    def _close(self, slot):
+        if slot is not None:
+            slot[0].close()
+            self.counters['closed'] += 1
+
+    def _watch(self):
+        while True:
+            time.sleep(WATCH_SECONDS)
+            if self.lock.writer_active():
+                self.close_idle()
+
+    def close_idle(self):
+        """Close the connections no query is using."""
+        slots = []
+        while True:
+            try:
+                slots.append(self.idle.get_nowait())
+            except queue.Empty:
+                break
+        for slot in slots:
+            self._close(slot)
+            self.idle.put(None)
+
+    def refresh(self, version):
+        """Reopen connections opened before `version` as they are next used; re-read the table columns."""
+        self.version = version
+        with self.cursor() as con:
+            self.columns = [row[0] for row in con.execute(f"DESCRIBE {TABLE}").fetchall()]
+
+    @contextmanager
+    def cursor(self):
+        slot = self.idle.get()
+        try:
+            if self.lock.writer_active():
+                self._close(slot)
+                slot = None
+                self.lock.writer_active(wait=True)
+            if slot is not None and slot[1] != self.version:
+                self._close(slot)
+                slot = None
+            if slot is None:
+                slot = (connect(self.db_path), self.version)
+                self.counters['opened'] += 1
+            self.counters['queries'] += 1
+            yield slot[0]
+        finally:
+            if slot is not None and self.lock.writer_active():
+                self._close(slot)
+                slot = None
+            self.idle.put(slot)
+
+    def stats(self):
+        open_now = sum(slot is not None for slot in list(self.idle.queue))
+        return {'size': self.size, 'idle_open': open_now, **self.counters}
+
+
+class Coalescer:
+    """Runs one computation per key at a time; concurrent callers with the same key share its result."""
+
+    def __init__(self):
+        self.inflight = {}
+        self.counters = {'computed': 0, 'coalesced': 0}
+
+    async def run(self, key, compute):
+        task = self.inflight.get(key)
+        if task is not None:
+            self.counters['coalesced'] += 1
+        else:
+            self.counters['computed'] += 1
+            task = asyncio.ensure_future(asyncio.to_thread(compute))
+            self.inflight[key] = task
+            task.add_done_callback(lambda _: self.inflight.pop(key, None))
+        # shield: a client hanging up must not cancel the computation other callers wait on
+        return await asyncio.shield(task)
+
+
+def jsonable(value):
+    """Plain JSON types for numpy/pandas values; NaN and NaT become null."""
+    if isinstance(value, dict):
+        return {str(k): jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [jsonable(v) for v in value]
+    if isinstance(value, pd.DataFrame):
+        return [jsonable(row) for row in value.to_dict('records')]
+    if isinstance(value, (pd.Timestamp, np.datetime64)):
+        return None if pd.isna(value) else pd.Timestamp(value).date().isoformat()
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+def grouping_name(grouping):
+    """'total' for the grand total, else the grouping columns joined by commas."""
+    return ','.join(grouping) if grouping else 'total'
+
+
+class KpiService:
+    """Shared state behind the API: store version, store readers, live dashboard cube, caches."""
+
+    def __init__(self, db_path=DB_PATH, pool_size=POOL_SIZE):
+        self.db_path = db_path
+        self.pool = StoreReaders(db_path, pool_size)
+        self.live = None
+        self.version = None
+        self.checked_at = 0.0
+        self.results = ResultCache()
+        self.coalescer = Coalescer()
+        self.lock = threading.Lock()
+
+    def current_version(self):
+        """Store version, re-read at most every VERSION_TTL seconds; refreshes the readers and cube on change."""
+        now = time.monotonic()
+        if now - self.checked_at < VERSION_TTL and self.version is not None:
+            return self.version
+        with self.lock:
+            if now - self.checked_at >= VERSION_TTL or self.version is None:
+                version = require_info(self.db_path)['ingested_at']
+                if version != self.pool.version:
+                    self.pool.refresh(version)
+                if self.live is None:
+                    self.live = LiveProcessed.from_store(self.db_path)
+                else:
+                    self.live.refresh(self.db_path)
+                self.version = version
+                self.checked_at = time.monotonic()
+        return self.version
+
+    def parse_filters(self, view, params):
+        """Filters for a view from query parameters (repeat a parameter to select several values)."""
+        if view not in VIEWS:
+            raise ValueError(f"Unknown view '{view}' (expected one of {sorted(VIEWS)})")
+        dims = VIEWS[view]
+        unknown = set(params.keys()) - set(dims) - {'from', 'to', 'grouping'}
+        if unknown:
+            raise ValueError(f"Unknown parameter(s) {sorted(unknown)} for view '{view}'")
+        filters = {dims[name]: params.getlist(name) for name in dims if name in params}
+        if 'from' in params or 'to' in params:
+            filters[DATE_COLUMNS[view]] = Range(pd.Timestamp(params.get('from', '1900-01-01')).date(),
+                                                pd.Timestamp(params.get('to', '2999-12-31')).date())
+        return filters
+
+    def _aggregates(self, view, filters):
+        if view == 'app':
+            if DATE_COLUMN in filters and DATE_COLUMN not in self.pool.columns:
+                raise ValueError(f"The store has no '{DATE_COLUMN}' column")
+            with self.pool.cursor() as cursor:
+                return run_aggregates(cursor, TABLE, APP_GROUPINGS, APP_MEASURES, filters)
+        if PROCESSED_DATE_COLUMN in filters:
+            if self.live.rollups is None:
+                raise ValueError(f"The store has no '{DATE_COLUMN}' column")
+            return self.live.rollups.lookup(filters)
+        return self.live.cube.lookup(filters)
+
+    async def aggregates(self, view, filters):
+        """Chart aggregations for a view and filters: cached, and coalesced across concurrent requests."""
+        version = await asyncio.to_thread(self.current_version)
+        key = (view, version, filter_key(filters))
+        return await self.coalescer.run(key, lambda: self.results.get_or_compute(
+            version, filters, f'api:{view}', lambda: self._aggregates(view, filters)))
+
+
+def json_response(payload, status=200):
+    return Response(json.dumps(jsonable(payload)), status_code=status, media_type='application/json')
+
+
+def create_app(service):
+    """Starlette app serving the KPI endpoints from `service`."""
+    def handler(endpoint):
+        async def handle(request):
+            try:
+                return json_response(await endpoint(request))
+            except ValueError as e:
+                return json_response({'error': str(e)}, status=400)
+        return handle
+
+    async def health(request):
+        version = await asyncio.to_thread(service.current_version)
+        return {'status': 'ok', 'version': version, 'rows': service.live.rows}
+
+    async def kpis(request):
+        view = request.path_params['view']
+        filters = service.parse_filters(view, request.query_params)
+        aggregates = await service.aggregates(view, filters)
+        return app_kpis(aggregates) if view == 'app' else dashboard_kpis(aggregates)
+
+    async def aggregations(request):
+        view = request.path_params['view']
+        filters = service.parse_filters(view, request.query_params)
+        aggregates = await service.aggregates(view, filters)
+        wanted = request.query_params.getlist('grouping')
+        frames = {grouping_name(g): frame for g, frame in aggregates.items()}
+        missing = set(wanted) - set(frames)
+        if missing:
+            raise ValueError(f"Unknown grouping(s) {sorted(missing)} (expected some of {sorted(frames)})")
+        return {name: frame for name, frame in frames.items() if not wanted or name in wanted}
+
+    async def stats(request):
+        return {'version': service.version, 'requests': service.coalescer.counters,
+                'result_cache': service.results.stats(), 'pool': service.pool.stats()}
+
+    return Starlette(routes=[
+        Route('/health', handler(health)),
+        Route('/kpis/{view}', handler(kpis)),
+        Route('/aggregations/{view}', handler(aggregations)),
+        Route('/stats', handler(stats)),
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the supply chain KPIs as HTTP/JSON')
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--pool-size', type=int, default=POOL_SIZE, help='Pooled read-only store connections')
+    args = parser.parse_args()
+
+    service = KpiService(args.db, args.pool_size)
+    service.current_version()  # load before accepting requests
+    uvicorn.run(create_app(service), host=args.host, port=args.port, log_level='warning')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+# scripts/chart_cache.py
+"""Pre-serialized Plotly chart payloads, shared by every dashboard session.
+
+On every rerun, st.plotly_chart converts the figure to a dict, validates it
+and serializes it to JSON, and the app rebuilds the figure before that (style
+updates, annotation and trace loops). Here the ready-to-send JSON spec is
+cached under (chart id, hash of the data drawn, theme). A hit skips both the
+figure build and the serialization: the cached spec is enqueued as-is. Set
+CHART_CACHE_DIR to also keep payloads on disk across restarts.
+
+Numeric arrays in a spec are binary-encoded: Plotly writes NumPy arrays as
+base64 typed arrays in to_dict(), but plain lists (go.Figure traces built from
+lists) stay JSON text. compact_arrays() encodes those too, and re-encodes
+whole-number float64 arrays (counts, rounded values) as the smallest integer
+type that holds them.
+"""
+import base64
+import hashlib
+import os
+
+import numpy as np
+import plotly.io as pio
+import streamlit as st
+from _plotly_utils.utils import to_typed_array_spec
+
+from scripts.live import input_signature
+from scripts.result_cache import ResultCache
+
+MAX_BYTES = 64 * 1024 ** 2
+CHART_CACHE_DIR = os.environ.get('CHART_CACHE_DIR')  # also keep payloads on disk, e.g. filled by scripts/warm.py
+MIN_ARRAY = 8  # shorter numeric lists are left as plain JSON
+
+
+def theme_key(*styles):
+    """Short fingerprint of the styling a chart is drawn with (plot_style, palette, ...)."""
+    return hashlib.sha1(repr(styles).encode()).hexdigest()[:12]
+
+
+def _numeric(values):
+    return all(isinstance(v, (int, float, np.integer, np.floating)) and not isinstance(v, bool) for v in values)
+
+
+def _decode(typed):
+    # Plotly's typed-array form: {'dtype': 'f8', 'bdata': base64, 'shape': 'rows, columns'}
+    values = np.frombuffer(base64.b64decode(typed['bdata']), dtype=typed['dtype'])
+    if 'shape' in typed:
+        values = values.reshape([int(n) for n in str(typed['shape']).split(',')])
+    return values
+
+
+def _whole(values):
+    # int64 is narrowed to int8/16/32 by to_typed_array_spec
+    if values.dtype.kind == 'f' and np.isfinite(values).all() and (values == np.round(values)).all() \
+            and np.abs(values).max() < 2 ** 31:
+        return values.astype('int64')
+    return values
+
+
+def compact_arrays(value):
+    """Typed-array specs for numeric lists and arrays; whole-number floats narrowed to the smallest int type."""
+    if isinstance(value, dict):
+        if value.keys() >= {'dtype', 'bdata'}:
+            if value['dtype'] != 'f8':
+                return value
+            value = _decode(value)
+        else:
+            return {k: compact_arrays(v) for k, v in value.items()}
+    elif isinstance(value, (list, tuple)):
+        if len(value) < MIN_ARRAY or not _numeric(value):
+            return [compact_arrays(v) for v in value]
+        array = _whole(np.asarray(value))
+        # Short decimals are smaller as JSON text than as float64 bytes; only integer lists are encoded
+        return to_typed_array_spec(array) if array.dtype.kind in 'iu' else value
+    if isinstance(value, np.ndarray) and value.dtype.kind in 'iuf' and value.size >= MIN_ARRAY:
+        return to_typed_array_spec(_whole(value))
+    return value
+
+
+def serialize(fig):
+    """The JSON spec st.plotly_chart would send for fig, with compact arrays."""
+    spec = fig.to_dict()
+    spec['data'] = [compact_arrays(trace) for trace in spec.get('data', [])]
+    return pio.to_json(spec, validate=False)
+
+
+class ChartPayloads:
+    """LRU cache of serialized chart specs keyed by (theme, chart id, data signature)."""
+
+    def __init__(self, name='charts', max_bytes=MAX_BYTES, disk_dir=CHART_CACHE_DIR):
+        # A theme change invalidates everything: it is the cache's "version". On disk each
+        # dashboard gets its own folder, so dashboards with different themes can share disk_dir
+        self.cache = ResultCache(max_bytes=max_bytes, ttl=None,
+                                 disk_dir=os.path.join(disk_dir, name) if disk_dir else None)
+
+    def payload(self, chart_id, inputs, theme, build):
+        """(spec, hit) for a chart; build() makes the figure on a miss."""
+        built = []
+
+        def compute():
+            built.append(True)
+            return serialize(build())
+
+        spec = self.cache.get_or_compute_key(theme, (chart_id, input_signature(inputs)), compute)
+        return spec, not built
+
+    def stats(self):
+        return self.cache.stats()
+
+
+# Set once the direct path fails, so later charts go straight to st.plotly_chart
+_direct_failed = False
+
+
+def send_spec(spec, use_container_width=True):
+    """Enqueue a serialized spec as a Plotly chart element in the current container.
+
+    Mirrors st.plotly_chart without selections through Streamlit internals,
+    checked against the version pinned in requirements.txt. If they have moved
+    (any error), it falls back to st.plotly_chart, which re-parses the spec.
+    """
+    global _direct_failed
+    if not _direct_failed:
+        try:
+            return _enqueue_spec(spec, use_container_width)
+        except Exception as e:
+            _direct_failed = True
+            print(f"Sending cached chart specs through st.plotly_chart instead: {e!r}")
+    return st.plotly_chart(pio.from_json(spec), width='stretch' if use_container_width else 'content')
+
+
+def _enqueue_spec(spec, use_container_width):
+    from streamlit.elements.lib.form_utils import current_form_id
+    from streamlit.elements.lib.layout_utils import LayoutConfig
+    from streamlit.elements.lib.utils import compute_and_register_element_id
+    from streamlit.proto.PlotlyChart_pb2 import PlotlyChart as PlotlyChartProto
+
+    dg = st._main
+    proto = PlotlyChartProto()
+    proto.theme = 'streamlit'
+    proto.form_id = current_form_id(dg)
+    proto.spec = spec
+    proto.config = '{}'
+    width = 'stretch' if use_container_width else 'content'
+    # The app's figures set no layout size, so "content" resolves to Plotly's 700 x 450 defaults
+    layout = LayoutConfig(width='stretch' if use_container_width else 700, height=450)
+    # Registered last before enqueueing, so a failure above leaves no id behind for the fallback to clash with
+    proto.id = compute_and_register_element_id(
+        'plotly_chart', user_key=None, key_as_main_identity=False, dg=dg, plotly_spec=spec,
+        plotly_config=proto.config, selection_mode=('points', 'box', 'lasso'), is_selection_activated=False,
+        theme='streamlit', width=width, height='content', alt=None)
+    return dg._enqueue('plotly_chart', proto, layout_config=layout)
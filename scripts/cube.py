@@ -0,0 +1,327 @@
+# scripts/cube.py
+"""Materialized OLAP cube over the sidebar filter dimensions.
+
+Every chart grouping is aggregated once for every subset of the filter
+dimensions (CUBE-style, so the 'All' rollups are stored too) using only
+additive measures: row counts, sums and sums of squares/cross products. A
+filter change is then a dictionary lookup, multi-value filters are a sum over
+a handful of cells, and new rows are folded in by aggregating just those rows
+and adding their cells to the existing ones.
+"""
+import threading
+from itertools import combinations
+
+import duckdb
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from scripts import metrics
+from scripts.aggregations import (APP_GROUPINGS, APP_METRICS, CORRELATION_COLUMNS, DASHBOARD_GROUPINGS,
+                                  DASHBOARD_METRICS, build_grouping_sets_query, grouping_dimensions, grouping_id)
+from scripts.result_cache import ResultCache
+from scripts.store import TABLE, connect, quote, require_info
+from scripts.warm import load_state, save_state, snapshot_path
+
+# app.py: selectbox filters and the registry metrics behind its KPIs and charts. Metrics
+# are stored as their additive aggregates (metrics.aggregates_of) and evaluated at lookup;
+# `columns` maps the registry's snake_case names to the table's columns.
+APP_CUBE = {
+    'dimensions': ['Product type', 'Location', 'Transportation modes'],
+    'groupings': APP_GROUPINGS,
+    'metrics': APP_METRICS,
+    'group_metrics': {},
+    'columns': metrics.CSV_NAMES,
+    'variances': {},
+    'correlations': CORRELATION_COLUMNS,
+}
+
+# dashboard_app.py: multiselect filters over the processed columns. Every row carries its
+# location's delivery_ratio (over all rows), so the cube keeps that metric's per-location
+# aggregates instead of the row column and averages it over a selection at lookup
+# (group_metrics: output -> (dimension, metric)); new rows never re-derive old ones.
+DASHBOARD_CUBE = {
+    'dimensions': ['location', 'product_type', 'shipping_carriers'],
+    'groupings': DASHBOARD_GROUPINGS,
+    'metrics': {name: metric for name, metric in DASHBOARD_METRICS.items() if name != 'delivery_ratio'},
+    'group_metrics': {'delivery_ratio': ('location', 'delivery_ratio')},
+    'columns': None,
+    'variances': {},
+    'correlations': [],
+}
+
+
+def additive_measures(config):
+    """The additive SQL measures a cube config needs (count, metric aggregates, squares, cross products)."""
+    measures = {'n': 'COUNT(*)'}
+    needed = list(config['metrics'].values()) + [metric for _, metric in config['group_metrics'].values()]
+    for key, node in metrics.aggregates_of(needed).items():
+        measures[key] = f"({metrics.to_sql(node, columns=config['columns'])})::DOUBLE"
+    for column in dict.fromkeys(list(config['variances'].values()) + list(config['correlations'])):
+        measures[f'sum:{column}'] = f'SUM({quote(column)})::DOUBLE'
+        measures[f'sumsq:{column}'] = f'SUM({quote(column)}::DOUBLE * {quote(column)})'
+    for a, b in combinations(config['correlations'], 2):
+        measures[f'sumxy:{a}:{b}'] = f'SUM({quote(a)}::DOUBLE * {quote(b)})'
+    return measures
+
+
+def cell_set(config, filtered, grouping):
+    """Canonical grouping set for a chart grouping under a set of filtered dimensions."""
+    dims = config['dimensions']
+    return (tuple(d for d in dims if d in filtered or d in grouping)
+            + tuple(d for d in grouping if d not in dims))
+
+
+def cube_grouping_sets(config):
+    """Every chart grouping combined with every subset of the filter dimensions."""
+    sets = []
+    dims = config['dimensions']
+    for grouping in config['groupings']:
+        for size in range(len(dims) + 1):
+            for subset in combinations(dims, size):
+                cell = cell_set(config, subset, grouping)
+                if cell not in sets:
+                    sets.append(cell)
+    return sets
+
+
+def finalize(cells, config, grouping):
+    """Turn additive cells into the measure names aggregations.py produces."""
+    def col(name):
+        return cells[name].to_numpy(dtype='float64')
+
+    out = {d: cells[d].to_numpy() for d in grouping}
+    n = col('n')
+    values = metrics.evaluate(config['metrics'], cells)
+    for name, metric in config['metrics'].items():
+        counts_rows = isinstance(metrics.METRICS[metric].formula, metrics.Count)
+        out[name] = values[name].to_numpy(dtype='int64' if counts_rows else 'float64')
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for name, column in config['variances'].items():
+            s, sq = col(f'sum:{column}'), col(f'sumsq:{column}')
+            out[name] = np.where(n > 1, (sq - s * s / n) / (n - 1), np.nan)
+        correlations = config['correlations']
+        for i, j in combinations(range(len(correlations)), 2):
+            a, b = correlations[i], correlations[j]
+            sa, sb = col(f'sum:{a}'), col(f'sum:{b}')
+            cov = n * col(f'sumxy:{a}:{b}') - sa * sb
+            var_a = n * col(f'sumsq:{a}') - sa * sa
+            var_b = n * col(f'sumsq:{b}') - sb * sb
+            out[f'corr_{i}_{j}'] = cov / np.sqrt(var_a * var_b)
+    return pd.DataFrame(out)
+
+
+def group_metric(frame, split, totals, dim, metric, grouping):
+    """A per-`dim` metric averaged over a selection's rows, for each row of a finalized frame.
+
+    The metric is evaluated per `dim` value on `totals` (cells over every
+    row); `split` holds the selection's cells per grouping and `dim` value,
+    whose row counts weight those values. This is AVG over the rows of a
+    column holding each row's group value, without storing the column.
+    """
+    values = metrics.evaluate([metric], totals)[metric] if totals is not None else pd.Series(dtype='float64')
+    per_value = pd.Series(values.to_numpy(), index=pd.Index(totals[dim] if totals is not None else [], dtype=object))
+    ratio = per_value.reindex(split[dim].astype(object)).to_numpy(dtype='float64')
+    n = split['n'].to_numpy(dtype='float64')
+    known = ~np.isnan(ratio)
+    weighted = pd.DataFrame({'sum': np.where(known, n * ratio, 0.0), 'n': np.where(known, n, 0.0)})
+    if grouping:
+        for d in grouping:
+            weighted[d] = split[d].to_numpy()
+        weighted = weighted.groupby(list(grouping), sort=False)[['sum', 'n']].sum()
+        weighted = weighted.reindex(frame.set_index(list(grouping)).index)
+    else:
+        weighted = weighted[['sum', 'n']].sum().to_frame().T
+    total, count = weighted['sum'].to_numpy(dtype='float64'), weighted['n'].to_numpy(dtype='float64')
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(count > 0, total / count, np.nan)
+
+
+class Cube:
+    """Additive cells for every filter combination, with O(1) lookup and incremental refresh."""
+
+    def __init__(self, config):
+        self.config = config
+        unknown = [dim for dim, _ in config['group_metrics'].values() if dim not in config['dimensions']]
+        if unknown:
+            raise ValueError(f"Group metric dimension(s) {unknown} are not cube dimensions")
+        self.sets = cube_grouping_sets(config)
+        self.dims = grouping_dimensions(self.sets)
+        self.measures = additive_measures(config)
+        self.cells = None
+        self.index = {}
+        self.results = ResultCache()
+        self.generation = 0  # bumped by every merge; the version results are cached under
+        self.built_at = None
+        self.version = None
+        self.watermark = 0
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        # Locks do not pickle; cached results and the index are rebuilt from the cells
+        return dict(self.__dict__, lock=None, results=None, index={})
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+        self.results = ResultCache()
+        if self.cells is not None:
+            self._reindex()
+
+    @classmethod
+    def from_store(cls, db_path, config=APP_CUBE, snapshot_dir=None, name='app_cube'):
+        """Build the cube from the DuckDB store, starting from a snapshot of the same store build if there is one."""
+        cube = load_state(snapshot_path(snapshot_dir, name), db_path) if snapshot_dir else None
+        if cube is None or cube.config != config:
+            cube = cls(config)
+        cube.refresh(db_path)
+        return cube
+
+    def save(self, snapshot_dir, name='app_cube'):
+        """Snapshot the cube for from_store(snapshot_dir=...)."""
+        with self.lock:
+            save_state(snapshot_path(snapshot_dir, name), self.built_at, self)
+
+    @classmethod
+    def from_query(cls, con, table, config=DASHBOARD_CUBE):
+        """Build the cube from a table (or a query in parentheses) on an open DuckDB connection."""
+        cube = cls(config)
+        cube._merge(cube._aggregate(con, table))
+        return cube
+
+    def _aggregate(self, con, table, where='', params=None):
+        query = build_grouping_sets_query(table, self.sets, self.measures, where)
+        cells = con.execute(query, params or []).df()
+        for dim in self.dims:
+            cells[dim] = cells[dim].astype(object).where(cells[dim].notna(), None)
+        return cells
+
+    def _merge(self, delta):
+        if self.cells is None or self.cells.empty:
+            self.cells = delta
+        elif not delta.empty:
+            keys = self.dims + ['_grouping_id']
+            merged = pd.concat([self.cells, delta], ignore_index=True)
+            merged = merged.groupby(keys, dropna=False, sort=False).sum().reset_index()
+            # Cells whose rows were all retracted
+            self.cells = merged[merged['n'] != 0].reset_index(drop=True)
+        self._reindex()
+        self.generation += 1
+
+    def _reindex(self):
+        """Index cells by (grouping set, filtered dimensions, their values).
+
+        A set such as ('Product type',) answers both "grouped by product type"
+        and "filtered to one product type", so it is indexed once per subset of
+        its filter dimensions.
+        """
+        index = {}
+        for cells in self.sets:
+            part = self.cells[self.cells['_grouping_id'] == grouping_id(cells, self.dims)]
+            filter_dims = [d for d in cells if d in self.config['dimensions']]
+            for size in range(len(filter_dims) + 1):
+                for filtered in combinations(filter_dims, size):
+                    if not filtered:
+                        index[(cells, (), ())] = part
+                        continue
+                    for key, rows in part.groupby(list(filtered), sort=False):
+                        index[(cells, filtered, key)] = rows
+        self.index = index  # swapped whole: lock-free lookups never see a half-built index
+
+    def _delta(self, df, retract=False):
+        con = duckdb.connect()
+        try:
+            con.register('batch_df', pa.Table.from_pandas(df, preserve_index=False))
+            delta = self._aggregate(con, 'batch_df')
+        finally:
+            con.close()
+        if retract:
+            delta[list(self.measures)] = -delta[list(self.measures)]
+        return delta
+
+    def apply(self, df, retract=False):
+        """Fold a batch of new rows into the cube, or with retract=True take them back out."""
+        delta = self._delta(df, retract)
+        with self.lock:
+            self._merge(delta)
+
+    def update(self, old, new):
+        """Take rows' old versions out and fold their new versions (and any new rows) in, in one merge."""
+        delta = pd.concat([self._delta(old, retract=True), self._delta(new)], ignore_index=True)
+        with self.lock:
+            self._merge(delta)
+
+    def refresh(self, db_path):
+        """Catch up with the store: fold in appended rows, or rebuild after a rewrite; returns the store version."""
+        info = require_info(db_path)
+        if info['ingested_at'] == self.version:
+            return self.version
+        with self.lock:
+            con = connect(db_path)
+            try:
+                if info['built_at'] != self.built_at:
+                    self.cells, self.watermark = None, 0
+                high = con.execute(f"SELECT COALESCE(MAX(rowid) + 1, 0) FROM {TABLE}").fetchone()[0]
+                if high > self.watermark:
+                    delta = self._aggregate(con, TABLE, ' WHERE rowid >= ? AND rowid < ?', [self.watermark, high])
+                    self._merge(delta)
+                elif self.cells is None:
+                    self._merge(self._aggregate(con, TABLE, ' WHERE FALSE'))
+            finally:
+                con.close()
+            self.watermark = high
+            self.built_at = info['built_at']
+            self.version = info['ingested_at']
+        return self.version
+
+    def lookup(self, filters=None):
+        """Aggregates for a filter selection, shaped like aggregations.compute_aggregates().
+
+        Results are cached per selection (LRU, memory-bounded) until the next merge;
+        treat them as read-only.
+        """
+        filters = {d: v for d, v in (filters or {}).items() if v is not None}
+        unknown = set(filters) - set(self.config['dimensions'])
+        if unknown:
+            raise ValueError(f"Cube has no dimension(s) {sorted(unknown)}")
+        filtered_dims = [d for d in self.config['dimensions'] if d in filters]
+        choices = [list(filters[d]) if isinstance(filters[d], (list, tuple, set)) else [filters[d]]
+                   for d in filtered_dims]
+        selection = dict(zip(filtered_dims, choices))
+        return self.results.get_or_compute(self.generation, selection, 'lookup',
+                                           lambda: self._lookup(filtered_dims, choices))
+
+    def _parts(self, filtered_dims, keys, grouping, split=()):
+        """Indexed cells of a grouping under the selection, also kept apart by the `split` dimensions."""
+        cells_key = cell_set(self.config, list(filtered_dims) + list(split), grouping)
+        index_keys = [(cells_key, tuple(filtered_dims), key) for key in keys]
+        return [self.index[k] for k in index_keys if k in self.index]
+
+    def _lookup(self, filtered_dims, choices):
+        keys = list(pd.MultiIndex.from_product(choices)) if filtered_dims else [()]
+        measure_cols = list(self.measures)
+        frames = {}
+        for grouping in self.config['groupings']:
+            parts = self._parts(filtered_dims, keys, grouping)
+            if len(parts) == 1 and grouping:
+                # One cell group already holds one row per chart category
+                cells = parts[0].sort_values(list(grouping))
+            elif parts:
+                cells = pd.concat(parts, ignore_index=True)
+                if grouping:
+                    cells = cells.groupby(list(grouping), sort=True)[measure_cols].sum().reset_index()
+                else:
+                    cells = cells[measure_cols].sum().to_frame().T
+            elif grouping:
+                cells = pd.DataFrame(columns=list(grouping) + measure_cols)
+            else:
+                cells = pd.DataFrame([{m: 0 for m in measure_cols}])
+            frame = finalize(cells, self.config, grouping)
+            for name, (dim, metric) in self.config['group_metrics'].items():
+                split = self._parts(filtered_dims, keys, grouping, [dim])
+                split = (pd.concat(split, ignore_index=True) if split
+                         else pd.DataFrame(columns=list(dict.fromkeys(list(grouping) + [dim] + measure_cols))))
+                totals = self.index.get((cell_set(self.config, [dim], ()), (), ()))
+                frame[name] = group_metric(frame, split, totals, dim, metric, grouping)
+            frames[grouping] = frame
+        return frames
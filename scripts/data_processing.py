@@ -1,58 +1,261 @@
 # scripts/data_processing.py
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+from scripts import metrics
+from scripts.formats import iter_frames, open_writer, read_frame, write_frame
+from scripts.schema import apply_schema, read_csv, snake_case
+from scripts.store import DB_PATH, TABLE, build_where, connect, quote, read_table, iter_batches
+
+# Values clean_data fills missing numbers with; lead_times gets the median instead
+FILL_VALUES = {
+    'price': 0,
+    'availability': 0,
+    'number_of_products_sold': 0,
+    'revenue_generated': 0,
+    'stock_levels': 0,
+    'shipping_costs': 0,
+    'manufacturing_costs': 0,
+    'defect_rates': 0
+}
 
 def load_data(file_path):
-    df = pd.read_csv(file_path)
+    # A DuckDB store (see scripts/store.py) is read columnar; anything else is a CSV
+    if file_path.endswith('.duckdb'):
+        return read_table(file_path)
+    # Parquet / Arrow IPC hand-off files are memory-mapped
+    if file_path.endswith(('.parquet', '.arrow', '.feather')):
+        return read_frame(file_path)
+    # Categoricals and narrow integers from the canonical schema, validated
+    df = read_csv(file_path)
     return df
 
-def clean_data(df):
+def load_chunks(file_path, chunksize):
+    # Same sources as load_data, yielded as DataFrames of at most chunksize rows
+    if file_path.endswith('.duckdb'):
+        return iter_batches(file_path, chunksize)
+    if file_path.endswith(('.parquet', '.arrow', '.feather')):
+        return iter_frames(file_path, chunksize)
+    # Numerics only: per-chunk categoricals would each get their own category set
+    return (apply_schema(chunk, categorical=False) for chunk in pd.read_csv(file_path, chunksize=chunksize))
+
+def normalize_columns(df):
     # Rename columns to snake_case if needed
     df.columns = [col.strip().lower().replace(' ', '_') for col in df.columns]
+    return df
 
-    # Handle missing values
-    df.fillna({
-        'price': 0,
-        'availability': 0,
-        'number_of_products_sold': 0,
-        'revenue_generated': 0,
-        'stock_levels': 0,
-        'lead_times': df['lead_times'].median() if 'lead_times' in df.columns else 0,
-        'shipping_costs': 0,
-        'manufacturing_costs': 0,
-        'defect_rates': 0
-    }, inplace=True)
+def clean_data(df, lead_times_median=None):
+    normalize_columns(df)
+
+    # Handle missing values (streaming passes in the median of the whole input)
+    if lead_times_median is None:
+        lead_times_median = df['lead_times'].median() if 'lead_times' in df.columns else 0
+    df.fillna(dict(FILL_VALUES, lead_times=lead_times_median), inplace=True)
 
     return df
 
-def add_calculated_fields(df):
+def add_calculated_fields(df, group_stats=None):
     # Total revenue = revenue_generated
     df['total_revenue'] = df['revenue_generated']
 
     # Delayed shipments (lead_time > 7 days)
-    df['delayed_shipment'] = np.where(df['lead_time'] > 7, 1, 0)
+    df['delayed_shipment'] = metrics.row_values(metrics.DELAYED, df).astype('int8')
 
-    # On-time delivery ratio by region/location
-    df['delivery_ratio'] = df.groupby('location')['delayed_shipment'].transform(lambda x: 1 - x.mean())
+    # Group-dependent fields come from group_stats when df is only part of the data
+    if group_stats is None:
+        # On-time delivery ratio by region/location
+        df['delivery_ratio'] = 1 - df.groupby('location')['delayed_shipment'].transform('mean')
 
-    # Inventory turnover = number_of_products_sold / average stock
-    df['inventory_turnover'] = df['number_of_products_sold'] / df.groupby('sku')['stock_levels'].transform('mean')
+        # Inventory turnover = number_of_products_sold / average stock
+        df['inventory_turnover'] = df['number_of_products_sold'] / df.groupby('sku')['stock_levels'].transform('mean')
+    else:
+        df['delivery_ratio'] = group_stats['delivery_ratio'].reindex(df['location']).to_numpy()
+        df['inventory_turnover'] = df['number_of_products_sold'] / group_stats['mean_stock'].reindex(df['sku']).to_numpy()
 
     # Average shipping cost per unit
     df['avg_shipping_cost'] = df['shipping_costs'] / df['order_quantities']
 
     return df
 
+def cleaned_query(columns, table=TABLE, where=''):
+    # clean_data as one DuckDB query over the store's `columns` (CSV names): snake_case names,
+    # missing values filled, lead_times with the median of every stored row whatever `where` keeps
+    select = []
+    for column in columns:
+        name, value = snake_case(column), quote(column)
+        if name == 'lead_times':
+            value = f"COALESCE({value}, (SELECT median({value}) FROM {table}))"
+        elif name in FILL_VALUES:
+            value = f"COALESCE({value}, {FILL_VALUES[name]!r})"
+        select.append(f"{value} AS {quote(name)}")
+    return f"SELECT {', '.join(select)} FROM {table}{where}"
+
+def processed_query(columns, table=TABLE):
+    # add_calculated_fields over cleaned_query for the whole store; delivery_ratio and
+    # inventory_turnover are window averages over every row of the location / SKU
+    delayed = metrics.to_sql(metrics.DELAYED)
+    return (f"SELECT *, revenue_generated AS total_revenue, ({delayed})::TINYINT AS delayed_shipment, "
+            f"1 - AVG({delayed}) OVER (PARTITION BY location) AS delivery_ratio, "
+            f"number_of_products_sold / AVG(stock_levels) OVER (PARTITION BY sku) AS inventory_turnover, "
+            f"shipping_costs / order_quantities AS avg_shipping_cost "
+            f"FROM ({cleaned_query(columns, table)}) AS cleaned")
+
+def read_processed(db_path=DB_PATH, columns=None, filters=None):
+    # Processed rows derived by DuckDB from the store; columns and filters use processed names.
+    # When only cleaned columns are asked for, the filters go into the store scan; the group
+    # fields need every row of their location / SKU, so with those the derived rows are filtered
+    con = connect(db_path)
+    try:
+        stored = [row[0] for row in con.execute(f"DESCRIBE {TABLE}").fetchall()]
+        names = {snake_case(column): column for column in stored}
+        if columns and all(c in names for c in columns):
+            where, params = build_where({names.get(c, c): v for c, v in (filters or {}).items()})
+            query = cleaned_query([names[c] for c in columns], where=where)
+        else:
+            select = ', '.join(quote(c) for c in columns) if columns else '*'
+            where, params = build_where(filters)
+            query = f"SELECT {select} FROM ({processed_query(stored)}) AS processed{where}"
+        return con.execute(query, params).to_arrow_table().to_pandas(date_as_object=False)
+    finally:
+        con.close()
+
 def save_processed_data(df, output_path):
-    df.to_excel(output_path, index=False)
+    # Format follows the extension: .parquet (default), .arrow, .xlsx or .csv
+    write_frame(df, output_path)
     print(f"Processed data saved to {output_path}")
 
-def run_pipeline(input_csv, output_excel):
-    df = load_data(input_csv)
+def group_partials(df):
+    # Mergeable partial aggregates behind delivery_ratio (per location) and inventory_turnover (per SKU)
+    return {
+        'location': metrics.base_aggregates(df, ['delivery_ratio'], ['location']),
+        'sku': metrics.base_aggregates(df, ['avg_stock'], ['sku']),
+    }
+
+def query_partials(con, table):
+    # group_partials computed by DuckDB over cleaned rows (a table, or a query in parentheses)
+    return {
+        'location': metrics.query_base_aggregates(con, ['delivery_ratio'], ['location'], table),
+        'sku': metrics.query_base_aggregates(con, ['avg_stock'], ['sku'], table),
+    }
+
+def merge_partials(total, part):
+    if total is None:
+        return part
+    return {key: total[key].add(part[key], fill_value=0) for key in total}
+
+def finalize_partials(partials):
+    return {
+        'delivery_ratio': metrics.evaluate(['delivery_ratio'], partials['location'])['delivery_ratio'],
+        'mean_stock': metrics.evaluate(['avg_stock'], partials['sku'])['avg_stock'],
+    }
+
+def median_from_counts(counts):
+    # Exact median from a value histogram (matches Series.median on the full column)
+    counts = counts.sort_index()
+    total = counts.sum()
+    if total == 0:
+        return np.nan
+    cumulative = counts.cumsum().to_numpy()
+    low = counts.index[np.searchsorted(cumulative, (total + 1) // 2)]
+    high = counts.index[np.searchsorted(cumulative, total // 2 + 1)]
+    return (low + high) / 2
+
+def run_pipeline_streaming(input_path, output_path, chunksize=100_000):
+    # Pass 1: whole-input statistics, merged chunk by chunk
+    partials, lead_time_counts, null_columns = None, None, set()
+    for chunk in load_chunks(input_path, chunksize):
+        normalize_columns(chunk)
+        null_columns |= set(chunk.columns[chunk.isna().any()])
+        if 'lead_times' in chunk.columns:
+            counts = chunk['lead_times'].value_counts()
+            lead_time_counts = counts if lead_time_counts is None else lead_time_counts.add(counts, fill_value=0)
+        chunk = clean_data(chunk, lead_times_median=0)
+        partials = merge_partials(partials, group_partials(chunk))
+
+    if partials is None:
+        print(f"No rows in {input_path}")
+        return output_path
+    lead_times_median = median_from_counts(lead_time_counts) if lead_time_counts is not None else 0
+    group_stats = finalize_partials(partials)
+    # A column with a missing value anywhere is float64 in the in-memory pipeline
+    float_columns = null_columns | ({'total_revenue'} if 'revenue_generated' in null_columns else set())
+
+    # Pass 2: derive each chunk and append it to the Parquet / Arrow IPC file
+    writer, rows = None, 0
+    try:
+        for chunk in load_chunks(input_path, chunksize):
+            chunk = clean_data(chunk, lead_times_median)
+            chunk = add_calculated_fields(chunk, group_stats)
+            for column in float_columns:
+                if pd.api.types.is_integer_dtype(chunk[column]):
+                    chunk[column] = chunk[column].astype('float64')
+            table = pa.Table.from_pandas(chunk, preserve_index=False, schema=writer.schema if writer else None)
+            if writer is None:
+                writer = open_writer(output_path, table.schema)
+            writer.write_table(table)
+            rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    print(f"Processed {rows} rows in chunks of {chunksize}; saved to {output_path}")
+    return output_path
+
+def _process_partition(args):
+    # Worker: clean and derive one SKU partition; SKUs never span partitions, so the
+    # per-SKU mean is exact here and only the per-location partials go back to the parent
+    part, lead_times_median = args
+    part = clean_data(part, lead_times_median)
+    partials = group_partials(part)
+    group_stats = {
+        'delivery_ratio': pd.Series(dtype='float64'),  # filled in by the parent
+        'mean_stock': finalize_partials(partials)['mean_stock'],
+    }
+    return add_calculated_fields(part, group_stats), partials['location']
+
+def process_data_parallel(df, workers):
+    normalize_columns(df)
+    lead_times_median = df['lead_times'].median() if 'lead_times' in df.columns else 0
+
+    # Hash-partition by SKU so every SKU lands in exactly one partition
+    partition_ids = pd.util.hash_pandas_object(df['sku'], index=False).to_numpy() % workers
+    partitions = [df[partition_ids == i] for i in range(workers)]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(_process_partition, [(part, lead_times_median) for part in partitions]))
+
+    # Merge in partition order and restore the input row order, so output is deterministic
+    location = None
+    for _, part_location in results:
+        location = part_location if location is None else location.add(part_location, fill_value=0)
+    df = pd.concat([part for part, _ in results]).sort_index(kind='stable')
+    delivery_ratio = metrics.evaluate(['delivery_ratio'], location)['delivery_ratio']
+    df['delivery_ratio'] = delivery_ratio.reindex(df['location']).to_numpy()
+    return df
+
+def process_data(df, workers=None):
+    # Clean and derive in memory, on one core or across a process pool
+    if workers and workers > 1:
+        return process_data_parallel(df, workers)
     df = clean_data(df)
-    df = add_calculated_fields(df)
-    save_processed_data(df, output_excel)
+    return add_calculated_fields(df)
+
+def run_pipeline(input_csv, output_path='data/processed_data.parquet', chunksize=None, workers=None):
+    # With a chunksize, stream in bounded memory to Parquet/Arrow and return the output path
+    if chunksize:
+        return run_pipeline_streaming(input_csv, output_path, chunksize)
+    df = load_data(input_csv)
+    df = process_data(df, workers)
+    save_processed_data(df, output_path)
     return df
 
 if __name__ == "__main__":
-    run_pipeline('data/supply_chain.csv', 'data/processed_data.xlsx')
+    parser = argparse.ArgumentParser(description="Clean the supply chain data and add calculated fields")
+    parser.add_argument('input', nargs='?', default='data/supply_chain.csv')
+    parser.add_argument('output', nargs='?', default='data/processed_data.parquet',
+                        help='.parquet (default), .arrow, .xlsx or .csv')
+    parser.add_argument('--chunksize', type=int, help='Stream the input in chunks of this many rows (Parquet/Arrow output)')
+    parser.add_argument('--workers', type=int, help='Derive fields across this many processes')
+    args = parser.parse_args()
+    run_pipeline(args.input, args.output, args.chunksize, args.workers)
@@ -1,14 +1,37 @@
 # scripts/db_operations.py
+import argparse
+import hashlib
+import json
+import os
+import queue
+import re
 import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
+import pyarrow as pa
+from scripts import metrics
+from scripts.formats import extension, open_writer, read_frame
+from scripts.schema import apply_schema, sqlite_columns
 
 DB_FILE = 'data/supply_chain.db'  # SQLite database file
+BATCH_SIZE = 10_000  # rows per executemany batch
+QUERIES_FILE = 'sql/queries.sql'
+INDEX_PREFIX = 'ix_supply_chain__'  # indexes owned by create_indexes()
+MAX_INDEX_COLUMNS = 8  # wider reports are left to scan (and flagged by explain_queries)
+REPORTS_DIR = 'data/reports'  # run_queries() output, one file per named query
 
 def create_connection(db_file=DB_FILE):
     """Create a database connection to SQLite."""
     conn = None
     try:
         conn = sqlite3.connect(db_file)
+        # WAL lets readers (Tableau, reports) run during loads; NORMAL sync is safe with WAL
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA cache_size=-65536")  # 64 MB page cache
+        conn.execute("PRAGMA temp_store=MEMORY")
         print(f"Connected to database: {db_file}")
     except Exception as e:
         print(f"Error connecting to database: {e}")
@@ -16,80 +39,346 @@ def create_connection(db_file=DB_FILE):
 
 def create_table(conn):
     """Create table if it doesn't exist."""
-    create_table_sql = """
+    # Column types come from the canonical schema (scripts/schema.py)
+    columns = ',\n'.join(f"        {name} {sql_type}{' PRIMARY KEY' if name == 'sku' else ''}"
+                          for name, sql_type in sqlite_columns())
+    create_table_sql = f"""
     CREATE TABLE IF NOT EXISTS supply_chain (
-        product_type TEXT,
+{columns}
+    );
+    """
+    # Content hash of every loaded row, so reloads only touch rows that changed
+    create_hashes_sql = """
+    CREATE TABLE IF NOT EXISTS supply_chain_hashes (
         sku TEXT PRIMARY KEY,
-        price REAL,
-        availability INTEGER,
-        number_of_products_sold INTEGER,
-        revenue_generated REAL,
-        customer_demographics TEXT,
-        stock_levels INTEGER,
-        lead_times INTEGER,
-        order_quantities INTEGER,
-        shipping_times INTEGER,
-        shipping_carriers TEXT,
-        shipping_costs REAL,
-        supplier_name TEXT,
-        location TEXT,
-        lead_time INTEGER,
-        production_volumes INTEGER,
-        manufacturing_lead_time INTEGER,
-        manufacturing_costs REAL,
-        inspection_results TEXT,
-        defect_rates REAL,
-        transportation_modes TEXT,
-        routes TEXT,
-        costs REAL,
-        total_revenue REAL,
-        delayed_shipment INTEGER,
-        delivery_ratio REAL,
-        inventory_turnover REAL,
-        avg_shipping_cost REAL
+        row_hash INTEGER
     );
     """
     try:
         c = conn.cursor()
         c.execute(create_table_sql)
+        c.execute(create_hashes_sql)
+        # Tables written by the old to_sql(if_exists='replace') loader lost the sku primary key
+        primary_key = [row[1] for row in c.execute("PRAGMA table_info(supply_chain)") if row[5]]
+        if primary_key != ['sku']:
+            c.execute("DROP TABLE supply_chain")
+            c.execute(create_table_sql)
+            c.execute("DELETE FROM supply_chain_hashes")
+            bump_version(conn)
+            print("Recreated 'supply_chain' with its sku primary key.")
         conn.commit()
         print("Table 'supply_chain' created successfully (if not exists).")
     except Exception as e:
         print(f"Error creating table: {e}")
 
-def insert_data(conn, df):
-    """Insert data from processed DataFrame into the database."""
+def table_version(conn):
+    """Version stamp of the supply_chain data, bumped by every load that changes it."""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def bump_version(conn):
+    # Seconds since the epoch, kept increasing, so a recreated database never reuses a stamp
+    version = max(table_version(conn) + 1, int(time.time()))
+    conn.execute(f"PRAGMA user_version = {version}")
+    return version
+
+def _row_batches(df, batch_size):
+    """Yield rows as tuples of Python values (NaN -> NULL), one batch at a time."""
+    for start in range(0, len(df), batch_size):
+        batch = df.iloc[start:start + batch_size].astype(object)
+        batch = batch.where(batch.notna(), None)
+        yield from batch.itertuples(index=False, name=None)
+
+def insert_data(conn, df, batch_size=BATCH_SIZE, delete_missing=True):
+    """Upsert new or changed rows (keyed on sku) in one transaction; return load stats."""
     try:
-        df.to_sql('supply_chain', conn, if_exists='replace', index=False)
-        print(f"Inserted {len(df)} rows into 'supply_chain' table.")
+        start = time.perf_counter()
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(supply_chain)") if row[1] in df.columns]
+        df = df[columns].drop_duplicates('sku', keep='last').reset_index(drop=True)
+        df['sku'] = df['sku'].astype(str)
+
+        # Compare content hashes with the previous load
+        hashes = pd.DataFrame({
+            'sku': df['sku'],
+            'row_hash': pd.util.hash_pandas_object(df, index=False).to_numpy().view('int64'),
+        })
+        previous = pd.read_sql_query("SELECT sku, row_hash FROM supply_chain_hashes", conn)
+        previous['row_hash'] = previous['row_hash'].astype('Int64')
+        state = hashes.merge(previous, on='sku', how='left', suffixes=('', '_previous'))
+        changed = (state['row_hash'] != state['row_hash_previous']).fillna(True).to_numpy(dtype=bool)
+        removed = previous.loc[~previous['sku'].isin(df['sku']), 'sku'].tolist() if delete_missing else []
+
+        names = ', '.join(columns)
+        updates = ', '.join(f'{c} = excluded.{c}' for c in columns if c != 'sku')
+        upsert_sql = (f"INSERT INTO supply_chain ({names}) VALUES ({', '.join('?' for _ in columns)}) "
+                      f"ON CONFLICT(sku) DO UPDATE SET {updates}")
+        with conn:
+            conn.executemany(upsert_sql, _row_batches(df[changed], batch_size))
+            conn.executemany(
+                "INSERT INTO supply_chain_hashes (sku, row_hash) VALUES (?, ?) "
+                "ON CONFLICT(sku) DO UPDATE SET row_hash = excluded.row_hash",
+                _row_batches(hashes[changed], batch_size),
+            )
+            conn.executemany("DELETE FROM supply_chain WHERE sku = ?", ((sku,) for sku in removed))
+            conn.executemany("DELETE FROM supply_chain_hashes WHERE sku = ?", ((sku,) for sku in removed))
+            if changed.any() or removed:
+                bump_version(conn)
+
+        elapsed = time.perf_counter() - start
+        stats = {
+            'upserted': int(changed.sum()),
+            'unchanged': int(len(df) - changed.sum()),
+            'deleted': len(removed),
+            'seconds': elapsed,
+            'rows_per_sec': len(df) / elapsed if elapsed > 0 else float('inf'),
+        }
+        print(f"Upserted {stats['upserted']} rows ({stats['unchanged']} unchanged, {stats['deleted']} deleted) "
+              f"into 'supply_chain' in {elapsed:.2f}s ({stats['rows_per_sec']:,.0f} rows/s).")
+        return stats
     except Exception as e:
         print(f"Error inserting data: {e}")
 
-def run_queries(conn, queries_file):
-    """Run SQL queries from a file (for Tableau or reports)."""
+def read_named_queries(queries_file=QUERIES_FILE):
+    """Split a .sql file into {name: statement}.
+
+    A statement is named after the last comment line before it ("-- Supplier
+    Performance" -> supplier_performance, parenthesised notes dropped); later
+    statements under the same heading get _2, _3, ...
+    """
+    with open(queries_file, 'r') as f:
+        text = f.read()
+    queries = {}
+    heading = 'query'
+    for chunk in text.split(';'):
+        lines = chunk.splitlines()
+        comments = [line.strip()[2:].strip() for line in lines if line.strip().startswith('--')]
+        query = '\n'.join(line for line in lines if not line.strip().startswith('--')).strip()
+        if comments:
+            heading = re.sub(r'\W+', '_', re.sub(r'\(.*?\)', '', comments[-1])).strip('_').lower() or heading
+        if not query:
+            continue
+        name, n = heading, 1
+        while name in queries:
+            n += 1
+            name = f'{heading}_{n}'
+        queries[name] = query
+    return queries
+
+def report_queries(queries_file=QUERIES_FILE):
+    """{name: statement} of every report: the queries of a .sql file, then the metric registry's REPORTS."""
+    return {**read_named_queries(queries_file), **metrics.report_queries('sqlite')}
+
+def table_columns(conn, table='supply_chain'):
+    """Column names of a table, in table order."""
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+# Keywords that end a WHERE, ON or GROUP BY clause
+CLAUSE_END = r'(?=\b(?:join|left|right|inner|outer|cross|on|using|where|group\s+by|having|order\s+by|limit|union)\b|$)'
+
+def query_columns(query, columns):
+    """Table columns a query filters on (WHERE), joins on (ON / USING) and groups by, in that order.
+
+    SELECT aliases (... AS total_cost) are output names, not columns, even when
+    a column has the same name.
+    """
+    aliases = {a.lower() for a in re.findall(r'\bas\s+(\w+)', query, re.I)}
+    clauses = (re.findall(r'\bwhere\b(.+?)' + CLAUSE_END, query, re.I | re.S)
+               + re.findall(r'\bon\b(.+?)' + CLAUSE_END, query, re.I | re.S)
+               + re.findall(r'\busing\s*\(([^)]*)\)', query, re.I)
+               + re.findall(r'\bgroup\s+by\b(.+?)' + CLAUSE_END, query, re.I | re.S))
+    return list(dict.fromkeys(t for clause in clauses for t in re.findall(r'\w+', clause.lower())
+                              if t in columns and t not in aliases))
+
+def advise_indexes(queries, columns, primary_key=('sku',)):
+    """One covering index per query: the columns it filters, joins and groups by (see query_columns)
+    first, then every other column it reads.
+
+    A query reading more than MAX_INDEX_COLUMNS columns gets none: that index
+    would be a second copy of the table to maintain on every load. An index on
+    the primary key alone duplicates its autoindex and is not advised either.
+    Returns [(index name, columns)]; an index that is a prefix of another one is dropped.
+    """
+    advised = []
+    for query in queries:
+        # Output names (... AS total_cost) are not columns, even when a column has the same name
+        text = re.sub(r'\bas\s+\w+', ' ', query, flags=re.I).lower()
+        read = [t for t in re.findall(r'\w+', text) if t in columns]
+        key = list(dict.fromkeys(query_columns(query, columns) + read))
+        if not key or len(key) > MAX_INDEX_COLUMNS or key == list(primary_key)[:len(key)]:
+            continue
+        if key not in advised:
+            advised.append(key)
+    advised = [k for k in advised if not any(o != k and o[:len(k)] == k for o in advised)]
+    return [(INDEX_PREFIX + '__'.join(k), k) for k in advised]
+
+def create_indexes(conn, queries_file=QUERIES_FILE):
+    """Create the advised covering indexes, drop ones no query needs any more, refresh statistics."""
+    try:
+        advised = advise_indexes(list(report_queries(queries_file).values()), table_columns(conn))
+        existing = {row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND name GLOB ?", (INDEX_PREFIX + '*',))}
+        wanted = {name for name, _ in advised}
+        with conn:
+            for name in sorted(existing - wanted):
+                conn.execute(f"DROP INDEX {name}")
+            for name, columns in advised:
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON supply_chain ({', '.join(columns)})")
+            conn.execute("ANALYZE")
+        print(f"Indexes: {len(wanted - existing)} created, {len(existing - wanted)} dropped, "
+              f"{len(wanted & existing)} kept.")
+        return sorted(wanted)
+    except Exception as e:
+        print(f"Error creating indexes: {e}")
+
+def explain_queries(conn, queries_file=QUERIES_FILE):
+    """Print EXPLAIN QUERY PLAN for every query and flag the ones that still read table rows.
+
+    Any SCAN of supply_chain that is not USING COVERING INDEX is flagged: a
+    plain scan reads every row, and a scan of a non-covering index looks each
+    row up in the table as well.
+    """
+    report = []
+    for query in report_queries(queries_file).values():
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}")]
+        full_scan = any(re.match(r'SCAN supply_chain\b', step) and 'COVERING INDEX' not in step for step in plan)
+        report.append({'query': query, 'plan': plan, 'full_scan': full_scan})
+        print(f"{'FULL SCAN' if full_scan else 'ok':>9}  {' '.join(query.split())[:80]}")
+        for step in plan:
+            print(f"{'':>11}{step}")
+    flagged = sum(r['full_scan'] for r in report)
+    print(f"{flagged} of {len(report)} queries scan the table rows.")
+    return report
+
+def _read_only_connection(db_file):
+    return sqlite3.connect(f"file:{db_file}?mode=ro", uri=True, check_same_thread=False)
+
+def _write_result(cursor, path, batch_size=BATCH_SIZE):
+    """Stream a cursor's rows to Parquet / Arrow / CSV in batches; return the row count."""
+    columns = [d[0] for d in cursor.description]
+    ext = extension(path)
+    writer, rows = None, 0
+    try:
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch and writer is not None:
+                break
+            df = pd.DataFrame.from_records(batch, columns=columns)
+            if ext == '.csv':
+                df.to_csv(path, mode='w' if writer is None else 'a', header=writer is None, index=False)
+                writer = True
+            else:
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                if writer is None:
+                    writer = open_writer(path, table.schema)
+                writer.write_table(table.cast(writer.schema))
+            rows += len(batch)
+            if not batch:
+                break
+    finally:
+        if writer not in (None, True):
+            writer.close()
+    return rows
+
+def _run_report(pool, query, path):
+    conn = pool.get()
+    try:
+        start = time.perf_counter()
+        tmp_path = f"{path}.tmp{extension(path)}"
+        rows = _write_result(conn.execute(query), tmp_path)
+        os.replace(tmp_path, path)
+        return rows, time.perf_counter() - start
+    finally:
+        pool.put(conn)
+
+def _run_on_connection(conn, queries_file):
     try:
-        with open(queries_file, 'r') as f:
-            queries = f.read().split(';')
         c = conn.cursor()
-        for query in queries:
-            query = query.strip()
-            if query:
-                c.execute(query)
+        for query in report_queries(queries_file).values():
+            c.execute(query)
         conn.commit()
         print("Queries executed successfully.")
     except Exception as e:
         print(f"Error running queries: {e}")
 
+def run_queries(db_file=DB_FILE, queries_file=QUERIES_FILE, output_dir=REPORTS_DIR, fmt='.parquet', workers=4):
+    """Run the named reports (see report_queries) concurrently and write one report file per query.
+
+    Each query runs on a read-only connection from a small pool and streams its
+    rows to <output_dir>/<name><fmt> (.parquet, .arrow or .csv). A report whose
+    query text and table version match the previous run is not recomputed.
+    Returns {name: {'path', 'rows', 'cached', 'seconds'}}; read a report with
+    formats.read_frame(path).
+
+    The older run_queries(conn, queries_file) form still works: given an open
+    connection instead of a database file, it runs the reports on that
+    connection, commits, and writes no files.
+    """
+    if isinstance(db_file, sqlite3.Connection):
+        return _run_on_connection(db_file, queries_file)
+    try:
+        queries = report_queries(queries_file)
+        os.makedirs(output_dir, exist_ok=True)
+        manifest_path = os.path.join(output_dir, 'manifest.json')
+        manifest = {}
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+
+        pool = queue.Queue()
+        for _ in range(max(1, min(workers, len(queries)))):
+            pool.put(_read_only_connection(db_file))
+        try:
+            version = table_version(pool.queue[0])
+            results, futures = {}, {}
+            with ThreadPoolExecutor(max_workers=pool.qsize()) as executor:
+                for name, query in queries.items():
+                    path = os.path.join(output_dir, name + fmt)
+                    key = hashlib.sha1(query.encode()).hexdigest()
+                    cached = manifest.get(name, {})
+                    if cached.get('query') == key and cached.get('version') == version and os.path.exists(path):
+                        results[name] = {'path': path, 'rows': cached['rows'], 'cached': True, 'seconds': 0.0}
+                    else:
+                        futures[name] = (executor.submit(_run_report, pool, query, path), path, key)
+                for name, (future, path, key) in futures.items():
+                    rows, seconds = future.result()
+                    results[name] = {'path': path, 'rows': rows, 'cached': False, 'seconds': seconds}
+                    manifest[name] = {'query': key, 'version': version, 'rows': rows}
+        finally:
+            while not pool.empty():
+                pool.get().close()
+
+        with open(manifest_path, 'w') as f:
+            json.dump({name: manifest[name] for name in queries if name in manifest}, f, indent=2)
+        print(f"Queries executed successfully: {len(futures)} reports written, "
+              f"{len(queries) - len(futures)} unchanged, in {output_dir}.")
+        return {name: results[name] for name in queries}
+    except Exception as e:
+        print(f"Error running queries: {e}")
+
 def main():
-    import os
-    processed_file = 'data/processed_data.xlsx'
+    parser = argparse.ArgumentParser(description='Load processed data into SQLite and run the report queries.')
+    parser.add_argument('--explain', action='store_true',
+                        help='Only print EXPLAIN QUERY PLAN for the report queries; exit 1 if any scans the table rows')
+    parser.add_argument('--reports-dir', default=REPORTS_DIR, help='Where run_queries writes one file per query')
+    parser.add_argument('--format', default='.parquet', choices=['.parquet', '.arrow', '.csv'])
+    parser.add_argument('--workers', type=int, default=4, help='Concurrent read-only connections')
+    args = parser.parse_args()
+    processed_file = 'data/processed_data.parquet'
+
+    if args.explain:
+        conn = create_connection()
+        if conn:
+            create_table(conn)
+            report = explain_queries(conn)
+            conn.close()
+            sys.exit(1 if any(r['full_scan'] for r in report) else 0)
+        return
     
     if not os.path.exists(processed_file):
         print("Processed data not found. Run data_processing.py first.")
         return
     
-    # Load processed data
-    df = pd.read_excel(processed_file)
+    # Load processed data (memory-mapped Parquet), typed and validated against the schema
+    df = apply_schema(read_frame(processed_file))
     
     # Connect to database
     conn = create_connection()
@@ -100,10 +389,11 @@ def main():
         # Insert data
         insert_data(conn, df)
         
-        # Optional: run queries from file
-        queries_file = 'sql/queries.sql'
+        # Optional: index for and run queries from file
+        queries_file = QUERIES_FILE
         if os.path.exists(queries_file):
-            run_queries(conn, queries_file)
+            create_indexes(conn, queries_file)
+            run_queries(DB_FILE, queries_file, args.reports_dir, args.format, args.workers)
         
         conn.close()
         print("Database operations completed.")
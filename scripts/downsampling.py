@@ -0,0 +1,244 @@
+# scripts/downsampling.py
+"""Shrink raw-row charts before they are sent to the browser.
+
+Above a row threshold the scatter is either stratified-sampled down to a point
+budget or binned into a 2D histogram, and the violin is drawn from per-group
+KDEs and quartiles computed here, so the figure payload depends on the screen
+rather than on the number of rows.
+
+StoreRows computes the chart inputs inside the DuckDB store: the sample, the
+bin counts and the per-group value counts behind the violin come out of the
+scan, so a selection's rows are never loaded into pandas.
+"""
+import numpy as np
+
+from scripts.store import TABLE, build_where, connect, distinct_values, quote
+
+SCATTER_POINT_BUDGET = 5_000  # max points sent for the scatter
+SCATTER_BINS = 80  # bins per axis in 'bin' mode
+VIOLIN_ROW_THRESHOLD = 5_000  # above this the violin is drawn from density profiles
+KDE_POINTS = 200  # points per violin outline
+PREVIEW_ROWS = 1_000  # rows shown in the dataset view
+
+
+def _bandwidth(std, spread, n):
+    scale = min(std, spread) if spread > 0 else std
+    return 0.9 * scale * n ** -0.2 if scale > 0 else 0.5
+
+
+def kernel_bandwidth(values):
+    """Silverman's rule-of-thumb Gaussian kernel bandwidth (0.5 for constant values)."""
+    spread = np.subtract(*np.percentile(values, [75, 25])) / 1.34
+    return _bandwidth(values.std(), spread, len(values))
+
+
+def _quantiles(values, weights, qs):
+    # np.quantile's linear interpolation over values repeated `weights` times
+    total = weights.sum()
+    cumulative = np.cumsum(weights)
+    out = []
+    for q in qs:
+        h = (total - 1) * q
+        low = values[np.searchsorted(cumulative, np.floor(h), side='right')]
+        high = values[np.searchsorted(cumulative, min(np.floor(h) + 1, total - 1), side='right')]
+        out.append(low + (h - np.floor(h)) * (high - low))
+    return out
+
+
+def _kde(values, weights, points, bandwidth):
+    # Gaussian KDE on a fixed grid: histogram the values, then smooth with the kernel,
+    # so the cost is O(values + points) rather than O(rows * points)
+    grid = np.linspace(values.min() - 2 * bandwidth, values.max() + 2 * bandwidth, points)
+    step = grid[1] - grid[0]
+    counts, _ = np.histogram(values, bins=points, range=(grid[0] - step / 2, grid[-1] + step / 2), weights=weights)
+    half = int(np.ceil(4 * bandwidth / step))
+    kernel = np.exp(-0.5 * (np.arange(-half, half + 1) * step / bandwidth) ** 2)
+    density = np.convolve(counts, kernel)[half:half + points] / (weights.sum() * bandwidth * np.sqrt(2 * np.pi))
+    return grid, density
+
+
+def profiles_from_counts(counts, group, value, points=KDE_POINTS):
+    """Per-group KDE outline and box-plot statistics from rows per (group, value), sorted by group.
+
+    `counts` has the group and value columns and a `rows` column, as from
+    count_values; the statistics equal those of the rows themselves.
+    """
+    profiles = []
+    counts = counts[counts[value].notna() & (counts['rows'] > 0)]
+    for name, part in counts.groupby(group, sort=True, observed=True):
+        part = part.groupby(value, sort=True)['rows'].sum()
+        values = part.index.to_numpy(dtype='float64')
+        weights = part.to_numpy(dtype='float64')
+        total = weights.sum()
+        mean = (values * weights).sum() / total
+        std = np.sqrt((weights * (values - mean) ** 2).sum() / total)
+        q1, median, q3 = _quantiles(values, weights, [0.25, 0.5, 0.75])
+        iqr = q3 - q1
+        grid, density = _kde(values, weights, points, _bandwidth(std, iqr / 1.34, total))
+        profiles.append({
+            'group': name,
+            'rows': int(total),
+            'grid': grid,
+            'density': density,
+            'q1': q1,
+            'median': median,
+            'q3': q3,
+            'lowerfence': values[values >= q1 - 1.5 * iqr].min(),
+            'upperfence': values[values <= q3 + 1.5 * iqr].max(),
+            'mean': mean,
+        })
+    return profiles
+
+
+def _and(where, clause):
+    return f"{where} AND {clause}" if where else f" WHERE {clause}"
+
+
+def group_sizes(con, table, by, where='', params=None):
+    """{group: rows} of the `by` column (None for the NULL group)."""
+    return dict(con.execute(f"SELECT {quote(by)}, COUNT(*) FROM {table}{where} GROUP BY ALL", params or []).fetchall())
+
+
+def sample_quotas(sizes, budget=SCATTER_POINT_BUDGET):
+    """{group: rows to sample} in proportion to the group sizes, at least one each; None when every row fits."""
+    total = sum(sizes.values())
+    if total <= budget:
+        return None
+    return {group: max(1, budget * n // total) for group, n in sizes.items()}
+
+
+def sample_rows(con, table, columns, by, budget=SCATTER_POINT_BUDGET, where='', params=None, seed=0,
+                quotas=None, ranked=False):
+    """About `budget` rows drawn in DuckDB, in proportion to the `by` groups (at least one each).
+
+    Within its group each row is ranked by a hash of its rowid, so the sample
+    is stable for a given store; every row is returned when they fit the budget.
+    Tables holding parts of one selection (shards) pass the `quotas` of the
+    whole selection and `ranked=True`, which adds the hash as a _rank column:
+    the sample of the whole is then the lowest-ranked rows of the parts' samples.
+    """
+    params = list(params or [])
+    select = ', '.join(quote(c) for c in columns)
+    rank = f"hash(rowid, {int(seed)})"
+    if ranked:
+        select += f", {rank} AS _rank"
+    sizes = group_sizes(con, table, by, where, params)
+    if quotas is None:
+        quotas = sample_quotas(sizes, budget)
+    if quotas is None:
+        return con.execute(f"SELECT {select} FROM {table}{where}", params).to_arrow_table().to_pandas()
+
+    def per_group(values):
+        # CASE over the group values; the NULL group, if any, takes the ELSE branch
+        cases = [(group, value) for group, value in values if group is not None]
+        other = next((value for group, value in values if group is None), 0)
+        sql = f"CASE {quote(by)} {' '.join('WHEN ? THEN ?' for _ in cases)} ELSE ? END" if cases else '?'
+        return sql, [x for case in cases for x in case] + [other]
+
+    quotas = [(group, quotas.get(group, 0)) for group in sizes]
+    quota_sql, quota_params = per_group(quotas)
+    # The rows ranked lowest are the ones with the smallest hashes, so a per-group hash cutoff at
+    # about twice the quota keeps the window sort off most rows without changing the sample
+    cutoffs = [(group, min(2 ** 64 - 1, 2 ** 64 * (2 * q + 16) // sizes[group])) for group, q in quotas]
+    cutoff_sql, cutoff_params = per_group(cutoffs)
+    query = (f"SELECT {select} FROM {table}{{where}}\n"
+             f"QUALIFY row_number() OVER (PARTITION BY {quote(by)} ORDER BY {rank}) <= {quota_sql}")
+    sample = con.execute(query.format(where=_and(where, f"{rank} < {cutoff_sql}")),
+                         params + cutoff_params + quota_params).to_arrow_table().to_pandas()
+    if len(sample) < sum(min(q, sizes[group]) for group, q in quotas):
+        # A group had fewer rows under its cutoff than its quota: rank all of its rows
+        sample = con.execute(query.format(where=where), params + quota_params).to_arrow_table().to_pandas()
+    return sample
+
+
+def value_bounds(con, table, columns, where='', params=None):
+    """{column: (min, max)} over the rows where every column is finite; None when there are none."""
+    finite = ' AND '.join(f'isfinite({quote(c)}::DOUBLE)' for c in columns)
+    select = ', '.join(f'MIN({quote(c)})::DOUBLE, MAX({quote(c)})::DOUBLE' for c in columns)
+    row = con.execute(f"SELECT COUNT(*), {select} FROM {table}{_and(where, finite)}", params or []).fetchone()
+    if not row[0]:
+        return None
+    return {c: (row[1 + 2 * i], row[2 + 2 * i]) for i, c in enumerate(columns)}
+
+
+def bin_edges(low, high, bins=SCATTER_BINS):
+    """np.histogram2d's edges for values in [low, high] (widened by 0.5 when they are all equal)."""
+    if low == high:
+        low, high = low - 0.5, high + 0.5
+    return np.linspace(low, high, bins + 1)
+
+
+def bin_counts(con, table, x, y, bounds, bins=SCATTER_BINS, where='', params=None):
+    """Row counts on a bins x bins grid over `bounds` (from value_bounds), as counts[y, x]."""
+    index = []
+    for column in (x, y):
+        edges = bin_edges(*bounds[column], bins)
+        low, width = float(edges[0]), float(edges[-1] - edges[0]) / bins
+        index.append(f"LEAST(GREATEST(floor(({quote(column)} - {low!r}) / {width!r}), 0), {bins - 1})::INTEGER")
+    finite = f'isfinite({quote(x)}::DOUBLE) AND isfinite({quote(y)}::DOUBLE)'
+    cells = con.execute(f"SELECT {index[0]} AS ix, {index[1]} AS iy, COUNT(*) AS n FROM {table}"
+                        f"{_and(where, finite)} GROUP BY ALL", params or []).fetchnumpy()
+    counts = np.zeros((bins, bins))
+    counts[cells['iy'].astype('int64'), cells['ix'].astype('int64')] = cells['n']
+    return counts
+
+
+def bin_centers(low, high, bins=SCATTER_BINS):
+    edges = bin_edges(low, high, bins)
+    return (edges[:-1] + edges[1:]) / 2
+
+
+def count_values(con, table, group, value, where='', params=None):
+    """Rows per (group, value), the input of profiles_from_counts."""
+    return con.execute(
+        f"SELECT {quote(group)}, {quote(value)}, COUNT(*) AS rows FROM {table}"
+        f"{_and(where, f'{quote(group)} IS NOT NULL AND {quote(value)} IS NOT NULL')} GROUP BY ALL",
+        params or []).df()
+
+
+def head_rows(con, table, limit=PREVIEW_ROWS, where='', params=None):
+    """The first `limit` rows in store order."""
+    return con.execute(f"SELECT * FROM {table}{where} ORDER BY rowid LIMIT {int(limit)}",
+                       params or []).to_arrow_table().to_pandas(date_as_object=False)
+
+
+class StoreRows:
+    """Raw-row chart inputs for a filter selection, computed inside the DuckDB store."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+
+    def _run(self, filters, compute):
+        where, params = build_where(filters)
+        con = connect(self.db_path)
+        try:
+            return compute(con, TABLE, where, params)
+        finally:
+            con.close()
+
+    def sample(self, filters, columns, by, budget=SCATTER_POINT_BUDGET):
+        """Stratified sample of the selection's rows (every row when they fit the budget)."""
+        return self._run(filters, lambda con, table, where, params:
+                         sample_rows(con, table, columns, by, budget, where, params))
+
+    def bins(self, filters, x, y, bins=SCATTER_BINS):
+        """Row counts of the selection on a bins x bins grid: (x centers, y centers, counts[y, x])."""
+        def compute(con, table, where, params):
+            bounds = value_bounds(con, table, [x, y], where, params)
+            if bounds is None:
+                return np.array([]), np.array([]), np.zeros((0, 0))
+            return (bin_centers(*bounds[x], bins), bin_centers(*bounds[y], bins),
+                    bin_counts(con, table, x, y, bounds, bins, where, params))
+        return self._run(filters, compute)
+
+    def value_counts(self, filters, group, value):
+        """Rows per (group, value) of the selection, for profiles_from_counts."""
+        return self._run(filters, lambda con, table, where, params: count_values(con, table, group, value, where, params))
+
+    def head(self, filters, limit=PREVIEW_ROWS):
+        """The selection's first `limit` rows."""
+        return self._run(filters, lambda con, table, where, params: head_rows(con, table, limit, where, params))
+
+    def distinct_values(self, column):
+        """Distinct values of a column (filter options)."""
+        return distinct_values(self.db_path, column)
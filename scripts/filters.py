@@ -0,0 +1,61 @@
+# scripts/filters.py
+"""Turn sidebar selections into filters for store.build_where / aggregations.
+
+A filters dict maps a column to the list of accepted values, or to a Range for
+ordered columns such as dates. Columns with no restriction are left out
+entirely, so "All" never costs a predicate.
+"""
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+ALL = 'All'
+
+
+class Range(namedtuple('Range', ['start', 'end'])):
+    """Inclusive [start, end] bounds on an ordered column (a date slider)."""
+
+
+def from_selectboxes(selections):
+    """{column: value} from 'All'-style selectboxes (app.py) -> filters."""
+    return {column: [value] for column, value in selections.items() if value != ALL}
+
+
+def from_multiselects(selections, options):
+    """{column: selected list} from multiselects (dashboard_app.py) -> filters.
+
+    A column where every option is selected is unrestricted and is dropped.
+    """
+    filters = {}
+    for column, selected in selections.items():
+        if set(selected) != set(options[column]):
+            filters[column] = list(selected)
+    return filters
+
+
+def from_slider(column, selected, bounds):
+    """{column: Range} for a (start, end) range slider, or {} when it spans the whole of `bounds`."""
+    if tuple(selected) == tuple(bounds):
+        return {}
+    return {column: Range(*selected)}
+
+
+def filter_key(filters):
+    """Hashable, order-independent form of a filters dict (for cache keys)."""
+    return tuple(sorted(
+        (column, ('range', str(values.start), str(values.end)) if isinstance(values, Range)
+         else tuple(sorted(map(str, values))))
+        for column, values in (filters or {}).items()
+    ))
+
+
+def filter_frame(df, filters):
+    """Rows of df matching a filters dict (a pandas mask, for frames already in memory)."""
+    mask = np.ones(len(df), dtype=bool)
+    for column, values in (filters or {}).items():
+        if isinstance(values, Range):
+            mask &= df[column].between(pd.Timestamp(values.start), pd.Timestamp(values.end)).to_numpy()
+        else:
+            mask &= df[column].isin(values if isinstance(values, (list, tuple, set)) else [values]).to_numpy()
+    return df[mask]
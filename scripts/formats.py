@@ -0,0 +1,141 @@
+# scripts/formats.py
+"""Pluggable read/write layer for the processed dataset.
+
+The format is picked from the file extension. Parquet is the default hand-off
+between the pipeline, db_operations and the dashboards; Arrow IPC (.arrow /
+.feather, uncompressed) is the fastest to open since readers memory-map it.
+Excel and CSV are export formats, produced on demand for downloads.
+"""
+import io
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+DEFAULT_FORMAT = '.parquet'
+
+# openpyxl writes at most 1,048,576 rows, header included
+EXCEL_MAX_ROWS = 1_048_575
+
+MIME_TYPES = {
+    '.xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    '.csv': 'text/csv',
+    '.parquet': 'application/vnd.apache.parquet',
+    '.arrow': 'application/vnd.apache.arrow.file',
+}
+
+
+def extension(path):
+    """Lower-case extension of path, with .feather treated as Arrow IPC."""
+    ext = '.' + path.rsplit('.', 1)[-1].lower() if '.' in path else ''
+    return '.arrow' if ext == '.feather' else ext
+
+
+def _write_parquet(table, path):
+    pq.write_table(table, path)
+
+
+def _write_arrow(table, path):
+    with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+
+
+def _check_excel_rows(df):
+    # Fail loudly instead of letting the sheet be cut off
+    if len(df) > EXCEL_MAX_ROWS:
+        raise ValueError(f"{len(df):,} rows exceed Excel's limit of {EXCEL_MAX_ROWS:,}; use Parquet or CSV")
+
+
+def _write_excel(df, path):
+    _check_excel_rows(df)
+    df.to_excel(path, index=False)
+
+
+def _write_csv(df, path):
+    df.to_csv(path, index=False)
+
+
+# extension -> (writer, takes an Arrow table rather than a DataFrame)
+WRITERS = {
+    '.parquet': (_write_parquet, True),
+    '.arrow': (_write_arrow, True),
+    '.xlsx': (_write_excel, False),
+    '.csv': (_write_csv, False),
+}
+
+
+def write_frame(df, path):
+    """Write df to path in the format given by its extension."""
+    ext = extension(path)
+    if ext not in WRITERS:
+        raise ValueError(f"Unsupported output format '{ext}' (expected one of {', '.join(WRITERS)})")
+    writer, arrow = WRITERS[ext]
+    writer(pa.Table.from_pandas(df, preserve_index=False) if arrow else df, path)
+
+
+def read_frame(path, columns=None):
+    """Read a processed file; Parquet and Arrow IPC are memory-mapped."""
+    ext = extension(path)
+    if ext == '.arrow':
+        table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+        return (table.select(columns) if columns else table).to_pandas()
+    if ext == '.parquet':
+        return pq.read_table(path, columns=columns, memory_map=True).to_pandas()
+    if ext == '.xlsx':
+        return pd.read_excel(path, usecols=columns)
+    if ext == '.csv':
+        return pd.read_csv(path, usecols=columns)
+    raise ValueError(f"Unsupported input format '{ext}'")
+
+
+def iter_frames(path, chunksize):
+    """Yield a Parquet / Arrow IPC file as DataFrames of at most chunksize rows."""
+    ext = extension(path)
+    if ext == '.parquet':
+        batches = pq.ParquetFile(path, memory_map=True).iter_batches(chunksize)
+    elif ext == '.arrow':
+        table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+        batches = table.to_batches(max_chunksize=chunksize)
+    else:
+        raise ValueError(f"Chunked reads need Parquet or Arrow IPC, not '{ext}'")
+    for batch in batches:
+        yield batch.to_pandas()
+
+
+class _ArrowFileWriter:
+    """Arrow IPC file writer that also closes its sink."""
+
+    def __init__(self, path, schema):
+        self.sink = pa.OSFile(path, 'wb')
+        self.writer = pa.ipc.new_file(self.sink, schema)
+        self.schema = schema
+
+    def write_table(self, table):
+        self.writer.write_table(table)
+
+    def close(self):
+        self.writer.close()
+        self.sink.close()
+
+
+def open_writer(path, schema):
+    """Incremental writer (write_table/close/schema) for the streaming pipeline."""
+    ext = extension(path)
+    if ext == '.parquet':
+        return pq.ParquetWriter(path, schema)
+    if ext == '.arrow':
+        return _ArrowFileWriter(path, schema)
+    raise ValueError(f"Streaming output must be Parquet or Arrow IPC, not '{ext}'")
+
+
+def frame_bytes(df, ext):
+    """xlsx/csv bytes of an in-memory DataFrame, for download buttons."""
+    buffer = io.BytesIO()
+    if ext == '.xlsx':
+        _check_excel_rows(df)
+        df.to_excel(buffer, index=False)
+    elif ext == '.csv':
+        df.to_csv(buffer, index=False)
+    else:
+        raise ValueError(f"Unsupported export format '{ext}'")
+    return buffer.getvalue()
@@ -0,0 +1,302 @@
+# scripts/ingest.py
+"""Append-only ingestion of new shipment rows, and running state for derived fields.
+
+New rows arrive as micro-batches (append_batch) or as CSV files dropped into
+data/incoming (ingest_drop_dir, or `python -m scripts.ingest --watch`). They
+are appended to the source CSV, and store.ensure_store appends the grown tail
+to the DuckDB store, so the CSV stays the source of truth. All of it runs
+under the store's write lock, so concurrent ingesters never append a file
+twice. A dashboard process runs one Ingester thread for all its sessions,
+which only compare store versions. Consumers fold in
+only the appended rows: the cube by rowid watermark, and LiveProcessed, which
+keeps the per-location and per-SKU running sums behind delivery_ratio and
+inventory_turnover instead of regrouping the whole history; the dashboard
+cube holds delivery_ratio per location, so appends re-derive only the rows
+of the SKUs they touch, read back from the store.
+
+    python -m scripts.ingest --watch [--drop-dir data/incoming] [--interval 5]
+"""
+import argparse
+import os
+import threading
+import time
+
+import pandas as pd
+
+from scripts.cube import DASHBOARD_CUBE, Cube
+from scripts.data_processing import (add_calculated_fields, clean_data, finalize_partials, group_partials,
+                                     median_from_counts, merge_partials, normalize_columns, processed_query,
+                                     query_partials)
+from scripts.metrics import CSV_NAMES
+from scripts.schema import INTEGER_COLUMNS, file_columns, read_header, snake_case, validate
+from scripts.sketches import SketchCube
+from scripts.store import DB_PATH, TABLE, connect, ensure_store, quote, require_info, store_version, writing
+from scripts.timeseries import DATE_COLUMN, Rollups
+from scripts.warm import load_state, save_state, snapshot_path
+
+CSV_PATH = 'data/supply_chain.csv'
+DROP_DIR = 'data/incoming'
+DONE_DIR = 'processed'  # ingested files are moved here, inside the drop directory
+POLL_SECONDS = 5.0
+
+
+def _ends_with_newline(path):
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() == 0:
+            return True
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b'\n'
+
+
+def append_batch(df, csv_path=CSV_PATH, db_path=DB_PATH):
+    """Append a micro-batch (CSV column names) to the source CSV and the store; returns its row count."""
+    columns = list(file_columns(read_header(csv_path)))
+    missing = [c for c in columns if c not in df.columns]
+    if missing:
+        raise ValueError(f"Batch is missing column(s) {missing}")
+    if df.empty:
+        return 0
+    batch = df[columns].copy()
+    validate(batch)
+    # Written without a decimal point, so a full re-ingest still reads them as integers
+    for column in INTEGER_COLUMNS:
+        batch[column] = pd.to_numeric(batch[column]).round().astype('Int64')
+    with writing(db_path):
+        newline = not _ends_with_newline(csv_path)
+        with open(csv_path, 'a', newline='') as f:
+            if newline:
+                f.write('\n')
+            batch.to_csv(f, header=False, index=False, date_format='%Y-%m-%d')
+        ensure_store(csv_path, db_path)
+    return len(batch)
+
+
+def pending_files(drop_dir=DROP_DIR):
+    """CSV files waiting in the drop directory, oldest first."""
+    if not os.path.isdir(drop_dir):
+        return []
+    paths = [os.path.join(drop_dir, name) for name in os.listdir(drop_dir) if name.lower().endswith('.csv')]
+    return sorted(paths, key=lambda path: (os.path.getmtime(path), path))
+
+
+def ingest_drop_dir(drop_dir=DROP_DIR, csv_path=CSV_PATH, db_path=DB_PATH):
+    """Append every CSV waiting in drop_dir, moving each one to drop_dir/processed; returns rows appended."""
+    rows = 0
+    for path in pending_files(drop_dir):
+        with writing(db_path):
+            if not os.path.exists(path):
+                continue  # another ingester took it while we waited for the lock
+            rows += append_batch(pd.read_csv(path), csv_path, db_path)
+            done = os.path.join(drop_dir, DONE_DIR)
+            os.makedirs(done, exist_ok=True)
+            os.replace(path, os.path.join(done, os.path.basename(path)))
+        print(f"Ingested {path}")
+    return rows
+
+
+def poll(drop_dir=DROP_DIR, csv_path=CSV_PATH, db_path=DB_PATH):
+    """Ingest pending drop files and any rows appended to the CSV; returns the store version."""
+    ingest_drop_dir(drop_dir, csv_path, db_path)
+    return store_version(ensure_store(csv_path, db_path))
+
+
+class Ingester:
+    """A background thread that polls the drop directory and the CSV every `interval` seconds.
+
+    Run one per process (the dashboards keep it in st.cache_resource) rather
+    than polling from every session.
+    """
+
+    def __init__(self, drop_dir=DROP_DIR, csv_path=CSV_PATH, db_path=DB_PATH, interval=POLL_SECONDS):
+        self.drop_dir = drop_dir
+        self.csv_path = csv_path
+        self.db_path = db_path
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='ingester', daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def _run(self):
+        while not self.stopped.is_set():
+            try:
+                poll(self.drop_dir, self.csv_path, self.db_path)
+            except Exception as e:
+                print(f"Ingestion failed, retrying in {self.interval:g}s: {e!r}")
+            self.stopped.wait(self.interval)
+
+    def version(self):
+        """Store version, for sessions checking whether to rerun."""
+        return store_version(self.db_path)
+
+
+class LiveProcessed:
+    """Dashboard cube and time rollups over the store's processed rows, kept current as rows are appended.
+
+    No processed rows are held in memory. A store build is aggregated by DuckDB
+    from data_processing.processed_query, and the dashboard reads any rows it
+    needs from the store (read_processed). Only appended rows are cleaned and
+    derived here; running per-location and per-SKU sums give their
+    delivery_ratio / inventory_turnover. The cube keeps delivery_ratio as
+    per-location aggregates, so old rows only change when their own fields
+    move: rows of a SKU that got new rows, and rows whose missing lead time was
+    filled with a median that has since moved. Those rows are read back from
+    the store and derived under the old and the new running state; the cube
+    and rollups retract the one and add the other. The approximate-mode
+    sketches are streamed from the store on first use, then take appended rows
+    only.
+    """
+
+    def __init__(self, config=DASHBOARD_CUBE):
+        self.config = config
+        self.cube = None
+        self.rollups = None
+        self.sketches = None
+        self.partials = None
+        self.lead_time_counts = None
+        self.lead_times_fill = None  # median the missing lead times are filled with
+        self.db_path = None
+        self.rows = 0
+        self.watermark = 0
+        self.built_at = None
+        self.version = None
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        # Sketches are rebuilt on first use
+        return dict(self.__dict__, lock=None, sketches=None)
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_store(cls, db_path=DB_PATH, config=DASHBOARD_CUBE, snapshot_dir=None, name='dashboard'):
+        """Cube and rollups of the store, starting from a snapshot of the same store build if there is one."""
+        live = load_state(snapshot_path(snapshot_dir, name), db_path) if snapshot_dir else None
+        if live is None or live.config != config:
+            live = cls(config)
+        live.refresh(db_path)
+        return live
+
+    def save(self, snapshot_dir, name='dashboard'):
+        """Snapshot the cube, rollups and running state for from_store."""
+        with self.lock:
+            save_state(snapshot_path(snapshot_dir, name), self.built_at, self)
+
+    def _count_lead_times(self, raw):
+        normalize_columns(raw)
+        counts = raw['lead_times'].value_counts()
+        self.lead_time_counts = counts if self.lead_time_counts is None \
+            else self.lead_time_counts.add(counts, fill_value=0)
+        return median_from_counts(self.lead_time_counts)
+
+    def _build(self, con):
+        # Derived once by DuckDB into a temporary table the cube, rollups and partials aggregate
+        columns = [row[0] for row in con.execute(f"DESCRIBE {TABLE}").fetchall()]
+        lead_times = quote(CSV_NAMES['lead_times'])
+        self.lead_time_counts = con.execute(
+            f"SELECT {lead_times} AS value, COUNT(*) AS n FROM {TABLE} WHERE {lead_times} IS NOT NULL GROUP BY 1"
+        ).df().set_index('value')['n']
+        self.lead_times_fill = median_from_counts(self.lead_time_counts)
+        con.execute(f"CREATE TEMP TABLE processed AS {processed_query(columns)}")
+        try:
+            self.partials = query_partials(con, 'processed')
+            self.cube = Cube.from_query(con, 'processed', self.config)
+            dated = DATE_COLUMN in [snake_case(column) for column in columns]
+            self.rollups = Rollups.from_query(con, 'processed', self.config) if dated else None
+        finally:
+            con.execute("DROP TABLE processed")
+        self.sketches = None
+
+    def _append(self, con, raw):
+        old_stats, old_fill = finalize_partials(self.partials), self.lead_times_fill
+        median = self._count_lead_times(raw)
+        batch = clean_data(raw, median)
+        part = group_partials(batch)
+        self.partials = merge_partials(self.partials, part)
+        stats = finalize_partials(self.partials)
+        batch = add_calculated_fields(batch, stats)
+
+        # Old rows whose own fields move, read back from the store: the batch's SKUs, and
+        # filled-in lead times if the median moved
+        skus = [str(sku) for sku in part['sku'].index]
+        clauses = [f"{quote(CSV_NAMES['sku'])} IN ({', '.join('?' for _ in skus)})" if skus else 'FALSE']
+        if not (median == old_fill or (pd.isna(median) and pd.isna(old_fill))):
+            clauses.append(f"{quote(CSV_NAMES['lead_times'])} IS NULL")
+        old = con.execute(f"SELECT * FROM {TABLE} WHERE rowid < ? AND ({' OR '.join(clauses)})",
+                          [self.watermark] + skus).to_arrow_table().to_pandas(date_as_object=False)
+        before = add_calculated_fields(clean_data(old.copy(), old_fill), old_stats)
+        after = add_calculated_fields(clean_data(old, median), stats)
+        for target in [self.cube, self.rollups]:
+            if target is not None:
+                target.update(before, pd.concat([after, batch], ignore_index=True))
+        if self.sketches is not None:
+            self.sketches.add(batch)
+        self.lead_times_fill = median
+        print(f"Folded {len(batch)} new rows in ({len(old)} existing rows re-derived)")
+
+    def sketch_cube(self):
+        """Sketches of every folded-in row for approximate mode, streamed from the store on first use."""
+        with self.lock:
+            if self.sketches is None:
+                con = connect(self.db_path)
+                try:
+                    self.sketches = SketchCube.from_query(con, TABLE, ' WHERE rowid < ?', [self.watermark])
+                finally:
+                    con.close()
+            return self.sketches
+
+    def refresh(self, db_path=DB_PATH):
+        """Catch up with the store; returns True when the data changed."""
+        if require_info(db_path)['ingested_at'] == self.version:
+            return False
+        with self.lock:
+            con = connect(db_path)
+            try:
+                # One snapshot of the store for the watermark, the rows and the version
+                con.execute("BEGIN TRANSACTION")
+                built_at, version = con.execute("SELECT built_at, ingested_at FROM store_info").fetchone()
+                high, rows = con.execute(f"SELECT COALESCE(MAX(rowid) + 1, 0), COUNT(*) FROM {TABLE}").fetchone()
+                if built_at != self.built_at:
+                    self._build(con)
+                elif high > self.watermark:
+                    raw = con.execute(f"SELECT * FROM {TABLE} WHERE rowid >= ? AND rowid < ? ORDER BY rowid",
+                                      [self.watermark, high]).to_arrow_table().to_pandas(date_as_object=False)
+                    self._append(con, raw)
+                con.execute("COMMIT")
+            finally:
+                con.close()
+            self.db_path, self.rows, self.watermark = db_path, rows, high
+            self.built_at, self.version = built_at, version
+        return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Append dropped CSV batches to the supply chain data')
+    parser.add_argument('--drop-dir', default=DROP_DIR)
+    parser.add_argument('--csv', default=CSV_PATH)
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--watch', action='store_true', help='Keep polling the drop directory')
+    parser.add_argument('--interval', type=float, default=POLL_SECONDS, help='Seconds between polls with --watch')
+    args = parser.parse_args()
+
+    os.makedirs(args.drop_dir, exist_ok=True)
+    while True:
+        rows = ingest_drop_dir(args.drop_dir, args.csv, args.db)
+        if rows:
+            print(f"Appended {rows} rows; store version {store_version(args.db)}")
+        if not args.watch:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    main()
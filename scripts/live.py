@@ -0,0 +1,38 @@
+# scripts/live.py
+"""Live-refresh mode for the Streamlit dashboards.
+
+auto_refresh() adds a sidebar toggle; while it is on, a fragment polls for new
+data every few seconds and reruns the app only when the data version moved.
+input_signature() fingerprints a chart's inputs; scripts/chart_cache.py keys
+serialized charts on it, so unchanged widgets are sent as identical elements
+and the browser leaves them alone.
+"""
+import pandas as pd
+import streamlit as st
+
+
+def input_signature(inputs):
+    """Cheap fingerprint of a widget's inputs (DataFrames are content-hashed)."""
+    if isinstance(inputs, pd.DataFrame):
+        hashed = pd.util.hash_pandas_object(inputs, index=False).sum() if len(inputs) else 0
+        return ('frame', tuple(inputs.columns), len(inputs), int(hashed))
+    if isinstance(inputs, (list, tuple)):
+        return tuple(input_signature(i) for i in inputs)
+    return repr(inputs)
+
+
+def auto_refresh(version, check, default_interval=10):
+    """Sidebar 'Live refresh' toggle: poll check() and rerun when it reports a new version."""
+    if not st.sidebar.toggle('🔄 Live refresh', value=False):
+        return
+    interval = st.sidebar.number_input('Refresh every (seconds)', min_value=2, value=default_interval)
+
+    @st.fragment(run_every=interval)
+    def poll():
+        latest = check()
+        if latest != version:
+            st.rerun()
+        st.caption(f'Live: data version {latest}')
+
+    with st.sidebar:
+        poll()
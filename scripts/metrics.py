@@ -0,0 +1,381 @@
+# scripts/metrics.py
+"""Declarative registry of the supply chain KPIs, compiled to every backend.
+
+Each metric is a small expression tree over the processed (snake_case)
+columns: row expressions (columns, constants, comparisons), additive
+aggregates (SUM, COUNT) and arithmetic on aggregates. One definition compiles
+to a single fused query: DuckDB SQL, SQLite SQL, a vectorized pandas pass, or
+a Tableau calculated field. A dashboard or report asking for N metrics
+therefore scans the rows once, and the definitions cannot drift apart between
+the SQL reports, Tableau and the Python code.
+
+Because every aggregate is a SUM or a COUNT, metrics can also be evaluated
+from mergeable partial aggregates (see data_processing.group_partials).
+
+    python -m scripts.metrics --sql sqlite --dims supplier_name --metrics avg_delivery_time avg_defect_rate
+    python -m scripts.metrics --tableau > tableau/calculated_fields.txt
+    python -m scripts.metrics --queries > sql/queries.sql
+"""
+import argparse
+import re
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from scripts.schema import ALL_COLUMNS, snake_case
+
+# Row-level expressions
+Col = namedtuple('Col', ['name'])
+Const = namedtuple('Const', ['value'])
+Cmp = namedtuple('Cmp', ['op', 'left', 'right'])  # 1 where `left op right` holds, else 0 (also for NULLs)
+
+# Aggregates (all additive, so partial results merge by addition)
+Sum = namedtuple('Sum', ['expr'])
+Count = namedtuple('Count', [])  # rows
+CountOf = namedtuple('CountOf', ['expr'])  # non-null values
+
+# Arithmetic on aggregates; division by zero gives NULL / NaN
+Div = namedtuple('Div', ['left', 'right'])
+Sub = namedtuple('Sub', ['left', 'right'])
+
+Metric = namedtuple('Metric', ['formula', 'label', 'section'])
+
+AGGREGATES = (Sum, Count, CountOf)
+OPERATORS = {'<': np.less, '<=': np.less_equal, '>': np.greater, '>=': np.greater_equal, '=': np.equal}
+
+# SQL type a division is carried out in
+FLOAT_TYPES = {'duckdb': 'DOUBLE', 'sqlite': 'REAL'}
+
+
+def mean(name):
+    """AVG(column): sum over non-null count."""
+    return Div(Sum(Col(name)), CountOf(Col(name)))
+
+
+# Shipment is delayed when the lead time exceeds a week
+DELAYED = Cmp('>', Col('lead_time'), Const(7))
+ON_TIME = Cmp('<=', Col('shipping_times'), Col('lead_times'))
+
+METRICS = {
+    # Revenue and volumes
+    'total_revenue': Metric(Sum(Col('revenue_generated')), 'Total Revenue', 'Revenue'),
+    'total_orders': Metric(Sum(Col('order_quantities')), 'Total Orders', 'Order Fulfillment'),
+    'order_count': Metric(Count(), None, None),
+    'total_products_sold': Metric(Sum(Col('number_of_products_sold')), 'Total Products Sold', 'Revenue'),
+    'total_manufacturing_lead_time': Metric(Sum(Col('manufacturing_lead_time')), None, None),
+    'total_availability': Metric(Sum(Col('availability')), None, None),
+    'total_price': Metric(Sum(Col('price')), None, None),
+    'total_production_volumes': Metric(Sum(Col('production_volumes')), None, None),
+
+    # Inventory Management
+    'total_stock': Metric(Sum(Col('stock_levels')), None, None),
+    'avg_stock': Metric(mean('stock_levels'), None, None),
+    'stock_turnover': Metric(Div(Sum(Col('number_of_products_sold')), Sum(Col('stock_levels'))),
+                             'Stock Turnover Rate', 'Inventory Management'),
+    # Average stock over average units sold: how many sales periods the stock lasts (one row per
+    # SKU in the report; the former SQL listed stock_levels / AVG(sold) per distinct stock level)
+    'days_inventory_remaining': Metric(Div(mean('stock_levels'), mean('number_of_products_sold')),
+                                       'Days of Inventory Remaining', 'Inventory Management'),
+
+    # Order Fulfillment
+    'on_time_orders': Metric(Sum(ON_TIME), None, None),
+    'on_time_delivery_rate': Metric(Div(Sum(ON_TIME), Count()), 'On-Time Delivery Rate', 'Order Fulfillment'),
+    'delayed_shipments': Metric(Sum(DELAYED), None, None),
+    'delay_rate': Metric(Div(Sum(DELAYED), Count()), None, None),
+    'delivery_ratio': Metric(Sub(Const(1), Div(Sum(DELAYED), Count())), 'Delivery Ratio', 'Order Fulfillment'),
+
+    # Supplier Performance
+    'avg_delivery_time': Metric(mean('lead_time'), 'Average Delivery Time', 'Supplier Performance'),
+    'total_lead_times': Metric(Sum(Col('lead_times')), None, None),
+    'avg_lead_time': Metric(mean('lead_times'), None, None),
+    'avg_defect_rate': Metric(mean('defect_rates'), 'Defect Rate', 'Supplier Performance'),
+
+    # Transportation Efficiency
+    'avg_transit_time': Metric(mean('shipping_times'), 'Average Transit Time', 'Transportation Efficiency'),
+    'shipping_cost_per_unit': Metric(Div(Sum(Col('shipping_costs')), Sum(Col('number_of_products_sold'))),
+                                     'Shipping Cost per Unit', 'Transportation Efficiency'),
+
+    # Supply Chain Costs
+    'total_manufacturing_costs': Metric(Sum(Col('manufacturing_costs')), None, None),
+    'total_shipping_costs': Metric(Sum(Col('shipping_costs')), None, None),
+    'total_costs': Metric(Sum(Col('costs')), 'Total Costs', 'Supply Chain Costs'),
+
+    # Row averages of data_processing.add_calculated_fields' derived columns
+    'avg_delivery_ratio': Metric(mean('delivery_ratio'), None, None),
+    'avg_inventory_turnover': Metric(mean('inventory_turnover'), None, None),
+    'avg_unit_shipping_cost': Metric(mean('avg_shipping_cost'), None, None),
+}
+
+# Report name -> (dimensions, {output column: metric}), written to sql/queries.sql by
+# queries_file and run by db_operations.run_queries; names and columns are those of the
+# former hand-written reports
+REPORTS = {
+    'inventory_management_2': (['product_type'], {'total_stock': 'total_stock'}),
+    'days_of_inventory_remaining': (['sku'], {'days_inventory_remaining': 'days_inventory_remaining'}),
+    'order_fulfillment': ([], {'total_orders': 'order_count', 'on_time_orders': 'on_time_orders',
+                               'on_time_delivery_rate': 'on_time_delivery_rate'}),
+    'supplier_performance': (['supplier_name'], {'avg_delivery_time': 'avg_delivery_time',
+                                                 'avg_defect_rate': 'avg_defect_rate'}),
+    'transportation_efficiency': (['shipping_carriers'], {'avg_transit_time': 'avg_transit_time'}),
+    'supply_chain_costs': (['transportation_modes'], {'total_cost': 'total_costs'}),
+    'supply_chain_costs_2': ([], {'overall_costs': 'total_costs'}),
+}
+
+# Plain row listings of sql/queries.sql (no aggregates), written ahead of REPORTS
+LISTINGS = {
+    'inventory_management': ['product_type', 'sku', 'stock_levels', 'availability'],
+}
+
+# sql/queries.sql headings of reports sharing a name; the parenthesised note tells them apart
+# and is dropped again when db_operations.read_named_queries names them
+HEADINGS = {
+    'inventory_management': 'Inventory Management (stock per SKU)',
+    'inventory_management_2': 'Inventory Management (stock by product type)',
+    'supply_chain_costs': 'Supply Chain Costs (by transportation mode)',
+    'supply_chain_costs_2': 'Supply Chain Costs (overall)',
+}
+
+# snake_case name -> CSV header, for the DuckDB store and Tableau
+CSV_NAMES = {snake_case(column): column for column in ALL_COLUMNS}
+
+
+def _selection(metrics):
+    """{output column: Metric} from a list of metric names or an {output column: metric name} dict."""
+    names = metrics if isinstance(metrics, dict) else {name: name for name in metrics}
+    unknown = [name for name in names.values() if name not in METRICS]
+    if unknown:
+        raise ValueError(f"Unknown metric(s) {unknown} (expected some of {sorted(METRICS)})")
+    return {alias: METRICS[name] for alias, name in names.items()}
+
+
+def _identifier(name):
+    # Bare when possible, so db_operations.advise_indexes can read the column names back
+    return name if re.fullmatch(r'[a-z_][a-z0-9_]*', name) else '"' + name.replace('"', '""') + '"'
+
+
+def to_sql(node, dialect='duckdb', columns=None):
+    """SQL expression for a node; `columns` maps snake_case names to the table's column names."""
+    def sql(n):
+        if isinstance(n, Col):
+            return _identifier((columns or {}).get(n.name, n.name))
+        if isinstance(n, Const):
+            return repr(n.value)
+        if isinstance(n, Cmp):
+            return f"CASE WHEN {sql(n.left)} {n.op} {sql(n.right)} THEN 1 ELSE 0 END"
+        if isinstance(n, Sum):
+            return f"COALESCE(SUM({sql(n.expr)}), 0)"
+        if isinstance(n, Count):
+            return "COUNT(*)"
+        if isinstance(n, CountOf):
+            return f"COUNT({sql(n.expr)})"
+        if isinstance(n, Div):
+            return f"CAST({sql(n.left)} AS {FLOAT_TYPES[dialect]}) / NULLIF({sql(n.right)}, 0)"
+        if isinstance(n, Sub):
+            return f"({sql(n.left)} - {sql(n.right)})"
+        raise ValueError(f"Cannot compile {n!r}")
+    return sql(node)
+
+
+def to_tableau(node):
+    """Tableau calculated-field formula for a node (fields by their CSV names)."""
+    def calc(n):
+        if isinstance(n, Col):
+            return f"[{CSV_NAMES.get(n.name, n.name)}]"
+        if isinstance(n, Const):
+            return repr(n.value)
+        if isinstance(n, Cmp):
+            return f"IF {calc(n.left)} {n.op} {calc(n.right)} THEN 1 ELSE 0 END"
+        if isinstance(n, Div) and isinstance(n.left, Sum) and isinstance(n.right, CountOf) and n.left.expr == n.right.expr:
+            return f"AVG({calc(n.left.expr)})"
+        if isinstance(n, Sum):
+            return f"SUM({calc(n.expr)})"
+        if isinstance(n, Count):
+            return "COUNT([SKU])"
+        if isinstance(n, CountOf):
+            return f"COUNT({calc(n.expr)})"
+        if isinstance(n, Div):
+            return f"{calc(n.left)} / {calc(n.right)}"
+        if isinstance(n, Sub):
+            return f"{calc(n.left)} - {calc(n.right)}"
+        raise ValueError(f"Cannot compile {n!r}")
+    return calc(node)
+
+
+def measures(metrics, dialect='duckdb', columns=None):
+    """{output column: SQL aggregate expression} for the metrics."""
+    return {alias: to_sql(metric.formula, dialect, columns) for alias, metric in _selection(metrics).items()}
+
+
+def compile_sql(metrics, dims=(), table='supply_chain', dialect='duckdb', where='', columns=None):
+    """One SELECT computing every requested metric per dims group in a single scan."""
+    if dialect not in FLOAT_TYPES:
+        raise ValueError(f"Unknown SQL dialect '{dialect}' (expected one of {sorted(FLOAT_TYPES)})")
+    keys = [_identifier((columns or {}).get(d, d)) for d in dims]
+    select = [f"{key} AS {_identifier(d)}" if key != _identifier(d) else key for key, d in zip(keys, dims)]
+    select += [f"{sql} AS {_identifier(alias)}" for alias, sql in measures(metrics, dialect, columns).items()]
+    query = 'SELECT\n    ' + ',\n    '.join(select) + f"\nFROM {table}{where}"
+    if keys:
+        query += f"\nGROUP BY {', '.join(keys)}\nORDER BY {', '.join(keys)}"
+    return query
+
+
+def report_queries(dialect='sqlite'):
+    """{report name: SQL} for REPORTS."""
+    return {name: compile_sql(metrics, dims, dialect=dialect) for name, (dims, metrics) in REPORTS.items()}
+
+
+def queries_file():
+    """sql/queries.sql contents: LISTINGS and REPORTS in SQLite SQL under their report headings.
+
+    Headings are what db_operations.read_named_queries turns back into the
+    report names (a repeated heading gets a _2 suffix); one select item per line.
+    """
+    queries = {name: 'SELECT\n    ' + ',\n    '.join(columns) + '\nFROM supply_chain' for name, columns in LISTINGS.items()}
+    queries.update(report_queries('sqlite'))
+    header = [
+        '-- queries.sql',
+        '-- Generated from LISTINGS and REPORTS in scripts/metrics.py, regenerate with',
+        '--     python -m scripts.metrics --queries > sql/queries.sql',
+        '-- Days of Inventory Remaining is AVG(stock_levels) / AVG(number_of_products_sold)',
+        '-- per SKU, in sales periods: one row per SKU. The earlier hand-written query',
+        '-- returned stock_levels / AVG(number_of_products_sold) per (sku, stock_levels).',
+        '-- On-time delivery rate is a fraction between 0 and 1.',
+    ]
+    blocks = [f"-- {HEADINGS.get(name) or name.replace('_', ' ').title()}\n{sql};" for name, sql in queries.items()]
+    return '\n'.join(header) + '\n\n' + '\n\n'.join(blocks) + '\n'
+
+
+def _walk(node):
+    yield node
+    for child in node:
+        if isinstance(child, tuple):
+            yield from _walk(child)
+
+
+def aggregate_key(node):
+    """Name of an aggregate in base_aggregates frames: its SQL text."""
+    return to_sql(node)
+
+
+def aggregates_of(metrics):
+    """The distinct aggregate nodes the metrics need, by aggregate_key."""
+    found = {}
+    for metric in _selection(metrics).values():
+        for node in _walk(metric.formula):
+            if isinstance(node, AGGREGATES):
+                found.setdefault(aggregate_key(node), node)
+    return found
+
+
+def row_values(node, df):
+    """Vectorized value of a row expression over df."""
+    if isinstance(node, Col):
+        return df[node.name].to_numpy()
+    if isinstance(node, Const):
+        return np.full(len(df), node.value)
+    if isinstance(node, Cmp):
+        left = np.asarray(row_values(node.left, df), dtype='float64')
+        right = np.asarray(row_values(node.right, df), dtype='float64')
+        with np.errstate(invalid='ignore'):
+            return OPERATORS[node.op](left, right).astype('int8')
+    raise ValueError(f"{node!r} is not a row expression")
+
+
+def base_aggregates(df, metrics, dims=()):
+    """Every aggregate the metrics need, per dims group, in one groupby pass (columns by aggregate_key).
+
+    The result is a mergeable partial: frames from different row sets add up.
+    """
+    columns = {}
+    for key, node in aggregates_of(metrics).items():
+        if isinstance(node, Count):
+            columns[key] = np.ones(len(df), dtype='int64')
+        elif isinstance(node, CountOf):
+            columns[key] = pd.notna(row_values(node.expr, df)).astype('int64')
+        else:
+            columns[key] = np.asarray(row_values(node.expr, df), dtype='float64')
+    frame = pd.DataFrame(columns, index=df.index)
+    if not dims:
+        return frame.sum().to_frame().T
+    return frame.groupby([df[d] for d in dims], observed=True, sort=True).sum()
+
+
+def query_base_aggregates(con, metrics, dims=(), table='supply_chain'):
+    """base_aggregates computed by DuckDB over a table (or a query in parentheses) on `con`."""
+    found = aggregates_of(metrics)
+    keys = [_identifier(d) for d in dims]
+    select = keys + [f'{to_sql(node)} AS {_identifier(key)}' for key, node in found.items()]
+    sql = f"SELECT {', '.join(select)} FROM {table}"
+    if keys:
+        sql += f" GROUP BY {', '.join(keys)}"
+    frame = con.execute(sql).df()
+    for key, node in found.items():
+        frame[key] = frame[key].astype('int64' if isinstance(node, (Count, CountOf)) else 'float64')
+    return frame.set_index(list(dims)).sort_index() if dims else frame
+
+
+def evaluate(metrics, base):
+    """Metric values from base aggregates (a frame from base_aggregates, or a dict of scalars)."""
+    def value(n):
+        if isinstance(n, AGGREGATES):
+            return np.asarray(base[aggregate_key(n)], dtype='float64')
+        if isinstance(n, Const):
+            return np.float64(n.value)
+        if isinstance(n, Div):
+            left, right = value(n.left), value(n.right)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return np.where(right != 0, left / np.where(right != 0, right, 1), np.nan)
+        if isinstance(n, Sub):
+            return value(n.left) - value(n.right)
+        raise ValueError(f"Cannot evaluate {n!r} on aggregates")
+
+    values = {alias: value(metric.formula) for alias, metric in _selection(metrics).items()}
+    if isinstance(base, pd.DataFrame):
+        return pd.DataFrame(values, index=base.index)
+    return {alias: v.item() for alias, v in values.items()}
+
+
+def compute(df, metrics, dims=()):
+    """Metrics per dims group over a DataFrame (the pandas backend of compile_sql)."""
+    result = evaluate(metrics, base_aggregates(df, metrics, dims))
+    return result.reset_index() if dims else result.reset_index(drop=True)
+
+
+def query(con, metrics, dims=(), table='supply_chain', dialect='duckdb', filters=None, columns=None):
+    """Run the fused metrics query on a DuckDB or SQLite connection and return a DataFrame."""
+    from scripts.store import build_where
+    where, params = build_where({(columns or {}).get(c, c): v for c, v in (filters or {}).items()})
+    sql = compile_sql(metrics, dims, table, dialect, where, columns)
+    if dialect == 'duckdb':
+        return con.execute(sql, params).df()
+    return pd.read_sql_query(sql, con, params=params)
+
+
+def tableau_fields():
+    """calculated_fields.txt contents: every labelled metric as a Tableau formula, by section."""
+    sections = {}
+    for metric in METRICS.values():
+        if metric.label:
+            sections.setdefault(metric.section, []).append(f'{metric.label}:\n{to_tableau(metric.formula)}')
+    return '\n\n'.join(f'// {section}\n' + '\n\n'.join(fields) for section, fields in sections.items()) + '\n'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compile registry metrics to a fused query')
+    parser.add_argument('--metrics', nargs='+', default=list(METRICS))
+    parser.add_argument('--dims', nargs='*', default=[])
+    parser.add_argument('--sql', choices=sorted(FLOAT_TYPES), help='Print the fused query for this dialect')
+    parser.add_argument('--tableau', action='store_true', help='Print the Tableau calculated fields')
+    parser.add_argument('--queries', action='store_true', help='Print sql/queries.sql')
+    args = parser.parse_args()
+    if args.tableau:
+        print(tableau_fields(), end='')
+    elif args.queries:
+        print(queries_file(), end='')
+    else:
+        print(compile_sql(args.metrics, args.dims, dialect=args.sql or 'duckdb') + ';')
+
+
+if __name__ == '__main__':
+    main()
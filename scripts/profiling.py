@@ -0,0 +1,112 @@
+# scripts/profiling.py
+"""Per-stage render timings for the Streamlit dashboards.
+
+A Profiler times named stages of one rerun (data load, DuckDB queries,
+groupbys, figure builds, st.plotly_chart serialization), drives a progress
+bar while the page builds, and shows the results in a collapsible panel with
+JSON/CSV downloads for offline regression tracking. Charts served through
+scripts/chart_cache.py also record the bytes shipped and whether the payload
+was a cache hit.
+"""
+import json
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+import streamlit as st
+
+# Stage kinds, in the order the debug panel summarises them
+KINDS = ['load', 'query', 'groupby', 'figure', 'render']
+
+
+class Profiler:
+    """Collects stage timings for one rerun and reports progress as stages finish."""
+
+    def __init__(self, progress=None, expected=None):
+        self.records = []
+        self.progress = progress
+        self.expected = expected
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name, kind):
+        """Time the enclosed block as one stage."""
+        if self.progress is not None:
+            fraction = min(len(self.records) / self.expected, 1.0) if self.expected else 0.0
+            self.progress.progress(fraction, text=f'{name}...')
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.records.append({
+                'stage': name,
+                'kind': kind,
+                'offset': start - self.started,
+                'seconds': time.perf_counter() - start,
+            })
+
+    def plotly_chart(self, fig, name, **kwargs):
+        """st.plotly_chart, timed as the 'render' stage of a chart (figure -> JSON -> frontend)."""
+        with self.stage(name, 'render'):
+            return st.plotly_chart(fig, **kwargs)
+
+    def chart(self, payloads, name, inputs, theme, build, use_container_width=True):
+        """A chart through the payload cache: 'figure' times the lookup (or build + serialize), 'render' the send."""
+        from scripts.chart_cache import send_spec
+
+        with self.stage(name, 'figure'):
+            spec, hit = payloads.payload(name, inputs, theme, build)
+        with self.stage(name, 'render'):
+            element = send_spec(spec, use_container_width=use_container_width)
+        for record in self.records[-2:]:
+            record.update(bytes=len(spec), cached=hit)
+        return element
+
+    def finish(self):
+        """Clear the progress bar; returns the number of stages recorded."""
+        if self.progress is not None:
+            self.progress.empty()
+            self.progress = None
+        return len(self.records)
+
+    def to_frame(self):
+        return pd.DataFrame(self.records, columns=['stage', 'kind', 'offset', 'seconds', 'bytes', 'cached'])
+
+    def to_json(self):
+        return json.dumps({'total_seconds': time.perf_counter() - self.started, 'stages': self.records}, indent=2)
+
+    def to_csv(self):
+        return self.to_frame().to_csv(index=False)
+
+    def dump(self, path):
+        """Write the timings to a .json or .csv file."""
+        with open(path, 'w') as f:
+            f.write(self.to_csv() if path.endswith('.csv') else self.to_json())
+
+    def summary(self):
+        """Total seconds and stage count per kind."""
+        frame = self.to_frame()
+        summary = frame.groupby('kind')['seconds'].agg(['sum', 'count']).reindex(KINDS).dropna()
+        return summary.rename(columns={'sum': 'seconds', 'count': 'stages'})
+
+    def chart_bytes(self):
+        """Bytes shipped and cache hit per chart sent through chart(), largest first."""
+        frame = self.to_frame()
+        frame = frame[(frame['kind'] == 'render') & frame['bytes'].notna()]
+        frame = frame[['stage', 'bytes', 'cached']].astype({'bytes': 'int64', 'cached': 'bool'})
+        return frame.sort_values('bytes', ascending=False).reset_index(drop=True)
+
+    def render(self, title='⏱️ Render timings'):
+        """Collapsible debug panel with the slowest stages first and JSON/CSV downloads."""
+        with st.expander(title, expanded=False):
+            st.caption(f"{len(self.records)} stages, {time.perf_counter() - self.started:.3f}s since the rerun started")
+            st.dataframe(self.summary(), use_container_width=True)
+            charts = self.chart_bytes()
+            if len(charts):
+                st.caption(f"{charts['bytes'].sum() / 1024:,.1f} KB of chart payloads shipped, "
+                           f"{int(charts['cached'].sum())}/{len(charts)} from the cache")
+                st.dataframe(charts, use_container_width=True)
+            st.dataframe(self.to_frame().sort_values('seconds', ascending=False), use_container_width=True)
+            columns = st.columns(2)
+            columns[0].download_button('Download JSON', self.to_json(), 'render_timings.json', 'application/json')
+            columns[1].download_button('Download CSV', self.to_csv(), 'render_timings.csv', 'text/csv')
@@ -0,0 +1,142 @@
+# scripts/result_cache.py
+"""Process-wide cache of aggregation results, shared by every dashboard session.
+
+Entries are keyed by (dataset version, filters, metric). The cache evicts the
+least recently used entries to stay under a memory budget, expires entries
+after a TTL, and drops everything computed for an older dataset version as
+soon as a newer version is seen. With a disk directory, entries are also
+pickled there so a restarted app starts warm.
+"""
+import hashlib
+import os
+import pickle
+import shutil
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+from scripts.filters import filter_key
+
+MAX_BYTES = 256 * 1024 ** 2
+TTL_SECONDS = 3600
+
+
+def sizeof(value):
+    """Approximate in-memory size of a cached result (DataFrames, dicts/lists of them, scalars)."""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sizeof(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(sizeof(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class ResultCache:
+    """LRU + TTL cache with a memory budget, hit/miss counters and version invalidation."""
+
+    def __init__(self, max_bytes=MAX_BYTES, ttl=TTL_SECONDS, disk_dir=None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self.entries = OrderedDict()  # key -> (value, size, stored_at)
+        self.bytes = 0
+        self.version = None
+        self.counters = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0,
+                         'invalidations': 0}
+        self.lock = threading.Lock()
+
+    def _disk_path(self, key):
+        version, rest = key[0], key[1:]
+        folder = hashlib.sha1(repr(version).encode()).hexdigest()[:16]
+        return os.path.join(self.disk_dir, folder, hashlib.sha1(repr(rest).encode()).hexdigest() + '.pkl')
+
+    def _invalidate(self, version):
+        # Everything computed for another dataset version is stale
+        self.entries.clear()
+        self.bytes = 0
+        self.version = version
+        self.counters['invalidations'] += 1
+        if self.disk_dir and os.path.isdir(self.disk_dir):
+            keep = os.path.basename(os.path.dirname(self._disk_path((version,))))
+            for folder in os.listdir(self.disk_dir):
+                if folder != keep:
+                    shutil.rmtree(os.path.join(self.disk_dir, folder), ignore_errors=True)
+
+    def _store(self, key, value, stored_at):
+        size = sizeof(value)
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self.bytes -= self.entries.pop(key)[1]
+        self.entries[key] = (value, size, stored_at)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, (_, evicted, _) = self.entries.popitem(last=False)
+            self.bytes -= evicted
+            self.counters['evictions'] += 1
+
+    def _lookup(self, key, now):
+        if key in self.entries:
+            value, size, stored_at = self.entries[key]
+            if self.ttl is None or now - stored_at < self.ttl:
+                self.entries.move_to_end(key)
+                self.counters['hits'] += 1
+                return True, value
+            del self.entries[key]
+            self.bytes -= size
+            self.counters['expirations'] += 1
+        if self.disk_dir:
+            path = self._disk_path(key)
+            if os.path.exists(path) and (self.ttl is None or now - os.path.getmtime(path) < self.ttl):
+                with open(path, 'rb') as f:
+                    value = pickle.load(f)
+                self._store(key, value, os.path.getmtime(path))
+                self.counters['disk_hits'] += 1
+                return True, value
+        return False, None
+
+    def get_or_compute(self, version, filters, metric, compute):
+        """Cached result for (version, filters, metric), calling compute() on a miss."""
+        return self.get_or_compute_key(version, (filter_key(filters), metric), compute)
+
+    def get_or_compute_key(self, version, key, compute):
+        """Cached result for (version, *key) with any hashable key tuple, calling compute() on a miss."""
+        key = (version,) + tuple(key)
+        with self.lock:
+            if version != self.version:
+                self._invalidate(version)
+            found, value = self._lookup(key, time.time())
+            if found:
+                return value
+            self.counters['misses'] += 1
+        # Compute outside the lock so sessions asking for other keys are not blocked
+        value = compute()
+        with self.lock:
+            if version == self.version:
+                self._store(key, value, time.time())
+                if self.disk_dir:
+                    path = self._disk_path(key)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    with open(path + '.tmp', 'wb') as f:
+                        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+                    os.replace(path + '.tmp', path)
+        return value
+
+    def clear(self):
+        """Drop every in-memory entry (counters are kept)."""
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """Counters plus current size and hit rate."""
+        with self.lock:
+            lookups = self.counters['hits'] + self.counters['disk_hits'] + self.counters['misses']
+            hit_rate = (self.counters['hits'] + self.counters['disk_hits']) / lookups if lookups else 0.0
+            return dict(self.counters, entries=len(self.entries), bytes=self.bytes, hit_rate=hit_rate)
@@ -0,0 +1,163 @@
+# scripts/schema.py
+"""Canonical column types of the supply chain dataset.
+
+One table drives every loader: the DuckDB store (column and ENUM types),
+pandas reads of the CSV (categoricals, narrow integers), the processed
+snake_case frame and the SQLite table built by db_operations. Values are
+validated on load, so a bad batch fails loudly instead of overflowing a
+narrow type. Money and rate columns stay float64: float32 is not exact enough
+for revenue sums. The optional Shipment date column is parsed once, at load,
+never per rerun.
+"""
+import csv
+
+import numpy as np
+import pandas as pd
+
+# CSV column -> (DuckDB type, pandas dtype)
+COLUMNS = {
+    'Product type': ('VARCHAR', 'category'),
+    'SKU': ('VARCHAR', 'str'),
+    'Price': ('DOUBLE', 'float64'),
+    'Availability': ('SMALLINT', 'int16'),
+    'Number of products sold': ('INTEGER', 'int32'),
+    'Revenue generated': ('DOUBLE', 'float64'),
+    'Customer demographics': ('VARCHAR', 'category'),
+    'Stock levels': ('SMALLINT', 'int16'),
+    'Lead times': ('SMALLINT', 'int16'),
+    'Order quantities': ('SMALLINT', 'int16'),
+    'Shipping times': ('SMALLINT', 'int16'),
+    'Shipping carriers': ('VARCHAR', 'category'),
+    'Shipping costs': ('DOUBLE', 'float64'),
+    'Supplier name': ('VARCHAR', 'category'),
+    'Location': ('VARCHAR', 'category'),
+    'Lead time': ('SMALLINT', 'int16'),
+    'Production volumes': ('INTEGER', 'int32'),
+    'Manufacturing lead time': ('SMALLINT', 'int16'),
+    'Manufacturing costs': ('DOUBLE', 'float64'),
+    'Inspection results': ('VARCHAR', 'category'),
+    'Defect rates': ('DOUBLE', 'float64'),
+    'Transportation modes': ('VARCHAR', 'category'),
+    'Routes': ('VARCHAR', 'category'),
+    'Costs': ('DOUBLE', 'float64'),
+}
+
+# Columns added by data_processing.add_calculated_fields (snake_case) -> pandas dtype
+DERIVED_COLUMNS = {
+    'total_revenue': 'float64',
+    'delayed_shipment': 'int8',
+    'delivery_ratio': 'float64',
+    'inventory_turnover': 'float64',
+    'avg_shipping_cost': 'float64',
+}
+
+# Columns a CSV may carry but the sample data does not (history exports); same shape as COLUMNS
+OPTIONAL_COLUMNS = {
+    'Shipment date': ('DATE', 'datetime64[ms]'),
+}
+
+ALL_COLUMNS = {**COLUMNS, **OPTIONAL_COLUMNS}
+CSV_COLUMNS = {column: sql_type for column, (sql_type, _) in COLUMNS.items()}
+CATEGORICAL_COLUMNS = [column for column, (_, dtype) in COLUMNS.items() if dtype == 'category']
+INTEGER_COLUMNS = [column for column, (_, dtype) in COLUMNS.items() if dtype.startswith('int')]
+
+# Counts, days, money and rates: every numeric input column must be >= 0
+NON_NEGATIVE = [column for column, (sql_type, _) in COLUMNS.items() if sql_type != 'VARCHAR']
+
+
+def snake_case(column):
+    """CSV header -> processed column name (same rule as data_processing.normalize_columns)."""
+    return column.strip().lower().replace(' ', '_')
+
+
+# Every known column under both its CSV and its snake_case name -> pandas dtype
+DTYPES = {column: dtype for column, (_, dtype) in ALL_COLUMNS.items()}
+DTYPES.update({snake_case(column): dtype for column, dtype in list(DTYPES.items())})
+DTYPES.update(DERIVED_COLUMNS)
+_NON_NEGATIVE = set(NON_NEGATIVE) | {snake_case(column) for column in NON_NEGATIVE}
+
+
+def sqlite_columns():
+    """(name, SQLite type) of the processed table, in column order."""
+    columns = [(snake_case(column), dtype) for column, (_, dtype) in COLUMNS.items()]
+    columns += list(DERIVED_COLUMNS.items())
+    return [(name, 'INTEGER' if dtype.startswith('int') else 'REAL' if dtype.startswith('float') else 'TEXT')
+            for name, dtype in columns]
+
+
+def file_columns(header):
+    """{column: DuckDB type} for a CSV header, in file order; ValueError on missing or unknown columns."""
+    missing = [column for column in COLUMNS if column not in header]
+    unknown = [column for column in header if column not in ALL_COLUMNS]
+    if missing or unknown:
+        raise ValueError(f"CSV header mismatch: missing {missing}, unknown {unknown}")
+    return {column: ALL_COLUMNS[column][0] for column in header}
+
+
+def read_header(path):
+    """Column names of a CSV file."""
+    with open(path, newline='') as f:
+        return next(csv.reader(f), [])
+
+
+def validate(df):
+    """Raise ValueError listing every known column that is non-numeric, negative or out of its type's range."""
+    problems = []
+    for column in df.columns:
+        dtype = DTYPES.get(column)
+        if dtype is None or dtype in ('category', 'str') or dtype.startswith('datetime'):
+            continue
+        values = df[column]
+        if not pd.api.types.is_numeric_dtype(values):
+            problems.append(f"'{column}' is not numeric ({values.dtype})")
+            continue
+        if column in _NON_NEGATIVE and (values < 0).any():
+            problems.append(f"'{column}' has {int((values < 0).sum())} negative value(s)")
+        if dtype.startswith('int'):
+            present = values.dropna()
+            info = np.iinfo(dtype)
+            if len(present) and (present.min() < info.min or present.max() > info.max):
+                problems.append(f"'{column}' has values outside {dtype} [{info.min}, {info.max}]")
+            elif pd.api.types.is_float_dtype(present) and (present != np.floor(present)).any():
+                problems.append(f"'{column}' has non-integer values")
+    if problems:
+        raise ValueError('Schema validation failed: ' + '; '.join(problems))
+
+
+def apply_schema(df, categorical=True, check=True):
+    """Cast the known columns of df (CSV or snake_case names) to their canonical dtypes.
+
+    Integer columns holding missing values stay float64, as pd.read_csv leaves
+    them. With categorical=False, text columns are left alone (for chunked
+    readers, whose chunks would otherwise get different category sets).
+    """
+    if check:
+        validate(df)
+    for column in df.columns:
+        dtype = DTYPES.get(column)
+        if dtype is None or df[column].dtype == dtype:
+            continue
+        if dtype == 'category':
+            if categorical:
+                df[column] = df[column].astype('category')
+        elif dtype == 'str':
+            if categorical:
+                df[column] = df[column].astype('str')
+        elif dtype.startswith('datetime'):
+            df[column] = pd.to_datetime(df[column]).astype(dtype)
+        elif dtype.startswith('int') and df[column].isna().any():
+            df[column] = df[column].astype('float64')
+        else:
+            df[column] = df[column].astype(dtype)
+    return df
+
+
+def read_csv(path, **kwargs):
+    """pd.read_csv with the canonical dtypes: categoricals parsed directly, numerics narrowed and validated."""
+    df = pd.read_csv(path, dtype={column: 'category' for column in CATEGORICAL_COLUMNS}, **kwargs)
+    return apply_schema(df)
+
+
+def memory_per_row(df):
+    """Bytes per row, including string payloads."""
+    return df.memory_usage(deep=True, index=False).sum() / max(len(df), 1)
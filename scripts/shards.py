@@ -0,0 +1,599 @@
+# scripts/shards.py
+"""Sharded scatter-gather aggregation across worker processes (or nodes).
+
+The store's rows are split into shards, by a hash of the SKU or by Location.
+Each shard worker holds its rows in an in-memory DuckDB table and answers
+these queries for a filter selection:
+
+- aggregates: the additive cells of app.py's KPI and chart groupings (row
+  counts, sums, sums of squares and cross products; see cube.py);
+- sketches: dashboard_app.py's approximate-mode sketch cells (see sketches.py);
+- the raw-row chart inputs of downsampling.StoreRows: group sizes and ranked
+  samples, value bounds and bin counts, value counts, and a preview.
+
+The coordinator sends the query to every shard that can hold matching rows
+(a Location filter prunes the others when sharding by location) and merges
+the replies: aggregate cells are summed per grouping and finalized (the
+result has the same shape as Cube.lookup()), sketches are merged, samples
+keep the lowest-ranked rows per group, and counts are added up. Workers talk
+over multiprocessing.connection, which runs on a local socket or TCP, so a
+shard can run on another machine:
+
+    python -m scripts.shards serve --shard 0 --shards 4 --port 7000    # on each node
+    python -m scripts.shards query --connect node1:7000 node2:7000 ...
+
+Replies that miss the timeout, or a connection that breaks, are retried with
+exponential backoff after reconnecting. A local worker that died is started
+again and reloads its shard. Set SHARDS=n (and optionally SHARD_BY=location)
+to have app.py answer its KPIs, charts and dataset preview (and dashboard_app.py
+its approximate mode) from n local shard workers, or SHARD_ADDRESSES=host:port,...
+to use running workers; the coordinator then needs no store of its own.
+"""
+import argparse
+import atexit
+import multiprocessing
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+from scripts.aggregations import build_grouping_sets_query, grouping_dimensions, split_grouping_sets
+from scripts.cube import APP_CUBE, additive_measures, finalize
+from scripts.downsampling import (PREVIEW_ROWS, SCATTER_BINS, SCATTER_POINT_BUDGET, bin_centers, bin_counts,
+                                  count_values, group_sizes, head_rows, sample_quotas, sample_rows, value_bounds)
+from scripts.result_cache import ResultCache
+from scripts.sketches import SKETCH_CONFIG, SketchCube
+from scripts.store import DB_PATH, TABLE, build_where, connect, distinct_values, quote, require_info
+
+AUTHKEY = os.environ.get('SHARD_AUTHKEY', 'supply-chain').encode()
+TIMEOUT_SECONDS = 30
+RETRIES = 2
+BACKOFF_SECONDS = 0.2
+START_SECONDS = 300  # a local worker loading its shard
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def shard_predicate(db_path, shard, shards, by='sku'):
+    """WHERE clause and params selecting one shard's rows from the store."""
+    if not 0 <= shard < shards:
+        raise ValueError(f"Shard {shard} out of range for {shards} shards")
+    if by == 'sku':
+        return f" WHERE hash({quote('SKU')}) % ? = ?", [shards, shard]
+    if by == 'location':
+        locations = shard_locations(db_path, shards)[shard]
+        return f" WHERE {quote('Location')} IN ({', '.join('?' for _ in locations)})", locations
+    raise ValueError(f"Cannot shard by '{by}' (expected 'sku' or 'location')")
+
+
+def shard_locations(db_path, shards):
+    """Locations owned by each shard: sorted, then dealt round-robin."""
+    locations = sorted(distinct_values(db_path, 'Location'))
+    if shards > len(locations):
+        raise ValueError(f"Cannot split {len(locations)} locations into {shards} shards")
+    return [locations[i::shards] for i in range(shards)]
+
+
+class Shard:
+    """One shard's rows and the queries run on them, inside a worker."""
+
+    def __init__(self, db_path, shard, shards, by='sku', threads=None, config=APP_CUBE):
+        self.db_path, self.shard, self.shards, self.by = db_path, shard, shards, by
+        self.threads = threads
+        self.config = config
+        self.measures = additive_measures(config)
+        self.lock = threading.Lock()
+        self.con = None
+        self.version = None
+        self.load()
+
+    def load(self):
+        """(Re)load this shard's rows from the store; the DuckDB table is the only copy kept."""
+        start = time.perf_counter()
+        where, params = shard_predicate(self.db_path, self.shard, self.shards, self.by)
+        store = connect(self.db_path)
+        try:
+            rows = store.execute(f"SELECT * FROM {TABLE}{where}", params).to_arrow_table()
+            version = store.execute("SELECT ingested_at FROM store_info").fetchone()[0]
+        finally:
+            store.close()
+        con = duckdb.connect()
+        if self.threads:
+            con.execute(f"SET threads = {int(self.threads)}")
+        con.register('rows_arrow', rows)
+        con.execute("CREATE TABLE shard AS SELECT * FROM rows_arrow")
+        con.unregister('rows_arrow')
+        count = rows.num_rows
+        del rows
+        locations = params if self.by == 'location' else None
+        with self.lock:
+            if self.con is not None:
+                self.con.close()
+            self.con, self.version, self.sketch_cube = con, version, None
+            self.summary = {'shard': self.shard, 'shards': self.shards, 'by': self.by, 'rows': count,
+                            'version': version, 'locations': locations}
+        print(f"Shard {self.shard}/{self.shards} loaded {count:,} rows in {time.perf_counter() - start:.2f}s")
+
+    def info(self):
+        """Shard number, row count, store version and (sharded by location) the locations it owns."""
+        return self.summary
+
+    def refresh(self):
+        """Reload when the store changed since the last load; returns info()."""
+        if require_info(self.db_path)['ingested_at'] != self.version:
+            self.load()
+        return self.info()
+
+    def aggregates(self, filters):
+        """Additive cells of every chart grouping for the shard's rows matching filters, in one frame.
+
+        The coordinator splits the merged cells into groupings, so each shard does not.
+        """
+        where, params = build_where(filters)
+        query = build_grouping_sets_query('shard', self.config['groupings'], self.measures, where)
+        with self.lock:
+            return self.con.execute(query, params).df()
+
+    def sketches(self, filters):
+        """The sketch cells matching filters, as a SketchCube to merge with other shards'.
+
+        Built on first use from the sketched columns only, streamed out of the
+        shard table a chunk at a time.
+        """
+        with self.lock:
+            if self.sketch_cube is None:
+                self.sketch_cube = SketchCube.from_query(self.con, 'shard')
+            selected = SketchCube(SKETCH_CONFIG)
+            selected.cells = self.sketch_cube._select(filters)
+            return selected
+
+    def _rows(self, filters, compute):
+        # A downsampling query over the shard's rows matching filters (StoreRows._run on the shard table)
+        where, params = build_where(filters)
+        with self.lock:
+            return compute(self.con, 'shard', where, params)
+
+    def group_sizes(self, filters, by):
+        """{group: rows} of the selection, for the coordinator's sample quotas."""
+        return self._rows(filters, lambda con, table, where, params: group_sizes(con, table, by, where, params))
+
+    def sample(self, filters, columns, by, quotas):
+        """The shard's part of a stratified sample with the whole selection's quotas, with each row's _rank."""
+        return self._rows(filters, lambda con, table, where, params:
+                          sample_rows(con, table, columns, by, where=where, params=params, quotas=quotas, ranked=True))
+
+    def bounds(self, filters, columns):
+        """value_bounds of the selection's rows on this shard."""
+        return self._rows(filters, lambda con, table, where, params: value_bounds(con, table, columns, where, params))
+
+    def bin_counts(self, filters, x, y, bounds, bins):
+        """bin_counts of the selection's rows on this shard, on the grid of the coordinator's bounds."""
+        return self._rows(filters, lambda con, table, where, params:
+                          bin_counts(con, table, x, y, bounds, bins, where, params))
+
+    def value_counts(self, filters, group, value):
+        """count_values of the selection's rows on this shard."""
+        return self._rows(filters, lambda con, table, where, params: count_values(con, table, group, value, where, params))
+
+    def head(self, filters, limit):
+        """The first `limit` rows of the selection on this shard."""
+        return self._rows(filters, lambda con, table, where, params: head_rows(con, table, limit, where, params))
+
+    def distinct_values(self, column):
+        """Distinct values of a column in the whole store (filter options)."""
+        return distinct_values(self.db_path, column)
+
+
+METHODS = ['info', 'refresh', 'aggregates', 'sketches', 'group_sizes', 'sample', 'bounds', 'bin_counts',
+           'value_counts', 'head', 'distinct_values']
+
+
+def _session(shard, conn):
+    # One client connection; replies are (status, result, CPU seconds spent on it). CPU rather
+    # than wall time, so shards sharing too few cores still report the work each one did
+    try:
+        while True:
+            method, args = conn.recv()
+            start = time.process_time()
+            try:
+                if method not in METHODS:
+                    raise ValueError(f"Unknown method '{method}'")
+                reply = ('ok', getattr(shard, method)(*args))
+            except Exception as e:
+                reply = ('error', f"{type(e).__name__}: {e}")
+            conn.send(reply + (time.process_time() - start,))
+    except (EOFError, OSError):
+        # Client went away, possibly after giving up on a slow reply
+        pass
+    finally:
+        conn.close()
+
+
+def serve(db_path, shard, shards, by='sku', address=('127.0.0.1', 0), threads=None, authkey=AUTHKEY):
+    """Load a shard and answer queries on `address` until killed (port 0 picks a free port)."""
+    state = Shard(db_path, shard, shards, by, threads)
+    with Listener(address, authkey=authkey) as listener:
+        host, port = listener.address
+        # ShardClient.start() waits for this line
+        print(f"Shard {shard}/{shards} listening on {host}:{port}", flush=True)
+        while True:
+            try:
+                conn = listener.accept()
+            except (OSError, multiprocessing.AuthenticationError) as e:
+                print(f"Rejected connection: {e}")
+                continue
+            threading.Thread(target=_session, args=(state, conn), daemon=True).start()
+
+
+def _forward(stream, lines):
+    # Echo a local worker's output and queue it for start() to find the address in
+    for line in stream:
+        print(line, end='')
+        lines.put(line)
+    lines.put(None)
+
+
+class ShardClient:
+    """Connection to one shard; optionally owns the local worker process serving it."""
+
+    def __init__(self, address=None, authkey=AUTHKEY, command=None):
+        self.address = address
+        self.authkey = authkey
+        self.command = command  # `scripts.shards serve` arguments for a local worker, None for a remote one
+        self.process = None
+        self.lines = None
+        self.conn = None
+
+    def launch(self):
+        """Start the local worker process unless it is running."""
+        if self.command is None or (self.process is not None and self.process.poll() is None):
+            return
+        # A subprocess rather than multiprocessing: under Streamlit, __main__ is the dashboard
+        # script, which spawned children would re-run
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')])))
+        self.process = subprocess.Popen([sys.executable, '-u', '-m', 'scripts.shards', 'serve', *self.command],
+                                        cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                        text=True)
+        self.lines = queue.Queue()
+        threading.Thread(target=_forward, args=(self.process.stdout, self.lines), daemon=True).start()
+        self.address = None
+
+    def start(self):
+        """Start the local worker if needed, wait until it has loaded its shard, then connect."""
+        self.launch()
+        deadline = time.monotonic() + START_SECONDS
+        while self.address is None:
+            try:
+                line = self.lines.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                self.process.kill()
+                raise TimeoutError(f"Shard worker {self.command} did not start within {START_SECONDS}s") from None
+            if line is None:
+                raise ConnectionError(f"Shard worker {self.command} exited while loading its shard "
+                                      f"(exit code {self.process.wait()})")
+            if ' listening on ' in line:
+                host, port = line.split(' listening on ')[1].strip().rsplit(':', 1)
+                self.address = (host, int(port))
+        self.conn = Client(self.address, authkey=self.authkey)
+
+    def reset(self):
+        """Drop the connection (and any late reply on it) and connect again."""
+        self.close_connection()
+        try:
+            self.start()
+        except OSError as e:
+            # Counted against the retries by the next send
+            print(f"Cannot reach shard at {self.address}: {e!r}")
+
+    def close_connection(self):
+        if self.conn is not None:
+            try:
+                self.conn.close()
+            except OSError:
+                pass
+            self.conn = None
+
+    def stop(self):
+        self.close_connection()
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            self.process.wait(5)
+
+
+class Coordinator:
+    """Scatter a query to the shards, gather partial aggregates and merge them.
+
+    Offers the Cube interface app.py uses (refresh, lookup, results) and the
+    StoreRows one (sample, bins, value_counts, head, distinct_values), so it
+    can stand in for the in-process cube and the store.
+    """
+
+    def __init__(self, clients, by='sku', locations=None, config=APP_CUBE, timeout=TIMEOUT_SECONDS,
+                 retries=RETRIES, backoff=BACKOFF_SECONDS, db_path=None):
+        self.clients = clients
+        self.by = by
+        self.locations = locations  # per shard when sharded by location, for pruning
+        self.db_path = db_path  # the store local workers load; None for remote workers
+        self.config = config
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.results = ResultCache()
+        self.version = None
+        self.timings = {}  # shard -> CPU seconds of its reply, for the last gather
+        self.lock = threading.Lock()
+
+    @classmethod
+    def local(cls, db_path=DB_PATH, shards=4, by='sku', threads=None, **kwargs):
+        """Start `shards` worker processes on this machine, each loading its shard of the store.
+
+        Each worker's DuckDB gets `threads` threads, by default an equal share
+        of the cores, so the workers do not oversubscribe them.
+        """
+        threads = threads or max(1, (os.cpu_count() or 1) // shards)
+        clients = [ShardClient(command=['--db', os.path.abspath(db_path), '--shard', str(i), '--shards', str(shards),
+                                        '--by', by, '--host', '127.0.0.1', '--port', '0', '--threads', str(threads)])
+                   for i in range(shards)]
+        coordinator = cls(clients, by, db_path=db_path, **kwargs)
+        atexit.register(coordinator.close)
+        # Launch them all before waiting on any, so the shards load side by side
+        for client in clients:
+            client.launch()
+        for client in clients:
+            client.start()
+        coordinator.version = require_info(db_path)['ingested_at']
+        coordinator._update(coordinator.gather('info'))
+        return coordinator
+
+    @classmethod
+    def remote(cls, addresses, by='sku', **kwargs):
+        """Connect to workers already serving shards 0..n-1 at `addresses` (host:port strings, in shard order)."""
+        clients = []
+        for address in addresses:
+            host, port = address.rsplit(':', 1)
+            clients.append(ShardClient((host, int(port))))
+        coordinator = cls(clients, by, **kwargs)
+        for client in clients:
+            client.start()
+        coordinator._update(coordinator.gather('info'))
+        return coordinator
+
+    @classmethod
+    def from_env(cls, db_path=DB_PATH):
+        """A coordinator from SHARD_ADDRESSES or SHARDS / SHARD_BY, or None when neither is set.
+
+        db_path is only read for SHARDS (the local workers load it); running
+        workers bring their own stores.
+        """
+        by = os.environ.get('SHARD_BY', 'sku')
+        if os.environ.get('SHARD_ADDRESSES'):
+            return cls.remote(os.environ['SHARD_ADDRESSES'].split(','), by)
+        if os.environ.get('SHARDS'):
+            return cls.local(db_path, int(os.environ['SHARDS']), by)
+        return None
+
+    def close(self):
+        for client in self.clients:
+            client.stop()
+
+    def _targets(self, values):
+        # Shards that can hold rows for the selected locations
+        if self.locations is None or values is None:
+            return list(range(len(self.clients)))
+        values = set(values) if isinstance(values, (list, tuple, set)) else {values}
+        return [i for i, owned in enumerate(self.locations) if values & set(owned)]
+
+    def _send(self, shard, method, args):
+        client = self.clients[shard]
+        if client.conn is None:
+            raise ConnectionError(f"not connected to {client.address}")
+        client.conn.send((method, args))
+
+    def gather(self, method, args=(), shards=None):
+        """{shard: result} of calling `method` on each shard, retrying timeouts and broken connections.
+
+        Raises TimeoutError when a shard still fails after the retries, and
+        ValueError when a shard reports an error (those are not retried: the
+        same query would fail again).
+        """
+        shards = list(range(len(self.clients))) if shards is None else shards
+        attempts = dict.fromkeys(shards, 0)
+        results = {}
+        with self.lock:
+            self.timings = {}
+            while attempts:
+                failed, errors = {}, {}
+                sent = []
+                for shard in attempts:
+                    try:
+                        self._send(shard, method, args)
+                        sent.append(shard)
+                    except (OSError, EOFError) as e:
+                        failed[shard] = e
+                deadline = time.monotonic() + self.timeout
+                for shard in sent:
+                    conn = self.clients[shard].conn
+                    try:
+                        if not conn.poll(max(0.0, deadline - time.monotonic())):
+                            raise TimeoutError(f"no reply within {self.timeout}s")
+                        status, value, seconds = conn.recv()
+                    except (OSError, EOFError) as e:
+                        failed[shard] = e
+                        continue
+                    if status == 'error':
+                        errors[shard] = value
+                    else:
+                        results[shard] = value
+                        self.timings[shard] = seconds
+                    del attempts[shard]
+                # Every reply of this round has been read or its connection is reset, so
+                # nothing stale is left to be read as the answer to the next request
+                for shard, error in failed.items():
+                    attempts[shard] += 1
+                    if not errors and attempts[shard] <= self.retries:
+                        print(f"Shard {shard} {method} failed ({error!r}); retry {attempts[shard]} of {self.retries}")
+                        time.sleep(self.backoff * 2 ** (attempts[shard] - 1))
+                    self.clients[shard].reset()
+                for shard, error in errors.items():
+                    raise ValueError(f"Shard {shard} failed on {method}: {error}")
+                for shard, error in failed.items():
+                    if attempts[shard] > self.retries:
+                        raise TimeoutError(f"Shard {shard} failed {attempts[shard]} times on {method}: {error!r}")
+        return results
+
+    def _update(self, infos):
+        # Shard info() replies: the locations each shard owns, for pruning, and for workers
+        # with their own stores the data version (their store versions, in shard order)
+        if self.by == 'location':
+            self.locations = [infos[shard]['locations'] for shard in sorted(infos)]
+        if self.db_path is None:
+            self.version = tuple(infos[shard]['version'] for shard in sorted(infos))
+
+    def refresh(self, db_path=None):
+        """Have every shard reload if the store changed since they loaded it; returns the data version.
+
+        Local workers load this machine's store (db_path is taken for the Cube
+        interface; the one they were started on is checked), so the shards are
+        only asked when its version moved. Remote workers are asked every time.
+        """
+        if self.db_path is not None:
+            version = require_info(self.db_path)['ingested_at']
+            if version == self.version:
+                return version
+            self._update(self.gather('refresh'))
+            self.version = version
+        else:
+            self._update(self.gather('refresh'))
+        return self.version
+
+    def aggregate(self, filters=None):
+        """Scatter-gather the aggregates for a selection (uncached); shaped like Cube.lookup()."""
+        filters = {d: v for d, v in (filters or {}).items() if v is not None}
+        unknown = set(filters) - set(self.config['dimensions'])
+        if unknown:
+            raise ValueError(f"Shards have no dimension(s) {sorted(unknown)}")
+        partials = list(self.gather('aggregates', (filters,), self._targets(filters.get('Location'))).values())
+        groupings = self.config['groupings']
+        dims = grouping_dimensions(groupings)
+        measure_cols = list(additive_measures(self.config))
+        if partials:
+            cells = pd.concat(partials, ignore_index=True)
+            for dim in dims:
+                # ENUM categoricals; rolled-up dimensions are NULL
+                cells[dim] = cells[dim].astype(object)
+            # Shards with no matching rows report NULL sums, which add nothing
+            cells = cells.groupby(dims + ['_grouping_id'], dropna=False, sort=False)[measure_cols].sum().reset_index()
+        else:
+            cells = pd.DataFrame(columns=dims + ['_grouping_id'] + measure_cols)
+        frames = {}
+        for grouping, part in split_grouping_sets(cells, groupings).items():
+            if not grouping and part.empty:
+                part = pd.DataFrame([{m: 0 for m in measure_cols}])
+            frames[grouping] = finalize(part, self.config, grouping)
+        return frames
+
+    def lookup(self, filters=None):
+        """aggregate(), cached per selection until the store changes; treat results as read-only."""
+        return self.results.get_or_compute(self.version, filters or {}, 'lookup', lambda: self.aggregate(filters))
+
+    def sketches(self, filters=None):
+        """The shards' sketch cells for a selection merged into one SketchCube (processed column names)."""
+        filters = filters or {}
+        merged = SketchCube(SKETCH_CONFIG)
+        for selected in self.gather('sketches', (filters,), self._targets(filters.get('location'))).values():
+            merged.merge(selected)
+        return merged
+
+    def _gather_rows(self, method, filters, *args):
+        # A raw-row query answered by the shards that can hold the selection's rows, in shard order.
+        # When none can, the first shard still answers, for an empty result of the right shape
+        replies = self.gather(method, (filters, *args), self._targets(filters.get('Location')) or [0])
+        return [replies[shard] for shard in sorted(replies)]
+
+    def sample(self, filters, columns, by, budget=SCATTER_POINT_BUDGET):
+        """StoreRows.sample over every shard's rows.
+
+        The quotas come from the group sizes summed over the shards; each shard
+        samples its rows with them, and the rows ranked lowest per group are kept.
+        """
+        sizes = {}
+        for part in self._gather_rows('group_sizes', filters, by):
+            for group, n in part.items():
+                sizes[group] = sizes.get(group, 0) + n
+        quotas = sample_quotas(sizes, budget)
+        rows = pd.concat(self._gather_rows('sample', filters, columns, by, quotas), ignore_index=True)
+        if quotas is not None:
+            rows = rows.sort_values('_rank', kind='stable')
+            groups = rows[by].astype(object)
+            quota = np.array([quotas.get(None if pd.isna(group) else group, 0) for group in groups])
+            rows = rows[rows.groupby(groups, dropna=False, sort=False).cumcount().to_numpy() < quota]
+        return rows.drop(columns='_rank').reset_index(drop=True)
+
+    def bins(self, filters, x, y, bins=SCATTER_BINS):
+        """StoreRows.bins over every shard's rows: one grid over all their bounds, the counts added up."""
+        parts = [bounds for bounds in self._gather_rows('bounds', filters, [x, y]) if bounds is not None]
+        if not parts:
+            return np.array([]), np.array([]), np.zeros((0, 0))
+        bounds = {c: (min(part[c][0] for part in parts), max(part[c][1] for part in parts)) for c in (x, y)}
+        counts = sum(self._gather_rows('bin_counts', filters, x, y, bounds, bins))
+        return bin_centers(*bounds[x], bins), bin_centers(*bounds[y], bins), counts
+
+    def value_counts(self, filters, group, value):
+        """StoreRows.value_counts over every shard's rows."""
+        counts = pd.concat(self._gather_rows('value_counts', filters, group, value), ignore_index=True)
+        return counts.groupby([group, value], observed=True, sort=False)['rows'].sum().reset_index()
+
+    def head(self, filters, limit=PREVIEW_ROWS):
+        """The selection's first `limit` rows, taken shard by shard."""
+        return pd.concat(self._gather_rows('head', filters, limit), ignore_index=True).head(limit)
+
+    def distinct_values(self, column):
+        """Distinct values of a column (filter options), from the first shard's store."""
+        return self.gather('distinct_values', (column,), [0])[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a shard, or query shards from a coordinator')
+    sub = parser.add_subparsers(dest='command', required=True)
+    serve_parser = sub.add_parser('serve', help='Load one shard and answer queries on a TCP port')
+    serve_parser.add_argument('--db', default=DB_PATH)
+    serve_parser.add_argument('--shard', type=int, required=True)
+    serve_parser.add_argument('--shards', type=int, required=True)
+    serve_parser.add_argument('--by', choices=['sku', 'location'], default='sku')
+    serve_parser.add_argument('--host', default='0.0.0.0')
+    serve_parser.add_argument('--port', type=int, default=7000)
+    serve_parser.add_argument('--threads', type=int, help='DuckDB threads (default: all cores)')
+    query_parser = sub.add_parser('query', help='Print the KPI totals for a selection')
+    query_parser.add_argument('--db', default=DB_PATH)
+    query_parser.add_argument('--connect', nargs='+', metavar='HOST:PORT', help='Running workers, in shard order')
+    query_parser.add_argument('--shards', type=int, default=4, help='Local workers to start without --connect')
+    query_parser.add_argument('--by', choices=['sku', 'location'], default='sku')
+    query_parser.add_argument('--filter', nargs=2, action='append', default=[], metavar=('COLUMN', 'VALUE'))
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        serve(args.db, args.shard, args.shards, args.by, (args.host, args.port), args.threads)
+        return
+    if args.connect:
+        coordinator = Coordinator.remote(args.connect, args.by)
+    else:
+        coordinator = Coordinator.local(args.db, args.shards, args.by)
+    filters = {}
+    for column, value in args.filter:
+        filters.setdefault(column, []).append(value)
+    start = time.perf_counter()
+    totals = coordinator.aggregate(filters)[()]
+    print(totals.T.to_string(header=False))
+    print(f"{len(coordinator.clients)} shards answered in {(time.perf_counter() - start) * 1000:.1f} ms")
+    coordinator.close()
+
+
+if __name__ == '__main__':
+    main()
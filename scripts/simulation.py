@@ -0,0 +1,204 @@
+# scripts/simulation.py
+"""Monte Carlo stock-out simulation: stock-out probabilities and service levels per SKU.
+
+The report queries estimate days of inventory as one ratio, and
+add_calculated_fields flags delays at a fixed 7 days. Neither captures
+variability. Here every SKU is simulated over a horizon, in many scenarios:
+
+- Daily demand is gamma distributed. Its mean is number_of_products_sold
+  spread over `period_days`. Its coefficient of variation is that of
+  number_of_products_sold within the SKU's product type.
+- Replenishment: one order of order_quantities is placed on day 0. It
+  arrives after a lead time drawn from the supplier's observed lead_times,
+  plus a transit time drawn from the carrier/route's observed shipping_times.
+- Unmet demand is lost.
+
+Daily demands are independent, so demand over any window of t days is
+itself gamma distributed (shape times t). Each scenario therefore needs
+just two draws: demand before the order arrives and demand after it. That
+gives the same distribution as a SKUs x scenarios x days array at a
+fraction of the cost. Scenarios are batched as SKUs x scenarios arrays,
+chunked over SKUs and spread across a process pool. Every chunk has its own
+seed, so results do not depend on the number of workers.
+
+    python -m scripts.simulation data/processed_data.parquet --scenarios 10000 --workers 4 --out data/simulation.parquet
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from scripts.formats import read_frame, write_frame
+
+SCENARIOS = 10_000
+HORIZON_DAYS = 30
+PERIOD_DAYS = 90  # days number_of_products_sold is assumed to cover
+DELAY_DAYS = 7  # the fixed threshold of add_calculated_fields' delayed_shipment
+CHUNK_CELLS = 4_000_000  # SKUs x scenarios per chunk (a few 32 MB float64 arrays)
+
+# Processed columns simulate() reads
+INPUT_COLUMNS = ['sku', 'product_type', 'supplier_name', 'shipping_carriers', 'routes', 'stock_levels',
+                 'order_quantities', 'number_of_products_sold', 'lead_times', 'shipping_times']
+
+
+class Pools:
+    """Observed values per group, flattened so sampling for many SKUs is one vectorized gather."""
+
+    def __init__(self, values, groups):
+        codes, self.labels = pd.factorize(pd.Series(groups), sort=True)
+        values = np.asarray(values, dtype='float64')
+        keep = (codes >= 0) & ~np.isnan(values)
+        order = np.lexsort((values[keep], codes[keep]))
+        self.values = values[keep][order]
+        self.sizes = np.bincount(codes[keep], minlength=len(self.labels))
+        self.offsets = np.concatenate([[0], np.cumsum(self.sizes)[:-1]])
+
+    def codes(self, groups):
+        codes = pd.Index(self.labels).get_indexer(pd.Series(groups))
+        missing = (codes < 0) | (self.sizes[np.maximum(codes, 0)] == 0)
+        if missing.any():
+            raise ValueError(f"No observed values for {sorted(set(np.asarray(groups)[missing]))}")
+        return codes
+
+    def sample(self, codes, uniforms):
+        """One observed value per (SKU, scenario); `uniforms` is SKUs x scenarios in [0, 1)."""
+        index = self.offsets[codes][:, None] + (uniforms * self.sizes[codes][:, None]).astype('int64')
+        return self.values[index]
+
+
+def sku_parameters(df, period_days=PERIOD_DAYS):
+    """One row per SKU: stock, order quantity, daily demand mean and CV, supplier and route keys."""
+    per_sku = df.groupby('sku', observed=True, sort=True).agg(
+        product_type=('product_type', 'first'),
+        supplier_name=('supplier_name', 'first'),
+        shipping_carriers=('shipping_carriers', 'first'),
+        routes=('routes', 'first'),
+        stock=('stock_levels', 'mean'),
+        order_quantity=('order_quantities', 'mean'),
+        sold=('number_of_products_sold', 'mean'),
+    ).reset_index()
+    sold = df.groupby('product_type', observed=True)['number_of_products_sold']
+    cv = (sold.std(ddof=0) / sold.mean()).fillna(0)
+    per_sku['demand_mean'] = per_sku['sold'] / period_days
+    per_sku['demand_cv'] = cv.reindex(per_sku['product_type']).to_numpy()
+    per_sku['route'] = per_sku['shipping_carriers'].astype(str) + ' / ' + per_sku['routes'].astype(str)
+    for column in ['sku', 'product_type', 'supplier_name', 'shipping_carriers', 'routes']:
+        per_sku[column] = per_sku[column].astype(object)
+    return per_sku
+
+
+def _window_demand(rng, days, shape, scale):
+    # Sum of `days` i.i.d. Gamma(shape, scale) days; zero-length windows and zero demand give 0
+    return rng.gamma(np.maximum(shape * days, 1e-12), scale) * (days > 0) * (scale > 0)
+
+
+def simulate_chunk(args):
+    """Simulate one chunk of SKUs; returns per-SKU results (same row order)."""
+    params, lead_pool, transit_pool, lead_codes, transit_codes, scenarios, horizon, seed = args
+    rng = np.random.default_rng(seed)
+    n = len(params)
+    stock = params['stock'].to_numpy()[:, None]
+    order = params['order_quantity'].to_numpy()[:, None]
+    mean = params['demand_mean'].to_numpy()[:, None]
+    cv = params['demand_cv'].to_numpy()[:, None]
+
+    # Daily demand Gamma(k, theta) with mean k * theta and CV 1 / sqrt(k); CV 0 -> (nearly) constant demand
+    shape = 1 / np.maximum(cv, 1e-3) ** 2
+    scale = mean / shape
+
+    lead_time = (lead_pool.sample(lead_codes, rng.random((n, scenarios)))
+                 + transit_pool.sample(transit_codes, rng.random((n, scenarios))))
+    before = np.minimum(lead_time, horizon)
+    demand_before = _window_demand(rng, before, shape, scale)
+    demand_after = _window_demand(rng, horizon - before, shape, scale)
+
+    sold_before = np.minimum(demand_before, stock)
+    on_hand = stock - sold_before + np.where(lead_time < horizon, order, 0)
+    sold_after = np.minimum(demand_after, on_hand)
+    stockout = (demand_before > stock) | (demand_after > on_hand)
+    demand = demand_before + demand_after
+    sold = sold_before + sold_after
+
+    total_demand = demand.sum(axis=1)
+    return pd.DataFrame({
+        'sku': params['sku'].to_numpy(),
+        'stockout_probability': stockout.mean(axis=1),
+        'cycle_service_level': 1 - stockout.mean(axis=1),
+        'fill_rate': np.divide(sold.sum(axis=1), total_demand, out=np.ones(n), where=total_demand > 0),
+        'expected_lost_units': (demand - sold).mean(axis=1),
+        'lead_time_p50': np.percentile(lead_time, 50, axis=1),
+        'lead_time_p90': np.percentile(lead_time, 90, axis=1),
+        'delay_probability': (lead_time > DELAY_DAYS).mean(axis=1),
+    })
+
+
+def simulate(df, scenarios=SCENARIOS, horizon=HORIZON_DAYS, period_days=PERIOD_DAYS, workers=None, seed=0,
+             chunk_cells=CHUNK_CELLS):
+    """Per-SKU stock-out probability, service levels and lead-time spread from processed rows."""
+    params = sku_parameters(df, period_days)
+    lead_pool = Pools(df['lead_times'], df['supplier_name'].astype(object))
+    transit_pool = Pools(df['shipping_times'],
+                         df['shipping_carriers'].astype(str) + ' / ' + df['routes'].astype(str))
+    lead_codes = lead_pool.codes(params['supplier_name'])
+    transit_codes = transit_pool.codes(params['route'])
+
+    chunk_skus = max(1, chunk_cells // scenarios)
+    seeds = np.random.SeedSequence(seed).spawn(max(1, -(-len(params) // chunk_skus)))
+    tasks = [(params.iloc[start:start + chunk_skus], lead_pool, transit_pool,
+              lead_codes[start:start + chunk_skus], transit_codes[start:start + chunk_skus],
+              scenarios, horizon, seeds[i])
+             for i, start in enumerate(range(0, len(params), chunk_skus))]
+    if workers and workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            parts = list(executor.map(simulate_chunk, tasks))
+    else:
+        parts = [simulate_chunk(task) for task in tasks]
+    if not parts:
+        return simulation_columns(params)
+
+    results = pd.concat(parts, ignore_index=True)
+    # Days of inventory: stock over mean daily demand. The reports' days_inventory_remaining
+    # divides by number_of_products_sold itself (periods of sales), so this is that times period_days
+    results['days_of_inventory'] = params['stock'].to_numpy() / params['demand_mean'].replace(0, np.nan).to_numpy()
+    return params[['sku', 'product_type', 'supplier_name', 'shipping_carriers', 'routes']].merge(results, on='sku')
+
+
+def simulation_columns(params):
+    """An empty result frame with simulate()'s columns."""
+    columns = ['stockout_probability', 'cycle_service_level', 'fill_rate', 'expected_lost_units',
+               'lead_time_p50', 'lead_time_p90', 'delay_probability', 'days_of_inventory']
+    return params[['sku', 'product_type', 'supplier_name', 'shipping_carriers', 'routes']].assign(
+        **{column: pd.Series(dtype='float64') for column in columns})
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Monte Carlo stock-out simulation per SKU')
+    parser.add_argument('input', help='Processed .parquet / .arrow / .csv file')
+    parser.add_argument('--scenarios', type=int, default=SCENARIOS)
+    parser.add_argument('--horizon', type=int, default=HORIZON_DAYS, help='Days simulated')
+    parser.add_argument('--period-days', type=int, default=PERIOD_DAYS,
+                        help='Days number_of_products_sold covers (sets the daily demand)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='Write per-SKU results here (.parquet, .arrow, .csv or .xlsx)')
+    args = parser.parse_args()
+
+    df = read_frame(args.input)
+    start = time.perf_counter()
+    results = simulate(df, args.scenarios, args.horizon, args.period_days, args.workers, args.seed)
+    elapsed = time.perf_counter() - start
+    print(f"Simulated {len(results):,} SKUs x {args.scenarios:,} scenarios over {args.horizon} days "
+          f"in {elapsed:.2f}s ({len(results) * args.scenarios / elapsed:,.0f} SKU-scenarios/s)")
+    print(f"Mean stock-out probability {results['stockout_probability'].mean():.1%}, "
+          f"mean fill rate {results['fill_rate'].mean():.1%}")
+    print(results.nlargest(10, 'stockout_probability').to_string(index=False))
+    if args.out:
+        write_frame(results, args.out)
+        print(f"Results saved to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,447 @@
+# scripts/sketches.py
+"""Approximate mode: mergeable sketches for distinct counts, percentiles and top-K.
+
+Exact distinct counts, percentiles and heavy hitters need full scans and sorts
+over every shipment row. Here each partition of rows (a batch, a file chunk,
+an appended ingest batch) is summarized once into small sketches, one set per
+filter cell (location x product type x carrier x route). A query merges the
+cells its filters select. Sketches never shrink, so they do not support
+retracting rows.
+
+Error bounds:
+- Distinct SKUs: HyperLogLog with 2**12 registers. The standard error is
+  1.04 / sqrt(4096) = 1.6%, so about 95% of estimates fall within 3.2%.
+  Counts below ~10,000 use linear counting and are nearly exact.
+- Percentiles (lead_time, shipping_times): a log-bucket sketch (DDSketch
+  style). A percentile is within 1% (relative) of the true value at that
+  rank (the 'lower' interpolation). Zeros and the min/max are exact.
+  Memory is one counter per occupied bucket: ~700 buckets span 1 to 10**6.
+- Top-K routes: Misra-Gries summary with K counters. Each reported count is
+  a lower bound and is short by at most `error`, which is <= rows / (K + 1).
+  Counts are exact while there are at most K distinct values.
+
+    python -m scripts.sketches data/processed_data.parquet --location Mumbai --by shipping_carriers
+"""
+import argparse
+import math
+
+import numpy as np
+import pandas as pd
+
+from scripts.data_processing import clean_data, cleaned_query
+from scripts.filters import filter_frame
+from scripts.formats import iter_frames
+from scripts.metrics import CSV_NAMES
+from scripts.store import DB_PATH, TABLE, build_where, connect, quote
+
+HLL_PRECISION = 12
+RELATIVE_ACCURACY = 0.01
+TOP_K = 32
+PERCENTILES = [0.5, 0.9, 0.99]
+CHUNK_ROWS = 1_000_000
+
+# dashboard_app.py: filters, breakdowns and the columns each sketch summarizes
+SKETCH_CONFIG = {
+    'dimensions': ['location', 'product_type', 'shipping_carriers'],
+    'breakdowns': ['shipping_carriers', 'routes'],
+    'distinct': 'sku',
+    'quantiles': ['lead_time', 'shipping_times'],
+    'top': 'routes',
+}
+
+
+def sketch_columns(config=SKETCH_CONFIG):
+    """The processed columns a SketchCube reads."""
+    return list(dict.fromkeys(config['dimensions'] + config['breakdowns'] + [config['distinct']]
+                              + config['quantiles'] + [config['top']]))
+
+
+def hash64(values):
+    """Stable 64-bit hashes of values (same value, same hash across batches and processes)."""
+    return pd.util.hash_pandas_object(pd.Series(values), index=False).to_numpy()
+
+
+class HyperLogLog:
+    """Distinct count estimate in 2**precision one-byte registers; merged by taking the maximum."""
+
+    def __init__(self, precision=HLL_PRECISION):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype='uint8')
+
+    def add(self, values):
+        hashes = hash64(values)
+        p = np.uint64(self.precision)
+        index = (hashes >> np.uint64(64 - self.precision)).astype('int64')
+        # Remaining bits, with a sentinel so the rank is at most 64 - precision + 1
+        rest = (hashes << p) | np.uint64(1 << (self.precision - 1))
+        # Leading zeros = 64 - bit length; smear the top bit down and count the ones
+        for shift in [1, 2, 4, 8, 16, 32]:
+            rest |= rest >> np.uint64(shift)
+        rank = (64 - np.bitwise_count(rest) + 1).astype('uint8')
+        np.maximum.at(self.registers, index, rank)
+        return self
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def estimate(self):
+        m = len(self.registers)
+        raw = 0.7213 / (1 + 1.079 / m) * m * m / np.sum(np.ldexp(1.0, -self.registers.astype('int64')))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            return m * math.log(m / zeros)  # linear counting for small cardinalities
+        return float(raw)
+
+    @property
+    def standard_error(self):
+        return 1.04 / math.sqrt(len(self.registers))
+
+
+class QuantileSketch:
+    """Counts per logarithmic bucket; every percentile is within `accuracy` (relative) of the exact one."""
+
+    def __init__(self, accuracy=RELATIVE_ACCURACY):
+        self.accuracy = accuracy
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.log_gamma = math.log(self.gamma)
+        # Dense counts for buckets offset, offset + 1, ...
+        self.offset = 0
+        self.buckets = np.zeros(0, dtype='int64')
+        self.zeros = 0
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _add_buckets(self, offset, buckets):
+        if not len(buckets):
+            return
+        if not len(self.buckets):
+            self.offset, self.buckets = offset, buckets.copy()
+            return
+        low = min(self.offset, offset)
+        high = max(self.offset + len(self.buckets), offset + len(buckets))
+        merged = np.zeros(high - low, dtype='int64')
+        merged[self.offset - low:self.offset - low + len(self.buckets)] += self.buckets
+        merged[offset - low:offset - low + len(buckets)] += buckets
+        self.offset, self.buckets = low, merged
+
+    def add(self, values):
+        values = np.asarray(values, dtype='float64')
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return self
+        if values.min() < 0:
+            raise ValueError("QuantileSketch only takes non-negative values")
+        positive = values[values > 0]
+        if len(positive):
+            keys = np.ceil(np.log(positive) / self.log_gamma).astype('int64')
+            low = int(keys.min())
+            self._add_buckets(low, np.bincount(keys - low))
+        self.zeros += len(values) - len(positive)
+        self.count += len(values)
+        self.min, self.max = min(self.min, values.min()), max(self.max, values.max())
+        return self
+
+    def merge(self, other):
+        self._add_buckets(other.offset, other.buckets)
+        self.zeros += other.zeros
+        self.count += other.count
+        self.min, self.max = min(self.min, other.min), max(self.max, other.max)
+        return self
+
+    def quantile(self, q):
+        """Value at rank floor(q * (count - 1)), to within the relative accuracy; NaN when empty."""
+        if not self.count:
+            return np.nan
+        rank = math.floor(q * (self.count - 1))
+        if rank == 0:
+            return float(self.min)
+        if rank == self.count - 1:
+            return float(self.max)
+        if rank < self.zeros:
+            return 0.0
+        key = self.offset + int(np.searchsorted(np.cumsum(self.buckets), rank - self.zeros, side='right'))
+        value = 2 * self.gamma ** key / (self.gamma + 1)
+        return float(min(max(value, self.min), self.max))
+
+
+class FrequentItems:
+    """Misra-Gries summary: at most k counters; each count is low by at most `error`."""
+
+    def __init__(self, k=TOP_K):
+        self.k = k
+        self.counts = pd.Series(dtype='int64')
+        self.error = 0
+        self.rows = 0
+
+    def add(self, values):
+        batch = FrequentItems(self.k)
+        batch.counts = pd.Series(values).value_counts(dropna=True).astype('int64')
+        batch.rows = int(batch.counts.sum())
+        return self.merge(batch)
+
+    def merge(self, *others):
+        """Fold other summaries in; a multi-way merge has the same error bound as pairwise ones."""
+        parts = [self.counts] + [other.counts for other in others if len(other.counts)]
+        counts = pd.concat(parts).groupby(level=0, sort=False).sum().astype('int64') if len(parts) > 1 else self.counts
+        error = self.error + sum(other.error for other in others)
+        if len(counts) > self.k:
+            # Subtracting the (k+1)-th largest count keeps at most k counters
+            threshold = int(counts.nlargest(self.k + 1).iloc[-1])
+            counts = counts[counts > threshold] - threshold
+            error += threshold
+        self.counts, self.error = counts, error
+        self.rows += sum(other.rows for other in others)
+        return self
+
+    def top(self, n=10):
+        """The n most frequent values: count (lower bound) and count + error (upper bound)."""
+        top = self.counts.nlargest(n)
+        return pd.DataFrame({'value': top.index, 'count': top.to_numpy(), 'upper_bound': top.to_numpy() + self.error})
+
+
+class CellSketches:
+    """The sketches of one filter cell."""
+
+    def __init__(self, config):
+        self.rows = 0
+        self.distinct = HyperLogLog()
+        self.quantiles = {column: QuantileSketch() for column in config['quantiles']}
+        self.top = FrequentItems()
+
+    def add(self, df, config):
+        self.rows += len(df)
+        self.distinct.add(df[config['distinct']].to_numpy())
+        for column, sketch in self.quantiles.items():
+            sketch.add(df[column].to_numpy())
+        self.top.add(df[config['top']].to_numpy())
+        return self
+
+    def merge(self, other):
+        self.rows += other.rows
+        self.distinct.merge(other.distinct)
+        for column, sketch in self.quantiles.items():
+            sketch.merge(other.quantiles[column])
+        self.top.merge(other.top)
+        return self
+
+
+class SketchCube:
+    """Sketches per cell of the filter and breakdown dimensions, merged at query time."""
+
+    def __init__(self, config=SKETCH_CONFIG):
+        self.config = config
+        self.keys = list(dict.fromkeys(config['dimensions'] + config['breakdowns']))
+        self.cells = {}
+
+    @classmethod
+    def from_frame(cls, df, config=SKETCH_CONFIG, chunk_rows=CHUNK_ROWS):
+        """Sketch a DataFrame, one partition of chunk_rows rows at a time."""
+        cube = cls(config)
+        for start in range(0, len(df), chunk_rows):
+            cube.add(df.iloc[start:start + chunk_rows])
+        return cube
+
+    @classmethod
+    def from_file(cls, path, config=SKETCH_CONFIG, chunk_rows=CHUNK_ROWS):
+        """Sketch a processed Parquet / Arrow file without loading it whole."""
+        cube = cls(config)
+        for chunk in iter_frames(path, chunk_rows):
+            cube.merge(cls(config).add(chunk))
+        return cube
+
+    @classmethod
+    def from_query(cls, con, table, where='', params=None, config=SKETCH_CONFIG, chunk_rows=CHUNK_ROWS):
+        """Sketch store rows (CSV column names) of a DuckDB table, streamed chunk_rows at a time.
+
+        Only the sketched columns are read, and each chunk is cleaned like processed rows.
+        """
+        cube = cls(config)
+        select = ', '.join(quote(CSV_NAMES[c]) for c in sketch_columns(config))
+        reader = con.execute(f"SELECT {select} FROM {table}{where}", params or []).fetch_record_batch(chunk_rows)
+        for batch in reader:
+            cube.add(clean_data(batch.to_pandas(date_as_object=False)))
+        return cube
+
+    def add(self, df):
+        """Fold a partition of processed rows in."""
+        for key, part in df.groupby(self.keys, observed=True, sort=False):
+            self.cells.setdefault(key, CellSketches(self.config)).add(part, self.config)
+        return self
+
+    def merge(self, other):
+        """Combine with the sketches of another partition."""
+        for key, cell in other.cells.items():
+            if key in self.cells:
+                self.cells[key].merge(cell)
+            else:
+                self.cells[key] = cell
+        return self
+
+    def _select(self, filters):
+        filters = {d: v for d, v in (filters or {}).items() if v is not None}
+        unknown = set(filters) - set(self.config['dimensions'])
+        if unknown:
+            raise ValueError(f"Sketches have no dimension(s) {sorted(unknown)}")
+        wanted = [(self.keys.index(d), set(v) if isinstance(v, (list, tuple, set)) else {v})
+                  for d, v in filters.items()]
+        return {key: cell for key, cell in self.cells.items() if all(key[i] in values for i, values in wanted)}
+
+    def _combine(self, cells):
+        total = CellSketches(self.config)
+        cells = list(cells)
+        if cells:
+            total.rows = sum(cell.rows for cell in cells)
+            total.distinct.registers = np.max([cell.distinct.registers for cell in cells], axis=0)
+            for column, sketch in total.quantiles.items():
+                for cell in cells:
+                    sketch.merge(cell.quantiles[column])
+            total.top.merge(*[cell.top for cell in cells])
+        return total
+
+    def summary(self, filters=None, top=10):
+        """Rows, distinct SKUs, percentiles and top values over the selected cells."""
+        total = self._combine(self._select(filters).values())
+        result = {'rows': total.rows, 'distinct_' + self.config['distinct']: total.distinct.estimate()}
+        for column, sketch in total.quantiles.items():
+            for q in PERCENTILES:
+                result[f'{column}_p{round(q * 100)}'] = sketch.quantile(q)
+        result['top_' + self.config['top']] = total.top.top(top)
+        return result
+
+    def breakdown(self, by, filters=None):
+        """Rows and percentiles per value of a breakdown dimension."""
+        if by not in self.config['breakdowns']:
+            raise ValueError(f"Cannot break down by '{by}' (expected one of {self.config['breakdowns']})")
+        position = self.keys.index(by)
+        groups = {}
+        for key, cell in self._select(filters).items():
+            groups.setdefault(key[position], []).append(cell)
+        rows = []
+        for value in sorted(groups):
+            total = self._combine(groups[value])
+            row = {by: value, 'rows': total.rows}
+            for column, sketch in total.quantiles.items():
+                row.update({f'{column}_p{round(q * 100)}': sketch.quantile(q) for q in PERCENTILES})
+            rows.append(row)
+        return pd.DataFrame(rows, columns=[by, 'rows'] + [f'{c}_p{round(q * 100)}' for c in self.config['quantiles']
+                                                          for q in PERCENTILES])
+
+    def error_bounds(self, filters=None):
+        """Human-readable error bounds of summary() for a filter selection."""
+        top = FrequentItems().merge(*[cell.top for cell in self._select(filters).values()])
+        return {
+            'distinct SKUs': f"±{2 * HyperLogLog().standard_error:.1%} (95%)",
+            'percentiles': f"within {RELATIVE_ACCURACY:.0%} of the exact value",
+            'top routes': f"counts low by at most {top.error:,}" if top.error else "exact counts",
+        }
+
+
+def exact_summary(df, filters=None, config=SKETCH_CONFIG, top=10):
+    """summary() computed exactly with pandas (full scan and sort), for exact mode and accuracy checks."""
+    df = filter_frame(df, filters)
+    result = {'rows': len(df), 'distinct_' + config['distinct']: df[config['distinct']].nunique()}
+    for column in config['quantiles']:
+        for q in PERCENTILES:
+            value = df[column].quantile(q, interpolation='lower') if len(df) else np.nan
+            result[f'{column}_p{round(q * 100)}'] = float(value)
+    counts = df[config['top']].value_counts().nlargest(top)
+    result['top_' + config['top']] = pd.DataFrame({'value': counts.index.astype(object), 'count': counts.to_numpy(),
+                                                   'upper_bound': counts.to_numpy()})
+    return result
+
+
+def exact_breakdown(df, by, filters=None, config=SKETCH_CONFIG):
+    """breakdown() computed exactly with pandas."""
+    df = filter_frame(df, filters)
+    grouped = df.groupby(by, observed=True, sort=True)
+    result = grouped.size().rename('rows').to_frame()
+    for column in config['quantiles']:
+        for q in PERCENTILES:
+            result[f'{column}_p{round(q * 100)}'] = grouped[column].quantile(q, interpolation='lower').astype('float64')
+    return result.reset_index().astype({by: object})
+
+
+def _percentiles(config):
+    # Sorted non-null values of each quantile column per group, and the 'lower' percentiles
+    # (pandas' interpolation) read off them, as SELECT lists for an inner and an outer query
+    inner = [f"list_sort(list({quote(c)}) FILTER (WHERE {quote(c)} IS NOT NULL)) AS {quote(c)}"
+             for c in config['quantiles']]
+    outer = [f"{quote(c)}[CAST(floor({q!r} * (len({quote(c)}) - 1)) AS BIGINT) + 1]::DOUBLE AS {quote(f'{c}_p{round(q * 100)}')}"
+             for c in config['quantiles'] for q in PERCENTILES]
+    return inner, outer
+
+
+def _selected(filters, config, by=None):
+    # The selected rows of the sketched columns, cleaned as clean_data does, with the filters in the store scan
+    where, params = build_where({CSV_NAMES.get(c, c): v for c, v in (filters or {}).items()})
+    names = [config['distinct'], config['top'], *config['quantiles']] + ([by] if by else [])
+    return f"({cleaned_query([CSV_NAMES[c] for c in dict.fromkeys(names)], TABLE, where)}) AS selected", params
+
+
+def query_summary(db_path=DB_PATH, filters=None, config=SKETCH_CONFIG, top=10):
+    """summary() computed exactly by DuckDB on the store, with the filters in the scan (same values as exact_summary)."""
+    selected, params = _selected(filters, config)
+    inner, outer = _percentiles(config)
+    value = quote(config['top'])
+    con = connect(db_path)
+    try:
+        row = con.execute(
+            f"SELECT rows, distinct_count, {', '.join(outer)} FROM (SELECT COUNT(*) AS rows, "
+            f"COUNT(DISTINCT {quote(config['distinct'])}) AS distinct_count, {', '.join(inner)} FROM {selected})", params
+        ).df().iloc[0]
+        counts = con.execute(
+            f"SELECT {value}::VARCHAR AS value, COUNT(*) AS count FROM {selected} WHERE {value} IS NOT NULL "
+            f"GROUP BY 1 ORDER BY 2 DESC, 1 LIMIT {int(top)}", params
+        ).df()
+    finally:
+        con.close()
+    result = {'rows': int(row['rows']), 'distinct_' + config['distinct']: int(row['distinct_count'])}
+    for column in config['quantiles']:
+        for q in PERCENTILES:
+            result[f'{column}_p{round(q * 100)}'] = float(row[f'{column}_p{round(q * 100)}'])
+    result['top_' + config['top']] = pd.DataFrame({'value': counts['value'].astype(object), 'count': counts['count'],
+                                                   'upper_bound': counts['count']})
+    return result
+
+
+def query_breakdown(db_path=DB_PATH, by='shipping_carriers', filters=None, config=SKETCH_CONFIG):
+    """breakdown() computed exactly by DuckDB on the store (same values as exact_breakdown)."""
+    selected, params = _selected(filters, config, by)
+    inner, outer = _percentiles(config)
+    con = connect(db_path)
+    try:
+        result = con.execute(
+            f"SELECT {quote(by)}, rows, {', '.join(outer)} FROM (SELECT {quote(by)}, COUNT(*) AS rows, "
+            f"{', '.join(inner)} FROM {selected} WHERE {quote(by)} IS NOT NULL GROUP BY 1) ORDER BY 1", params
+        ).df()
+    finally:
+        con.close()
+    return result.astype({by: object, 'rows': 'int64'})
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Approximate distinct counts, percentiles and top routes')
+    parser.add_argument('path', help='Processed .parquet or .arrow file')
+    for dim in SKETCH_CONFIG['dimensions']:
+        parser.add_argument('--' + dim.replace('_', '-'), dest=dim, action='append', help=f'Filter on {dim}')
+    parser.add_argument('--by', choices=SKETCH_CONFIG['breakdowns'], help='Percentiles per value of this column')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS, help='Rows per sketched partition')
+    args = parser.parse_args()
+
+    cube = SketchCube.from_file(args.path, chunk_rows=args.chunk_rows)
+    filters = {dim: getattr(args, dim) for dim in SKETCH_CONFIG['dimensions'] if getattr(args, dim)}
+    summary = cube.summary(filters)
+    top = summary.pop('top_' + SKETCH_CONFIG['top'])
+    for name, value in summary.items():
+        print(f"{name:<24} {value:,.2f}")
+    print(top.to_string(index=False))
+    if args.by:
+        print(cube.breakdown(args.by, filters).to_string(index=False))
+    for name, bound in cube.error_bounds(filters).items():
+        print(f"{name} error: {bound}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,505 @@
+# scripts/store.py
+"""Persistent DuckDB columnar store for the supply chain dataset.
+
+The CSV is converted once (streamed by DuckDB, never loaded into pandas) into
+data/supply_chain.duckdb. Low-cardinality text columns become ENUM types
+(dictionary-encoded, returned to pandas as categoricals) and numerics get fixed
+types. Rows are clustered by Location and Product type (by Shipment date first,
+when the CSV has one) so the per-row-group min/max zonemaps let DuckDB skip row
+groups a filter or a date range cannot match.
+
+    python -m scripts.store data/supply_chain.csv [--db data/supply_chain.duckdb] [--parquet data/supply_chain_parquet]
+"""
+import argparse
+import hashlib
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import duckdb
+import pandas as pd
+import pyarrow as pa
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers are serialized within a process only
+    fcntl = None
+
+from scripts.filters import Range
+from scripts.schema import ALL_COLUMNS, CATEGORICAL_COLUMNS, CSV_COLUMNS, NON_NEGATIVE, file_columns, read_header
+
+DB_PATH = 'data/supply_chain.duckdb'
+TABLE = 'supply_chain'
+
+# Sort key at ingest time; the sidebar filters hit these columns first
+CLUSTER_BY = ['Location', 'Product type']
+
+# Time-range queries scan contiguous row groups when rows are sorted by date
+DATE_COLUMN = 'Shipment date'
+
+# Tail of the source CSV hashed at ingest, to recognise a later append
+FINGERPRINT_BYTES = 64 * 1024
+
+# Opening a store another process holds a conflicting lock on is retried,
+# backing off from LOCK_BACKOFF seconds (about 6s in all)
+LOCK_RETRIES = 8
+LOCK_BACKOFF = 0.05
+
+# Stores built under other column types are rebuilt by ensure_store
+SCHEMA_HASH = hashlib.sha1(repr(sorted(CSV_COLUMNS.items())).encode()).hexdigest()
+
+
+def quote(name):
+    """Quote an identifier for DuckDB."""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def enum_type(column):
+    """Name of the ENUM type backing a categorical column."""
+    return column.lower().replace(' ', '_') + '_enum'
+
+
+class StoreLock:
+    """Readers/writer lock on one store: shared by this process's readers, exclusive for a writer.
+
+    DuckDB refuses a read-write connection to a file this process has open
+    read-only (and the other way round), so a writer waits for the readers
+    of other threads to close. Writers also hold an exclusive lock on
+    <store>.lock, so ingesters in different processes take turns. A thread
+    may re-enter as writer, and read while it writes.
+    """
+
+    def __init__(self, db_path):
+        self.lock_path = os.path.abspath(db_path) + '.lock'
+        self.cond = threading.Condition()
+        self.readers = {}  # thread id -> open read-only connections
+        self.writer = None
+        self.depth = 0
+        self.waiting = 0
+        self.file = None
+
+    def acquire_read(self):
+        """Take a shared hold; returns the owning thread's id, for release_read."""
+        me = threading.get_ident()
+        with self.cond:
+            # Waiting writers go first, except over a thread that already reads (it would deadlock)
+            while self.writer != me and (self.writer is not None or (self.waiting and me not in self.readers)):
+                self.cond.wait()
+            self.readers[me] = self.readers.get(me, 0) + 1
+        return me
+
+    def release_read(self, owner):
+        """Drop a hold taken by acquire_read on thread `owner`, from whichever thread closes it."""
+        with self.cond:
+            self.readers[owner] -= 1
+            if not self.readers[owner]:
+                del self.readers[owner]
+            self.cond.notify_all()
+
+    def acquire_write(self):
+        me = threading.get_ident()
+        with self.cond:
+            if self.writer == me:
+                self.depth += 1
+                return
+            self.waiting += 1
+            while self.writer is not None or any(t != me for t in self.readers):
+                self.cond.wait()
+            self.waiting -= 1
+            self.writer, self.depth = me, 1
+        if fcntl is not None:
+            self.file = open(self.lock_path, 'a')
+            fcntl.flock(self.file, fcntl.LOCK_EX)
+
+    def release_write(self):
+        with self.cond:
+            self.depth -= 1
+            if self.depth:
+                return
+            if self.file is not None:
+                self.file.close()  # releases the flock
+                self.file = None
+            self.writer = None
+            self.cond.notify_all()
+
+    def writer_active(self, wait=False):
+        """Whether a writer holds <store>.lock: an ingester writing, or waiting for readers to close the file.
+
+        Long-lived readers check this to let go of the file. With wait=True,
+        block until the writer is done instead (and return False).
+        """
+        if fcntl is None:
+            return False
+        with open(self.lock_path, 'a') as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_SH | (0 if wait else fcntl.LOCK_NB))
+            except BlockingIOError:
+                return True
+        return False
+
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def store_lock(db_path=DB_PATH):
+    """The process-wide StoreLock of a store file."""
+    with _locks_guard:
+        return _locks.setdefault(os.path.abspath(db_path), StoreLock(db_path))
+
+
+@contextmanager
+def writing(db_path=DB_PATH):
+    """Hold the store's write lock: no reader in this process, no writer anywhere else."""
+    lock = store_lock(db_path)
+    lock.acquire_write()
+    try:
+        yield
+    finally:
+        lock.release_write()
+
+
+class StoreConnection:
+    """A DuckDB connection to the store that holds the store lock (shared if read-only) until closed."""
+
+    def __init__(self, con, release):
+        self._con = con
+        self._release = release
+
+    def __getattr__(self, name):
+        return getattr(self._con, name)
+
+    def close(self):
+        release, self._release = self._release, None
+        if release is not None:
+            try:
+                self._con.close()
+            finally:
+                release()
+
+    def __del__(self):
+        self.close()
+
+
+def connect(db_path=DB_PATH, read_only=True):
+    """Open a connection to the store (read-only unless ingesting); close() it to release the store lock.
+
+    DuckDB lets one process write a database file or several processes read
+    it; while another process holds the conflicting lock, opening is retried.
+    """
+    lock = store_lock(db_path)
+    if read_only:
+        # A connection may be closed (or garbage-collected) on another thread than the one that opened it
+        owner = lock.acquire_read()
+        release = lambda: lock.release_read(owner)
+    else:
+        lock.acquire_write()
+        release = lock.release_write
+    try:
+        for attempt in range(LOCK_RETRIES):
+            try:
+                return StoreConnection(duckdb.connect(db_path, read_only=read_only), release)
+            except duckdb.IOException as e:
+                if 'lock' not in str(e) or attempt == LOCK_RETRIES - 1:
+                    raise
+                time.sleep(LOCK_BACKOFF * 2 ** attempt)
+    except BaseException:
+        release()
+        raise
+
+
+def _build_table(con):
+    """Create the ENUM types and the clustered table from `staging`, then drop it."""
+    for column in CATEGORICAL_COLUMNS:
+        con.execute(
+            f"CREATE TYPE {enum_type(column)} AS ENUM ("
+            f"SELECT DISTINCT {quote(column)} FROM staging WHERE {quote(column)} IS NOT NULL ORDER BY 1)"
+        )
+    replace = ', '.join(f'{quote(c)}::{enum_type(c)} AS {quote(c)}' for c in CATEGORICAL_COLUMNS)
+    columns = [row[0] for row in con.execute("DESCRIBE staging").fetchall()]
+    order = ', '.join(quote(c) for c in ([DATE_COLUMN] if DATE_COLUMN in columns else []) + CLUSTER_BY)
+    con.execute(f"CREATE TABLE {TABLE} AS SELECT * REPLACE ({replace}) FROM staging ORDER BY {order}")
+    con.execute("DROP TABLE staging")
+
+
+def _validate(con, table):
+    """Raise ValueError if a numeric column that must be non-negative has negative values."""
+    counts = con.execute(
+        "SELECT " + ', '.join(f"COUNT(*) FILTER (WHERE {quote(c)} < 0)" for c in NON_NEGATIVE) + f" FROM {table}"
+    ).fetchone()
+    problems = [f"'{c}' has {n} negative value(s)" for c, n in zip(NON_NEGATIVE, counts) if n]
+    if problems:
+        raise ValueError('Schema validation failed: ' + '; '.join(problems))
+
+
+def _fingerprint(path, size):
+    """Hash of the bytes just before `size`; tells an append apart from a rewrite."""
+    start = max(0, size - FINGERPRINT_BYTES)
+    with open(path, 'rb') as f:
+        f.seek(start)
+        return hashlib.sha1(f.read(size - start)).hexdigest()
+
+
+def ingest_csv(csv_path, db_path=DB_PATH):
+    """Convert the CSV into a typed, clustered DuckDB table and return the row count."""
+    start = time.perf_counter()
+    tmp_path = db_path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    con = duckdb.connect(tmp_path)
+    try:
+        # Let DuckDB spill the clustering sort to disk instead of holding it in RAM
+        con.execute("SET preserve_insertion_order = false")
+        con.execute(
+            "CREATE TABLE staging AS SELECT * FROM read_csv(?, header = true, columns = ?)",
+            [csv_path, file_columns(read_header(csv_path))],
+        )
+        _validate(con, 'staging')
+        _build_table(con)
+
+        stat = os.stat(csv_path)
+        row_count = con.execute(f"SELECT COUNT(*) FROM {TABLE}").fetchone()[0]
+        now = time.time()
+        con.execute("""
+            CREATE TABLE store_info (source VARCHAR, source_size BIGINT, source_mtime DOUBLE,
+                                     source_fingerprint VARCHAR, row_count BIGINT,
+                                     built_at DOUBLE, ingested_at DOUBLE, schema_hash VARCHAR)
+        """)
+        con.execute("INSERT INTO store_info VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [os.path.abspath(csv_path), stat.st_size, stat.st_mtime,
+                     _fingerprint(csv_path, stat.st_size), row_count, now, now, SCHEMA_HASH])
+        con.execute("CHECKPOINT")
+    finally:
+        con.close()
+
+    # Swap atomically so readers in other processes never see a half-written store
+    with writing(db_path):
+        os.replace(tmp_path, db_path)
+    print(f"Ingested {row_count} rows from {csv_path} into {db_path} in {time.perf_counter() - start:.2f}s")
+    return row_count
+
+
+def _columns(con):
+    """{column: type} of the stored table in table order (the CSV columns plus any optional ones)."""
+    return {row[0]: ALL_COLUMNS[row[0]][0] for row in con.execute(f"DESCRIBE {TABLE}").fetchall()}
+
+
+def _casts(columns, text=False):
+    """SELECT list casting every column to its stored type (or VARCHAR for categoricals)."""
+    return ', '.join(
+        f"CAST({quote(c)} AS {('VARCHAR' if text else enum_type(c)) if c in CATEGORICAL_COLUMNS else t}) AS {quote(c)}"
+        for c, t in columns.items()
+    )
+
+
+def append_rows(db_path, df):
+    """Append a batch of rows (CSV column names) to the store and return the new row count.
+
+    Appended rows keep increasing rowids, which is what incremental consumers
+    (e.g. the cube) use as their watermark. A batch introducing a category the
+    ENUM types don't know forces the table to be rebuilt, which resets rowids
+    and bumps built_at.
+    """
+    con = connect(db_path, read_only=False)
+    try:
+        columns = _columns(con)
+        con.register('batch_df', pa.Table.from_pandas(df[list(columns)], preserve_index=False))
+        _validate(con, 'batch_df')
+        new_categories = any(
+            con.execute(
+                f"SELECT 1 FROM batch_df WHERE {quote(c)} IS NOT NULL AND {quote(c)} NOT IN "
+                f"(SELECT unnest(enum_range(NULL::{enum_type(c)}))::VARCHAR) LIMIT 1"
+            ).fetchone()
+            for c in CATEGORICAL_COLUMNS
+        )
+        now = time.time()
+        con.execute("BEGIN TRANSACTION")
+        if new_categories:
+            con.execute(f"CREATE TABLE staging AS SELECT {_casts(columns, text=True)} FROM {TABLE} "
+                        f"UNION ALL SELECT {_casts(columns, text=True)} FROM batch_df")
+            con.execute(f"DROP TABLE {TABLE}")
+            for column in CATEGORICAL_COLUMNS:
+                con.execute(f"DROP TYPE {enum_type(column)}")
+            _build_table(con)
+            con.execute("UPDATE store_info SET built_at = ?", [now])
+        else:
+            con.execute(f"INSERT INTO {TABLE} SELECT {_casts(columns)} FROM batch_df")
+        row_count = con.execute(f"SELECT COUNT(*) FROM {TABLE}").fetchone()[0]
+        con.execute("UPDATE store_info SET row_count = ?, ingested_at = ?", [row_count, now])
+        con.execute("COMMIT")
+    finally:
+        con.close()
+    print(f"Appended {len(df)} rows to {db_path}")
+    return row_count
+
+
+def store_info(db_path=DB_PATH):
+    """The store_info row as a dict, or None if there is no store (or one from an older version).
+
+    Other errors, such as a lock still held after connect's retries, are
+    raised: treating them as a missing store would re-ingest it from scratch.
+    """
+    if not os.path.exists(db_path):
+        return None
+    con = connect(db_path)
+    try:
+        # Otherwise a missing table would resolve to a Python variable named store_info
+        con.execute("SET python_enable_replacements = false")
+        cursor = con.execute("SELECT * FROM store_info")
+        row = cursor.fetchone()
+        names = [d[0] for d in cursor.description]
+    except duckdb.CatalogException:
+        return None
+    finally:
+        con.close()
+    if row is None or 'schema_hash' not in names:
+        return None
+    return dict(zip(names, row))
+
+
+def require_info(db_path=DB_PATH):
+    """store_info() of a store that must exist; raises ValueError when it doesn't."""
+    info = store_info(db_path)
+    if info is None:
+        raise ValueError(f"No store at {db_path}; build it with python -m scripts.store")
+    return info
+
+
+def _up_to_date(info, stat):
+    return info is not None and info['schema_hash'] == SCHEMA_HASH and \
+        info['source_size'] == stat.st_size and info['source_mtime'] == stat.st_mtime
+
+
+def ensure_store(csv_path, db_path=DB_PATH):
+    """Bring the store up to date with the CSV and return the store path.
+
+    Rows appended to the end of the CSV are appended to the store; any other
+    change (or a missing store) triggers a full re-ingest. Updates run under
+    the store's write lock, so concurrent callers never append a tail twice.
+    """
+    if _up_to_date(store_info(db_path), os.stat(csv_path)):
+        return db_path
+    with writing(db_path):
+        _update_store(csv_path, db_path)
+    return db_path
+
+
+def _update_store(csv_path, db_path):
+    info = store_info(db_path)
+    if info and info['schema_hash'] != SCHEMA_HASH:
+        info = None
+    stat = os.stat(csv_path)
+    if _up_to_date(info, stat):
+        return  # another caller updated it while we waited for the lock
+    if (info and stat.st_size > info['source_size']
+            and _fingerprint(csv_path, info['source_size']) == info['source_fingerprint']):
+        with open(csv_path, 'rb') as f:
+            f.seek(info['source_size'])
+            try:
+                tail = pd.read_csv(f, header=None, names=read_header(csv_path))
+            except pd.errors.EmptyDataError:
+                tail = None
+        if tail is not None and len(tail):
+            append_rows(db_path, tail)
+        con = connect(db_path, read_only=False)
+        try:
+            con.execute("UPDATE store_info SET source_size = ?, source_mtime = ?, source_fingerprint = ?",
+                        [stat.st_size, stat.st_mtime, _fingerprint(csv_path, stat.st_size)])
+        finally:
+            con.close()
+        return
+    ingest_csv(csv_path, db_path)
+
+
+def store_version(db_path=DB_PATH):
+    """Version stamp of the store contents, for cache keys."""
+    return require_info(db_path)['ingested_at']
+
+
+def build_where(filters):
+    """Turn {column: value, list of values or Range} into a parameterized WHERE clause."""
+    clauses, params = [], []
+    for column, values in (filters or {}).items():
+        if values is None:
+            continue
+        if isinstance(values, Range):
+            clauses.append(f"{quote(column)} BETWEEN ? AND ?")
+            params.extend([values.start, values.end])
+            continue
+        if not isinstance(values, (list, tuple, set)):
+            values = [values]
+        values = list(values)
+        if not values:
+            clauses.append('FALSE')
+            continue
+        clauses.append(f"{quote(column)} IN ({', '.join('?' for _ in values)})")
+        params.extend(values)
+    return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+
+def read_table(db_path=DB_PATH, columns=None, filters=None):
+    """Read rows from the store, pushing the column list and filters into the scan."""
+    select = ', '.join(quote(c) for c in columns) if columns else '*'
+    where, params = build_where(filters)
+    con = connect(db_path)
+    try:
+        # Via Arrow, so integer columns with NULLs become float64/NaN like pd.read_csv
+        rows = con.execute(f"SELECT {select} FROM {TABLE}{where}", params).to_arrow_table()
+        return rows.to_pandas(date_as_object=False)
+    finally:
+        con.close()
+
+
+def iter_batches(db_path=DB_PATH, batch_size=100_000, columns=None, filters=None):
+    """Yield the table as DataFrames of at most batch_size rows, streamed from DuckDB."""
+    select = ', '.join(quote(c) for c in columns) if columns else '*'
+    where, params = build_where(filters)
+    con = connect(db_path)
+    try:
+        reader = con.execute(f"SELECT {select} FROM {TABLE}{where}", params).fetch_record_batch(batch_size)
+        for batch in reader:
+            yield batch.to_pandas(date_as_object=False)
+    finally:
+        con.close()
+
+
+def distinct_values(db_path, column):
+    """Distinct values of a column; free for ENUM columns since it reads only the type."""
+    con = connect(db_path)
+    try:
+        if column in CATEGORICAL_COLUMNS:
+            rows = con.execute(f"SELECT unnest(enum_range(NULL::{enum_type(column)}))").fetchall()
+        else:
+            rows = con.execute(f"SELECT DISTINCT {quote(column)} FROM {TABLE} ORDER BY 1").fetchall()
+    finally:
+        con.close()
+    return [r[0] for r in rows]
+
+
+def export_parquet(db_path, out_dir, partition_by=('Location',)):
+    """Write the store as a hive-partitioned Parquet dataset for other engines."""
+    con = connect(db_path)
+    try:
+        partitions = ', '.join(quote(c) for c in partition_by)
+        con.execute(f"COPY {TABLE} TO '{out_dir}' (FORMAT PARQUET, PARTITION_BY ({partitions}), OVERWRITE_OR_IGNORE)")
+    finally:
+        con.close()
+    print(f"Parquet dataset written to {out_dir}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the DuckDB store from supply_chain.csv")
+    parser.add_argument('csv', nargs='?', default='data/supply_chain.csv')
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--parquet', help='Also export a partitioned Parquet dataset to this directory')
+    args = parser.parse_args()
+
+    ingest_csv(args.csv, args.db)
+    if args.parquet:
+        export_parquet(args.db, args.parquet)
+
+
+if __name__ == "__main__":
+    main()
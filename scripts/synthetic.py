@@ -0,0 +1,117 @@
+# scripts/synthetic.py
+"""Synthetic supply chain data at any size, shaped like data/supply_chain.csv.
+
+Rows come from a smoothed bootstrap of the sample. Each synthetic row starts
+from a random real row, so the categoricals keep their joint frequencies
+(which carriers serve which routes, and so on). Every numeric column is then
+jittered by its kernel bandwidth and clipped to the sample's range, and integer
+columns stay integers. SKUs are numbered, so their cardinality is a parameter;
+suppliers, locations, carriers, routes and the other categoricals keep the
+sample's. Data is generated and written in chunks, so 10^8 rows need disk
+space, not memory.
+
+    python -m scripts.synthetic 1000000 data/synthetic.csv [--skus 100000] [--start 2022-01-01 --days 1095]
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+
+from scripts.downsampling import kernel_bandwidth
+from scripts.formats import extension, open_writer
+from scripts.schema import COLUMNS, INTEGER_COLUMNS, apply_schema, read_csv
+
+SAMPLE_CSV = 'data/supply_chain.csv'
+CHUNK_ROWS = 1_000_000
+DATE_COLUMN = 'Shipment date'
+
+
+def fit(sample):
+    """Per-numeric-column (bandwidth, min, max) of the sample."""
+    profile = {}
+    for column, (sql_type, _) in COLUMNS.items():
+        if sql_type == 'VARCHAR':
+            continue
+        values = sample[column].dropna().to_numpy(dtype='float64')
+        profile[column] = (kernel_bandwidth(values), values.min(), values.max())
+    return profile
+
+
+def generate(sample, n_rows, profile=None, skus=None, seed=0, offset=0, start=None, days=None):
+    """n_rows synthetic rows (CSV column names); row numbers start at `offset` for SKU numbering."""
+    profile = profile or fit(sample)
+    rng = np.random.default_rng(seed)
+    rows = sample.iloc[rng.integers(0, len(sample), n_rows)].reset_index(drop=True)
+    for column, (bandwidth, low, high) in profile.items():
+        values = rows[column].to_numpy(dtype='float64') + rng.normal(0, bandwidth, n_rows)
+        values = np.clip(values, low, high)
+        rows[column] = np.round(values) if column in INTEGER_COLUMNS else values
+    numbers = (offset + np.arange(n_rows)) % (skus or np.iinfo('int64').max)
+    rows['SKU'] = pd.Series(numbers).map('SKU{}'.format)
+    if days:
+        first = np.datetime64(start or '2022-01-01', 'D')
+        rows[DATE_COLUMN] = first + rng.integers(0, days, n_rows).astype('timedelta64[D]')
+    return apply_schema(rows, check=False)
+
+
+def iter_chunks(sample, n_rows, chunk_rows=CHUNK_ROWS, seed=0, **kwargs):
+    """generate() in chunks of at most chunk_rows, each with its own seed derived from `seed`."""
+    profile = fit(sample)
+    for index, offset in enumerate(range(0, n_rows, chunk_rows)):
+        yield generate(sample, min(chunk_rows, n_rows - offset), profile, seed=[seed, index],
+                       offset=offset, **kwargs)
+
+
+def _csv_table(table):
+    # Arrow's CSV writer is ~20x faster than DataFrame.to_csv, but takes plain strings and dates only
+    for i, field in enumerate(table.schema):
+        if pa.types.is_dictionary(field.type):
+            table = table.set_column(i, field.name, table.column(i).cast(pa.string()))
+        elif pa.types.is_timestamp(field.type):
+            table = table.set_column(i, field.name, table.column(i).cast(pa.date32()))
+    return table
+
+
+def write_dataset(path, n_rows, sample_csv=SAMPLE_CSV, chunk_rows=CHUNK_ROWS, seed=0, **kwargs):
+    """Write n_rows synthetic rows to a .csv, .parquet or .arrow file; returns the path."""
+    start = time.perf_counter()
+    sample = read_csv(sample_csv)
+    ext = extension(path)
+    writer = None
+    try:
+        for chunk in iter_chunks(sample, n_rows, chunk_rows, seed, **kwargs):
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if ext == '.csv':
+                table = _csv_table(table)
+            if writer is None:
+                writer = pa_csv.CSVWriter(path, table.schema) if ext == '.csv' else open_writer(path, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+    size = os.path.getsize(path) / 1024 ** 2
+    print(f"Wrote {n_rows:,} synthetic rows to {path} ({size:,.1f} MB) in {time.perf_counter() - start:.2f}s")
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic supply chain data shaped like the sample CSV')
+    parser.add_argument('rows', type=int)
+    parser.add_argument('output', help='.csv, .parquet or .arrow')
+    parser.add_argument('--sample', default=SAMPLE_CSV, help='CSV whose distributions are reproduced')
+    parser.add_argument('--skus', type=int, help='Distinct SKUs (default: one per row, like the sample)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    parser.add_argument('--days', type=int, help="Add a 'Shipment date' column spread over this many days")
+    parser.add_argument('--start', default='2022-01-01', help='First shipment date with --days')
+    args = parser.parse_args()
+    write_dataset(args.output, args.rows, args.sample, args.chunk_rows, args.seed,
+                  skus=args.skus, start=args.start, days=args.days)
+
+
+if __name__ == '__main__':
+    main()
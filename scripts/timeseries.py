@@ -0,0 +1,358 @@
+# scripts/timeseries.py
+"""Time-range queries over shipment history.
+
+Rollups keeps the dashboard measures as additive cells per (day, filter
+dimensions), plus the same cells pre-rolled to weeks and months, each sorted
+by period. A date range is answered by binary search: whole months (or weeks)
+inside the range come from the coarse table and only the partial periods at
+either end from the daily one, so a trend over years of history touches a few
+hundred cells, never the rows. New rows are folded in like the cube's: only
+the day, week and month cells they fall in are re-summed.
+
+On disk, write_partitions stores processed rows as Parquet partitioned by
+year/month of the shipment date, and read_range only opens the partitions a
+range overlaps.
+
+    python -m scripts.timeseries data/processed_data.parquet --out data/shipments [--from 2024-01-01] [--to 2024-03-31]
+"""
+import argparse
+import glob
+import os
+import threading
+import time
+
+import duckdb
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from scripts.cube import DASHBOARD_CUBE, additive_measures, finalize, group_metric
+from scripts.filters import Range
+from scripts.formats import read_frame
+from scripts.result_cache import ResultCache
+from scripts.store import quote
+
+DATE_COLUMN = 'shipment_date'
+GRAINS = ['day', 'week', 'month']
+
+
+def truncate(dates, grain):
+    """Start of the day / week (Monday) / month each date falls in, as datetime64[D]."""
+    days = np.asarray(dates).astype('datetime64[D]')
+    if grain == 'day':
+        return days
+    if grain == 'week':
+        # 1970-01-01 was a Thursday
+        return days - ((days.astype('int64') + 3) % 7).astype('timedelta64[D]')
+    if grain == 'month':
+        return days.astype('datetime64[M]').astype('datetime64[D]')
+    raise ValueError(f"Unknown grain '{grain}' (expected one of {GRAINS})")
+
+
+def next_period(start, grain):
+    """Start of the period after the one beginning at `start`."""
+    if grain == 'month':
+        return (start.astype('datetime64[M]') + 1).astype('datetime64[D]')
+    return start + np.timedelta64(7 if grain == 'week' else 1, 'D')
+
+
+class Rollups:
+    """Daily, weekly and monthly additive cells over the filter dimensions, for date-range lookups."""
+
+    def __init__(self, config=DASHBOARD_CUBE, date_column=DATE_COLUMN):
+        self.config = config
+        self.date_column = date_column
+        self.dims = list(config['dimensions'])
+        self.measures = additive_measures(config)
+        self.tables = {}  # grain -> cells sorted by period
+        self.periods = {}  # grain -> sorted datetime64[D] period starts of tables[grain]
+        self.totals = {}  # group metric dimension -> cells per value over every row, dated or not
+        self.results = ResultCache()
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        # Locks do not pickle; cached results are recomputed on demand
+        return dict(self.__dict__, lock=None, results=None)
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+        self.results = ResultCache()
+
+    @classmethod
+    def from_frame(cls, df, config=DASHBOARD_CUBE, date_column=DATE_COLUMN):
+        """Build the rollups from processed rows."""
+        rollups = cls(config, date_column)
+        rollups.apply(df)
+        return rollups
+
+    @classmethod
+    def from_query(cls, con, table, config=DASHBOARD_CUBE, date_column=DATE_COLUMN):
+        """Build the rollups from a table (or a query in parentheses) of processed rows on an open DuckDB connection."""
+        rollups = cls(config, date_column)
+        rollups._merge_totals(rollups._aggregate_totals(con, table))
+        rollups._merge(rollups._aggregate(con, table))
+        return rollups
+
+    def _aggregate(self, con, table):
+        measures = ', '.join(f'{sql} AS {quote(name)}' for name, sql in self.measures.items())
+        dims = ', '.join(quote(d) for d in self.dims)
+        cells = con.execute(
+            f"SELECT {quote(self.date_column)}::DATE AS period, {dims}, {measures} FROM {table} "
+            f"WHERE {quote(self.date_column)} IS NOT NULL GROUP BY ALL"
+        ).df()
+        for dim in self.dims:
+            cells[dim] = cells[dim].astype(object)
+        cells['period'] = cells['period'].to_numpy().astype('datetime64[D]')
+        return cells
+
+    def _aggregate_totals(self, con, table):
+        measures = ', '.join(f'{sql} AS {quote(name)}' for name, sql in self.measures.items())
+        totals = {}
+        for dim, _ in self.config['group_metrics'].values():
+            cells = con.execute(f"SELECT {quote(dim)}, {measures} FROM {table} GROUP BY ALL").df()
+            cells[dim] = cells[dim].astype(object)
+            totals[dim] = cells
+        return totals
+
+    def _roll(self, cells, grain):
+        cells = cells.assign(period=truncate(cells['period'], grain).astype('datetime64[ms]'))
+        cells = cells.groupby(['period'] + self.dims, sort=True, dropna=False)[list(self.measures)].sum()
+        return cells.reset_index()
+
+    def _splice(self, grain, delta):
+        # The delta's periods re-summed and put back in place: each is a run of the sorted table
+        # found by binary search, so the cells of every other period are only copied
+        table, periods = self.tables[grain], self.periods[grain]
+        starts = np.unique(truncate(delta['period'], grain))
+        if not len(starts):
+            return table
+        lo, hi = np.searchsorted(periods, starts, 'left'), np.searchsorted(periods, starts, 'right')
+        old = table.iloc[np.concatenate([np.arange(a, b) for a, b in zip(lo, hi)])]
+        cells = self._roll(pd.concat([old, delta], ignore_index=True), grain)
+        # Cells whose rows were all retracted
+        cells = cells[cells['n'] != 0]
+        cut = np.searchsorted(cells['period'].to_numpy().astype('datetime64[D]'), starts)
+        pieces, prev, first = [], 0, 0
+        for i in range(len(starts)):
+            if lo[i] > prev:
+                pieces += [cells.iloc[cut[first]:cut[i]], table.iloc[prev:lo[i]]]
+                first = i
+            prev = hi[i]
+        pieces += [cells.iloc[cut[first]:], table.iloc[prev:]]
+        return pd.concat([piece for piece in pieces if len(piece)] or [cells], ignore_index=True)
+
+    def _merge(self, delta):
+        tables = {}
+        for grain in GRAINS:
+            if grain in self.tables:
+                tables[grain] = self._splice(grain, delta)
+            else:
+                cells = self._roll(delta, grain)
+                tables[grain] = cells[cells['n'] != 0].reset_index(drop=True)
+        self.tables = tables
+        self.periods = {grain: table['period'].to_numpy().astype('datetime64[D]') for grain, table in tables.items()}
+        self.generation += 1
+
+    def _merge_totals(self, delta):
+        for dim, cells in delta.items():
+            if dim in self.totals:
+                cells = pd.concat([self.totals[dim], cells], ignore_index=True)
+                cells = cells.groupby(dim, sort=False, dropna=False)[list(self.measures)].sum().reset_index()
+            self.totals[dim] = cells[cells['n'] != 0].reset_index(drop=True)
+
+    def _delta(self, df, retract=False):
+        con = duckdb.connect()
+        try:
+            con.register('batch_df', pa.Table.from_pandas(df, preserve_index=False))
+            delta, totals = self._aggregate(con, 'batch_df'), self._aggregate_totals(con, 'batch_df')
+        finally:
+            con.close()
+        if retract:
+            for cells in [delta] + list(totals.values()):
+                cells[list(self.measures)] = -cells[list(self.measures)]
+        return delta, totals
+
+    def apply(self, df, retract=False):
+        """Fold a batch of processed rows in, or with retract=True take them back out."""
+        delta, totals = self._delta(df, retract)
+        with self.lock:
+            self._merge_totals(totals)
+            self._merge(delta)
+
+    def update(self, old, new):
+        """Take rows' old versions out and fold their new versions (and any new rows) in, in one merge."""
+        (removed, removed_totals), (added, added_totals) = self._delta(old, retract=True), self._delta(new)
+        with self.lock:
+            self._merge_totals(removed_totals)
+            self._merge_totals(added_totals)
+            self._merge(pd.concat([removed, added], ignore_index=True))
+
+    def _finalize(self, grouped, cells, grouping):
+        # Group metrics weigh each selected row's group value; the values come from every row
+        frame = finalize(grouped, self.config, grouping)
+        for name, (dim, metric) in self.config['group_metrics'].items():
+            frame[name] = group_metric(frame, cells, self.totals.get(dim), dim, metric, grouping)
+        return frame
+
+    def bounds(self):
+        """(first, last) shipment day as datetime.date, or None when there are no dated rows."""
+        days = self.periods.get('day')
+        if days is None or not len(days):
+            return None
+        return days[0].astype(object), days[-1].astype(object)
+
+    def _slice(self, grain, start, end):
+        # Binary search on the sorted periods: rows with start <= period < end
+        periods = self.periods[grain]
+        lo, hi = np.searchsorted(periods, [start, end])
+        return self.tables[grain].iloc[lo:hi]
+
+    def cells(self, start=None, end=None, grain='month'):
+        """Cells for the days start..end (inclusive), with periods truncated to `grain`.
+
+        Periods of `grain` lying wholly inside the range are read from its
+        pre-rolled table; only the partial periods at the ends come from days.
+        """
+        if self.bounds() is None:
+            return pd.DataFrame(columns=['period'] + self.dims + list(self.measures))
+        days = self.periods['day']
+        start = np.datetime64(start, 'D') if start is not None else days[0]
+        end = (np.datetime64(end, 'D') if end is not None else days[-1]) + 1  # exclusive
+        inner_start = truncate(start, grain)
+        if inner_start < start:
+            inner_start = next_period(inner_start, grain)
+        inner_end = truncate(end, grain)
+        if inner_start >= inner_end:
+            parts = [self._slice('day', start, end)]
+        else:
+            parts = [self._slice('day', start, inner_start), self._slice(grain, inner_start, inner_end),
+                     self._slice('day', inner_end, end)]
+        parts = [part for part in parts if len(part)]
+        if not parts:
+            return self.tables['day'].iloc[:0]
+        cells = pd.concat(parts, ignore_index=True)
+        if grain != 'day':
+            cells['period'] = truncate(cells['period'], grain).astype('datetime64[ms]')
+        return cells
+
+    def _select(self, filters, grain):
+        filters = dict(filters or {})
+        dates = filters.pop(self.date_column, None)
+        unknown = set(filters) - set(self.dims)
+        if unknown:
+            raise ValueError(f"Rollups have no dimension(s) {sorted(unknown)}")
+        start, end = dates if isinstance(dates, Range) else (None, None)
+        cells = self.cells(start, end, grain)
+        for dim, values in filters.items():
+            if values is not None:
+                values = values if isinstance(values, (list, tuple, set)) else [values]
+                cells = cells[cells[dim].isin(list(values))]
+        return cells
+
+    def trend(self, filters=None, grain='day'):
+        """All measures per `grain` period for a selection (filters may hold a Range on the date column)."""
+        if grain not in GRAINS:
+            raise ValueError(f"Unknown grain '{grain}' (expected one of {GRAINS})")
+
+        def compute():
+            cells = self._select(filters, grain)
+            grouped = cells.groupby('period', sort=True)[list(self.measures)].sum().reset_index()
+            return self._finalize(grouped, cells, ('period',)).rename(columns={'period': self.date_column})
+        return self.results.get_or_compute(self.generation, filters, f'trend:{grain}', compute)
+
+    def lookup(self, filters=None):
+        """Aggregates for a selection and date range, shaped like Cube.lookup()."""
+        def compute():
+            cells = self._select(filters, 'month')
+            measure_cols = list(self.measures)
+            frames = {}
+            for grouping in self.config['groupings']:
+                if grouping:
+                    grouped = cells.groupby(list(grouping), sort=True)[measure_cols].sum().reset_index()
+                else:
+                    grouped = cells[measure_cols].sum().to_frame().T
+                frames[grouping] = self._finalize(grouped, cells, grouping)
+            return frames
+        return self.results.get_or_compute(self.generation, filters, 'lookup', compute)
+
+
+def write_partitions(df, out_dir, date_column=DATE_COLUMN):
+    """Write rows as Parquet partitioned by year=/month= of date_column; returns the partition count."""
+    con = duckdb.connect()
+    try:
+        con.register('batch_df', pa.Table.from_pandas(df, preserve_index=False))
+        con.execute(
+            f"COPY (SELECT *, year({quote(date_column)}) AS year, month({quote(date_column)}) AS month "
+            f"FROM batch_df WHERE {quote(date_column)} IS NOT NULL) "
+            f"TO '{out_dir}' (FORMAT PARQUET, PARTITION_BY (year, month), OVERWRITE)"
+        )
+    finally:
+        con.close()
+    partitions = len(glob.glob(os.path.join(out_dir, 'year=*', 'month=*')))
+    print(f"Wrote {partitions} monthly partitions to {out_dir}")
+    return partitions
+
+
+def partitions_in_range(out_dir, start, end):
+    """The year=/month= directories of out_dir that overlap the days start..end."""
+    first = np.datetime64(start, 'M')
+    last = np.datetime64(end, 'M')
+    paths = []
+    for path in sorted(glob.glob(os.path.join(out_dir, 'year=*', 'month=*'))):
+        year = int(os.path.basename(os.path.dirname(path)).split('=')[1])
+        month = int(os.path.basename(path).split('=')[1])
+        if first <= np.datetime64(f'{year:04d}-{month:02d}', 'M') <= last:
+            paths.append(path)
+    return paths
+
+
+def read_range(out_dir, start, end, columns=None, date_column=DATE_COLUMN):
+    """Rows dated start..end (inclusive), reading only the overlapping partitions."""
+    paths = partitions_in_range(out_dir, start, end)
+    select = ', '.join(quote(c) for c in columns) if columns else '* EXCLUDE (year, month)'
+    if not paths:
+        return pd.DataFrame(columns=columns) if columns else pd.DataFrame()
+    files = [os.path.join(path, '*.parquet') for path in paths]
+    con = duckdb.connect()
+    try:
+        rows = con.execute(
+            f"SELECT {select} FROM read_parquet(?, hive_partitioning = true) "
+            f"WHERE {quote(date_column)} BETWEEN ? AND ?",
+            [files, pd.Timestamp(start), pd.Timestamp(end)]
+        ).to_arrow_table()
+    finally:
+        con.close()
+    return rows.to_pandas(date_as_object=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Partition processed shipments by month and time range queries')
+    parser.add_argument('input', nargs='?', default='data/processed_data.parquet')
+    parser.add_argument('--out', default='data/shipments', help='Directory of the year=/month= partitions')
+    parser.add_argument('--from', dest='start', help='First day of the range (default: first shipment)')
+    parser.add_argument('--to', dest='end', help='Last day of the range (default: last shipment)')
+    args = parser.parse_args()
+
+    df = read_frame(args.input)
+    if DATE_COLUMN not in df.columns:
+        raise ValueError(f"{args.input} has no '{DATE_COLUMN}' column")
+    write_partitions(df, args.out)
+
+    rollups = Rollups.from_frame(df)
+    first, last = rollups.bounds()
+    start, end = args.start or first, args.end or last
+    t = time.perf_counter()
+    rows = read_range(args.out, start, end)
+    print(f"Read {len(rows)} rows from {len(partitions_in_range(args.out, start, end))} partitions "
+          f"in {(time.perf_counter() - t) * 1000:.1f}ms")
+    for grain in GRAINS:
+        t = time.perf_counter()
+        trend = rollups.trend({DATE_COLUMN: Range(start, end)}, grain)
+        print(f"{grain:>5} trend: {len(trend)} points from {len(rollups.tables[grain])} pre-rolled cells "
+              f"in {(time.perf_counter() - t) * 1000:.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
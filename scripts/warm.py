@@ -0,0 +1,130 @@
+# scripts/warm.py
+"""Fast cold start for the dashboards: snapshots, deferred imports and a pre-warm entry point.
+
+A fresh dashboard process used to rebuild all of its in-memory state from the
+store before the first paint: app.py aggregates every row into its cube, and
+dashboard_app.py aggregates every processed row into its cube and rollups.
+Here that state (cube cells, running partials, watermarks) is pickled to disk
+instead.
+
+A snapshot is used only when it was taken from the current store build.
+Rows appended to the store since then are folded in by the usual incremental
+refresh. lazy_module() defers chart-library imports until a chart is actually
+built, which with the chart payload cache is only on a cache miss.
+
+Run before the server accepts traffic, e.g. as a container's start command:
+    python -m scripts.warm [--render app.py dashboard_app.py] [--serve app.py -- --server.port 8501]
+"""
+import argparse
+import importlib
+import os
+import pickle
+import sys
+import time
+
+from scripts.store import DB_PATH, ensure_store, store_info
+
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR', 'data/snapshot')
+SNAPSHOT_FORMAT = 3  # bump when the pickled classes change shape
+
+
+class LazyModule:
+    """Stand-in for a module that is imported on first attribute access."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+def lazy_module(name):
+    """The module if it is already imported, else a LazyModule for it."""
+    return sys.modules.get(name) or LazyModule(name)
+
+
+def snapshot_path(snapshot_dir, name, ext='.pkl'):
+    return os.path.join(snapshot_dir, name + ext)
+
+
+def save_state(path, built_at, state):
+    """Pickle state for the store build `built_at`; written to a temp file and renamed into place."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path + '.tmp', 'wb') as f:
+        pickle.dump({'format': SNAPSHOT_FORMAT, 'built_at': built_at, 'state': state}, f,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + '.tmp', path)
+
+
+def load_state(path, db_path):
+    """The pickled state if the snapshot exists and was taken from the store's current build, else None."""
+    if not os.path.exists(path):
+        return None
+    info = store_info(db_path)
+    try:
+        with open(path, 'rb') as f:
+            snapshot = pickle.load(f)
+    except Exception as e:
+        # A snapshot from an older version of the code: rebuild instead of failing the page
+        print(f"Ignoring snapshot {path}: {e}")
+        return None
+    if snapshot['format'] != SNAPSHOT_FORMAT or info is None or snapshot['built_at'] != info['built_at']:
+        return None
+    return snapshot['state']
+
+
+def prewarm(csv_path='data/supply_chain.csv', db_path=DB_PATH, snapshot_dir=SNAPSHOT_DIR, render=()):
+    """Bring the store and both dashboards' snapshots up to date; optionally render dashboards headlessly.
+
+    Rendering runs each script once with Streamlit's AppTest, which fills the
+    disk tiers of the result and chart caches (RESULT_CACHE_DIR,
+    CHART_CACHE_DIR) for the default view.
+    """
+    from scripts.cube import Cube
+    from scripts.ingest import LiveProcessed
+
+    start = time.perf_counter()
+    ensure_store(csv_path, db_path)
+    print(f"Store ready in {time.perf_counter() - start:.2f}s")
+
+    for name, load in [('app.py cube', Cube.from_store), ('dashboard_app.py cube', LiveProcessed.from_store)]:
+        start = time.perf_counter()
+        state = load(db_path, snapshot_dir=snapshot_dir)
+        state.save(snapshot_dir)
+        print(f"Snapshot of {name} saved in {time.perf_counter() - start:.2f}s")
+
+    for script in render:
+        from streamlit.testing.v1 import AppTest
+
+        start = time.perf_counter()
+        at = AppTest.from_file(os.path.abspath(script), default_timeout=600).run()
+        errors = [e.value for e in at.exception]
+        if errors:
+            raise ValueError(f"{script} failed while pre-warming: {errors}")
+        print(f"Rendered {script} in {time.perf_counter() - start:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pre-warm the dashboards before the server accepts traffic')
+    parser.add_argument('--csv', default='data/supply_chain.csv')
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--snapshot-dir', default=SNAPSHOT_DIR)
+    parser.add_argument('--render', nargs='+', default=[], metavar='SCRIPT',
+                        help='Dashboards to render once, filling the on-disk result and chart caches')
+    parser.add_argument('--serve', metavar='SCRIPT', help='Then replace this process with `streamlit run SCRIPT`')
+    parser.add_argument('streamlit_args', nargs=argparse.REMAINDER, help='Passed to streamlit run after --')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    prewarm(args.csv, args.db, args.snapshot_dir, args.render)
+    print(f"Pre-warmed in {time.perf_counter() - start:.2f}s")
+    if args.serve:
+        extra = [a for a in args.streamlit_args if a != '--']
+        os.execvp(sys.executable, [sys.executable, '-m', 'streamlit', 'run', args.serve, *extra])
+
+
+if __name__ == '__main__':
+    main()
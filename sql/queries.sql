@@ -1,37 +1,68 @@
 -- queries.sql
+-- Generated from LISTINGS and REPORTS in scripts/metrics.py, regenerate with
+--     python -m scripts.metrics --queries > sql/queries.sql
+-- Days of Inventory Remaining is AVG(stock_levels) / AVG(number_of_products_sold)
+-- per SKU, in sales periods: one row per SKU. The earlier hand-written query
+-- returned stock_levels / AVG(number_of_products_sold) per (sku, stock_levels).
+-- On-time delivery rate is a fraction between 0 and 1.
 
--- Inventory Management
-SELECT product_type, sku, stock_levels, availability
+-- Inventory Management (stock per SKU)
+SELECT
+    product_type,
+    sku,
+    stock_levels,
+    availability
 FROM supply_chain;
 
-SELECT product_type, SUM(stock_levels) AS total_stock
+-- Inventory Management (stock by product type)
+SELECT
+    product_type,
+    COALESCE(SUM(stock_levels), 0) AS total_stock
 FROM supply_chain
-GROUP BY product_type;
+GROUP BY product_type
+ORDER BY product_type;
 
--- Days of Inventory Remaining (needs avg daily sales, approximated here)
-SELECT sku, stock_levels / NULLIF(AVG(number_of_products_sold), 0) AS days_inventory_remaining
+-- Days Of Inventory Remaining
+SELECT
+    sku,
+    CAST(CAST(COALESCE(SUM(stock_levels), 0) AS REAL) / NULLIF(COUNT(stock_levels), 0) AS REAL) / NULLIF(CAST(COALESCE(SUM(number_of_products_sold), 0) AS REAL) / NULLIF(COUNT(number_of_products_sold), 0), 0) AS days_inventory_remaining
 FROM supply_chain
-GROUP BY sku, stock_levels;
+GROUP BY sku
+ORDER BY sku;
 
 -- Order Fulfillment
-SELECT COUNT(sku) AS total_orders,
-       SUM(CASE WHEN shipping_times <= lead_times THEN 1 ELSE 0 END) AS on_time_orders,
-       SUM(CASE WHEN shipping_times <= lead_times THEN 1 ELSE 0 END) / COUNT(sku) * 100 AS on_time_delivery_rate
+SELECT
+    COUNT(*) AS total_orders,
+    COALESCE(SUM(CASE WHEN shipping_times <= lead_times THEN 1 ELSE 0 END), 0) AS on_time_orders,
+    CAST(COALESCE(SUM(CASE WHEN shipping_times <= lead_times THEN 1 ELSE 0 END), 0) AS REAL) / NULLIF(COUNT(*), 0) AS on_time_delivery_rate
 FROM supply_chain;
 
 -- Supplier Performance
-SELECT supplier_name, AVG(lead_time) AS avg_delivery_time, AVG(defect_rates) AS avg_defect_rate
+SELECT
+    supplier_name,
+    CAST(COALESCE(SUM(lead_time), 0) AS REAL) / NULLIF(COUNT(lead_time), 0) AS avg_delivery_time,
+    CAST(COALESCE(SUM(defect_rates), 0) AS REAL) / NULLIF(COUNT(defect_rates), 0) AS avg_defect_rate
 FROM supply_chain
-GROUP BY supplier_name;
+GROUP BY supplier_name
+ORDER BY supplier_name;
 
 -- Transportation Efficiency
-SELECT shipping_carriers, AVG(shipping_times) AS avg_transit_time
+SELECT
+    shipping_carriers,
+    CAST(COALESCE(SUM(shipping_times), 0) AS REAL) / NULLIF(COUNT(shipping_times), 0) AS avg_transit_time
 FROM supply_chain
-GROUP BY shipping_carriers;
+GROUP BY shipping_carriers
+ORDER BY shipping_carriers;
 
--- Supply Chain Costs
-SELECT transportation_modes, SUM(costs) AS total_cost
+-- Supply Chain Costs (by transportation mode)
+SELECT
+    transportation_modes,
+    COALESCE(SUM(costs), 0) AS total_cost
 FROM supply_chain
-GROUP BY transportation_modes;
+GROUP BY transportation_modes
+ORDER BY transportation_modes;
 
-SELECT SUM(costs) AS overall_costs FROM supply_chain;
+-- Supply Chain Costs (overall)
+SELECT
+    COALESCE(SUM(costs), 0) AS overall_costs
+FROM supply_chain;